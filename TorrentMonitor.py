@@ -2,6 +2,7 @@
 
 import libtorrent as lt
 import geoip2.database
+import geoip2.errors
 from datetime import datetime, timezone
 import argparse
 import time
@@ -10,65 +11,2832 @@ import os
 import subprocess
 import json
 import logging
+import logging.handlers
 import random
+import operator
+import re
+import base64
+import queue
+import sys
+import struct
+import zlib
+import bisect
+import collections
+import ipaddress
+import socket
+import threading
+import types
+import glob
+import multiprocessing
+import signal
 from colorama import Fore, Style, init
 import requests
 import pymysql
 import shutil
-from telethon.sync import TelegramClient
 import telethon
 from libtorrent import ip_filter
 import getpass 
-from telethon.errors import SessionPasswordNeededError
+from datetime import timedelta
+import functools
+import itertools
+import asyncio
+import concurrent.futures
+import hashlib
+import math
+import uuid
+import inspect
+import gzip
+
+# Optional: columnar export (pip install pyarrow)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
 
 # Obfuscated sensitive data
 api_id = 12345678  # Replace with your actual Telegram API ID
 api_hash = "your_api_hash_here"  # Replace with your actual Telegram API hash
 phone = "+1234567890"  # Replace with your actual phone number
-recipient = 1234567890  # Replace with the actual recipient ID
+channel_id = -1001234567890  # Replace with your actual channel ID
+
+def notification_message(record, rules=None):
+    """
+    Build the Telegram message announcing a peer.
+    """
+    message = f"✔️ A connected peer has been detected from <code>{record.country}</code>:\n"
+    message += f"IP: <code>{record.ip}</code>\n"
+    message += f"Port: <code>{record.port}</code>\n"
+    message += f"ISP: <code>{record.isp}</code>\n"
+    message += f"City: <code>{record.city}</code>\n"
+    message += f"Region: <code>{record.province}</code>\n"
+    message += f"Client: <code>{record.client}</code>\n"
+    message += f"Torrent: <code>{record.name}</code>\n"
+    message += f"Infohash: <code>{record.infohash}</code>\n"
+    message += f"First seen: <code>{record.first_seen}</code>\n"
+    if rules:
+        message += f"Rules: <code>{', '.join(rules)}</code>\n"
+    message += f"🔚\n"
+    return message
+
+async def _resolve(value):
+    # Telethon methods return coroutines; synchronous clients (test stubs) return values
+    return await value if inspect.isawaitable(value) else value
+
+class TelegramNotifier:
+    """
+    Telegram client living on a dedicated thread that owns its event loop. start() creates,
+    connects and (on first use, prompting for the code) signs in the client on that loop,
+    and every message is sent there, so send() can be called from any thread and raises
+    when Telegram did not accept the message.
+    """
+    def __init__(self, api_id, api_hash, phone, channel_id, session='session.session', timeout=60, logger=None):
+        self.api_id = api_id
+        self.api_hash = api_hash
+        self.phone = phone
+        self.channel_id = channel_id
+        self.session = session
+        self.timeout = timeout
+        self.logger = logger or logging.getLogger('TorrentTracker')
+        self.client = None
+        self._entity = None
+        self._loop = None
+        self._thread = None
+
+    def _call(self, coroutine, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(timeout)
+
+    async def _connect(self):
+        self.client = telethon.TelegramClient(self.session, self.api_id, self.api_hash)
+        await _resolve(self.client.connect())
+        if not await _resolve(self.client.is_user_authorized()):
+            await _resolve(self.client.send_code_request(self.phone))
+            try:
+                await _resolve(self.client.sign_in(self.phone, input('Enter the code: ')))
+            except telethon.errors.SessionPasswordNeededError:
+                password = getpass.getpass("Password: ")
+                await _resolve(self.client.sign_in(password=password))
+        self._entity = await _resolve(self.client.get_entity(self.channel_id))
+
+    async def _send(self, message):
+        await _resolve(self.client.send_message(self._entity, message, parse_mode='html'))
+
+    def start(self):
+        """
+        Start the notifier thread and connect. Raises if Telegram cannot be reached.
+        """
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='Telegram', daemon=True)
+        self._thread.start()
+        try:
+            # No timeout: signing in may wait for the code typed by the user
+            self._call(self._connect())
+        except Exception:
+            self.stop()
+            raise
+
+    def send(self, record, rules=None):
+        """
+        Send the alert for record and wait until Telegram accepted it.
+        """
+        self._call(self._send(notification_message(record, rules)), self.timeout)
+
+    def stop(self):
+        if self._loop is None:
+            return
+        if self.client is not None and hasattr(self.client, 'disconnect'):
+            try:
+                self._call(_resolve(self.client.disconnect()), self.timeout)
+            except Exception as e:
+                self.logger.debug("Telegram disconnect failed: %s", e)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(self.timeout)
+        self._loop.close()
+        self._loop = None
+
+# Column order shared by the CSV writer, the report_table INSERT and the notifier
+PEER_FIELDS = ('ip', 'port', 'isp', 'client', 'countryISO', 'country', 'city', 'region', 'province',
+               'first_seen', 'last_seen', 'torrent', 'name', 'infohash', 'total_size',
+               'num_pieces', 'piece_size',
+               'downloaded_pieces',
+               'download_speed',
+               'upload_speed',
+               'num_seeds',
+               'num_peers',
+               'estimated_time',
+               'state',
+               'geo_db',
+               'completed_at')
+
+INSERT_PEER_SQL = "INSERT INTO report_table ({}) VALUES ({})".format(
+    ', '.join(PEER_FIELDS), ', '.join(['%s'] * len(PEER_FIELDS)))
+
+class PeerRecord:
+    """
+    Compact record of a single peer observation.
+    Fields are stored in slots following PEER_FIELDS, so a row is built once and
+    read back in column order by every writer.
+    """
+    __slots__ = PEER_FIELDS
+
+    _row = operator.attrgetter(*PEER_FIELDS)
+
+    def __init__(self, *values):
+        for name, value in zip(PEER_FIELDS, values):
+            setattr(self, name, value)
+
+    def as_row(self):
+        """
+        Return the record as a tuple in PEER_FIELDS order.
+        """
+        return self._row(self)
+
+    def __repr__(self):
+        return f"PeerRecord({self.ip!r}, {self.port!r}, {self.infohash!r}, {self.state!r})"
+
+# Endpoints queried (in order) to learn our public addresses; api64 answers over IPv6 when available
+DEFAULT_IP_ENDPOINTS = ['https://ifconfig.me/ip', 'https://api.ipify.org', 'https://api64.ipify.org', 
+                        'https://icanhazip.com']
+
+INSERT_TORRENT_SQL = "INSERT IGNORE INTO info_torrent (torrent_infohash, details) VALUES (%s, %s)"
+
+INSERT_SWARM_SQL = ("INSERT INTO swarm_table (ip, port, infohash, source, first_seen, last_seen) "
+                    "VALUES (%s, %s, %s, %s, %s, %s) "
+                    "ON DUPLICATE KEY UPDATE last_seen = VALUES(last_seen), source = VALUES(source)")
+
+# Rollups kept next to report_table: one row per peer per day, whatever the poll rate
+INSERT_DAILY_PEER_SQL = ("INSERT IGNORE INTO daily_peer_table (day, infohash, ip, port, country, asn, isp, client) "
+                         "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)")
+INSERT_DAILY_COMPLETION_SQL = ("INSERT IGNORE INTO daily_completion_table (day, infohash, ip, port, country) "
+                               "VALUES (%s, %s, %s, %s, %s)")
+
+# SQL used to drain each kind of spooled row
+SPOOL_SQL = {'report_table': INSERT_PEER_SQL, 'info_torrent': INSERT_TORRENT_SQL, 'swarm_table': INSERT_SWARM_SQL,
+             'daily_peer': INSERT_DAILY_PEER_SQL, 'daily_completion': INSERT_DAILY_COMPLETION_SQL}
+
+# Spool record header: payload length and CRC32 of the payload
+SPOOL_HEADER = struct.Struct('>II')
+# Errors caused by the rows themselves: retrying cannot help, so the rows are quarantined.
+# Anything else (OperationalError, InterfaceError, OSError...) means the database is away.
+SPOOL_DATA_ERRORS = (pymysql.err.DataError, pymysql.err.IntegrityError, pymysql.err.ProgrammingError,
+                     pymysql.err.NotSupportedError, KeyError, TypeError, ValueError)
+
+class PeerSpool:
+    """
+    Write-ahead spool between the peer loop and MariaDB.
+    Rows are appended to length-prefixed segment files and drained to the database by a
+    background thread that reconnects with exponential backoff. A segment is deleted only
+    after its rows are committed, so segments left behind by an outage or a crash are
+    replayed on the next start. Rows the database rejects are moved to quarantine.jsonl
+    in the spool folder instead of blocking the segments behind them.
+    """
+    def __init__(self, directory, connect, logger=None, segment_bytes=8 * 1024 * 1024, drain_interval=2,
+                 batch_size=1000, max_backoff=60):
+        self.directory = directory
+        self.connect = connect
+        self.logger = logger or logging.getLogger('TorrentTracker')
+        self.segment_bytes = segment_bytes
+        self.drain_interval = drain_interval
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn = None
+        self._file = None
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+        pending = self.segments()
+        if pending:
+            self.logger.info(f"Replaying {len(pending)} unflushed spool segments from {directory}")
+        self._sequence = int(os.path.basename(pending[-1])[8:-4]) if pending else 0
+        self._open_segment()
+
+    def segments(self):
+        """
+        Segment files on disk, oldest first.
+        """
+        names = [name for name in os.listdir(self.directory) if name.startswith('segment-') and name.endswith('.log')]
+        return [os.path.join(self.directory, name) for name in sorted(names)]
+
+    def pending(self):
+        """
+        Number of sealed segments waiting to be written.
+        """
+        return sum(1 for path in self.segments() if path != self._path)
+
+    def _open_segment(self):
+        self._sequence += 1
+        self._path = os.path.join(self.directory, f"segment-{self._sequence:012d}.log")
+        self._file = open(self._path, 'ab')
+        self._size = 0
+
+    def _seal(self):
+        # Called with the lock held: close the active segment so the drainer may consume it
+        if not self._size:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._open_segment()
+
+    def append(self, table, params):
+        """
+        Append one row destined for table (a key of SPOOL_SQL).
+        """
+        payload = json.dumps([table, list(params)], default=str).encode('utf-8')
+        with self._lock:
+            self._file.write(SPOOL_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._size += SPOOL_HEADER.size + len(payload)
+            if self._size >= self.segment_bytes:
+                self._seal()
+
+    def flush(self):
+        """
+        Push buffered rows to the OS, so they survive a crash of the process.
+        """
+        with self._lock:
+            self._file.flush()
+
+    @staticmethod
+    def read_segment(path):
+        """
+        Yield (table, params) records from a segment, stopping at a torn or corrupt tail.
+        """
+        with open(path, 'rb') as f:
+            while True:
+                header = f.read(SPOOL_HEADER.size)
+                if len(header) < SPOOL_HEADER.size:
+                    return
+                length, checksum = SPOOL_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    return
+                table, params = json.loads(payload)
+                yield table, params
+
+    def records(self, path):
+        """
+        Yield the (table, params) records of a segment, padded to the current columns.
+        """
+        for table, params in self.read_segment(path):
+            if table == 'report_table' and len(params) < len(PEER_FIELDS):
+                # Row spooled before the latest report columns were added
+                params = list(params) + [None] * (len(PEER_FIELDS) - len(params))
+            yield table, params
+
+    def _write_batches(self, cur, path):
+        batches = {}
+        for table, params in self.records(path):
+            batch = batches.setdefault(table, [])
+            batch.append(params)
+            if len(batch) >= self.batch_size:
+                cur.executemany(SPOOL_SQL[table], batch)
+                batch.clear()
+        for table, batch in batches.items():
+            if batch:
+                cur.executemany(SPOOL_SQL[table], batch)
+
+    def _write_rows(self, cur, path):
+        # Slow path for a segment the database rejected: find the rows at fault one by one
+        rejected = []
+        for table, params in self.records(path):
+            try:
+                cur.execute(SPOOL_SQL[table], params)
+            except SPOOL_DATA_ERRORS as e:
+                rejected.append({'table': table, 'params': params, 'error': repr(e)})
+        return rejected
+
+    def quarantine(self, path, rejected):
+        """
+        Append rejected rows to quarantine.jsonl, one JSON object per row.
+        """
+        with open(os.path.join(self.directory, 'quarantine.jsonl'), 'a') as f:
+            for row in rejected:
+                f.write(json.dumps(dict(row, segment=os.path.basename(path)), default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        for row in rejected:
+            self.logger.error(f"Spool row for {row['table']} rejected by the database, quarantined: {row['error']}")
+
+    def _drain_segment(self, path):
+        if self._conn is None:
+            self._conn = self.connect()
+        rejected = []
+        try:
+            with self._conn.cursor() as cur:
+                self._write_batches(cur, path)
+        except SPOOL_DATA_ERRORS as e:
+            self.logger.warning(f"Spool segment {os.path.basename(path)} rejected ({e}), writing it row by row")
+            self._conn.rollback()
+            with self._conn.cursor() as cur:
+                rejected = self._write_rows(cur, path)
+        self._conn.commit()
+        # Quarantined only once the good rows are committed: a crash in between replays the
+        # segment and may quarantine a row twice, but never loses one
+        if rejected:
+            self.quarantine(path, rejected)
+        os.remove(path)
+
+    def drain(self):
+        """
+        Write every sealed segment to the database. Raises on database errors.
+        """
+        with self._lock:
+            self._seal()
+            sealed = [path for path in self.segments() if path != self._path]
+        for path in sealed:
+            self._drain_segment(path)
+
+    def _disconnect(self):
+        try:
+            if self._conn is not None:
+                self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                self.drain()
+                backoff = 1
+                self._stop.wait(self.drain_interval)
+            except Exception as e:
+                self._disconnect()
+                self.logger.error(f"Database unavailable, keeping rows in spool ({self.pending()} segments). Retrying in {backoff}s: {e}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='PeerSpool', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """
+        Stop the drainer after a last attempt to flush every segment.
+        """
+        self._stop.set()
+        busy = False
+        if self._thread is not None:
+            self._thread.join(timeout)
+            busy = self._thread.is_alive()
+        try:
+            if busy:
+                # The drainer is still writing a segment: draining it here too would insert its rows twice
+                self.logger.warning(f"Spool drainer still busy after {timeout}s, "
+                                    f"{self.pending()} segments will be replayed on restart")
+            else:
+                self.drain()
+        except Exception as e:
+            self.logger.warning(f"Spool not fully drained, {self.pending()} segments will be replayed on restart: {e}")
+        finally:
+            with self._lock:
+                self._file.close()
+                if not self._size:
+                    os.remove(self._path)
+            # The connection belongs to the drainer while it runs
+            if not busy:
+                self._disconnect()
+
+# Retention rollup: one row per peer session (ip, port, torrent) per day, merged across batches
+DAILY_SESSION_FIELDS = ('day', 'infohash', 'ip', 'port', 'client', 'country', 'isp', 'first_seen', 'last_seen',
+                        'observations', 'num_pieces', 'max_downloaded_pieces', 'state', 'completed_at')
+# state is assigned before last_seen, which it compares against (MariaDB applies updates in order)
+INSERT_DAILY_SESSION_SQL = ("INSERT INTO daily_session_table ({}) VALUES ({}) ON DUPLICATE KEY UPDATE "
+                            "state = IF(VALUES(last_seen) >= last_seen, VALUES(state), state), "
+                            "first_seen = LEAST(first_seen, VALUES(first_seen)), "
+                            "last_seen = GREATEST(last_seen, VALUES(last_seen)), "
+                            "observations = observations + VALUES(observations), "
+                            "max_downloaded_pieces = GREATEST(max_downloaded_pieces, VALUES(max_downloaded_pieces)), "
+                            "completed_at = COALESCE(LEAST(completed_at, VALUES(completed_at)), completed_at, "
+                            "VALUES(completed_at))").format(
+    ', '.join(DAILY_SESSION_FIELDS), ', '.join(['%s'] * len(DAILY_SESSION_FIELDS)))
+
+# One-off migration behind "report migrate": retention deletes rows by id exactly as it archived
+# them and finds expired rows through the last_seen index. The ALTER rebuilds report_table, so it
+# is run by hand with the tracker stopped, never by the retention job
+MIGRATE_RETENTION_SQL = ("ALTER TABLE report_table "
+                         "ADD COLUMN IF NOT EXISTS id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY FIRST, "
+                         "ADD INDEX IF NOT EXISTS last_seen_idx (last_seen)")
+
+class RetentionJob:
+    """
+    Background retention for report_table. Raw rows whose last_seen is more than raw_days
+    old are taken in small batches, oldest first. Each batch is archived to gzip CSV under
+    archive_dir/date=YYYY-MM-DD/, folded into daily_session_table, then deleted.
+    A batch is one short READ COMMITTED transaction that locks only the rows it deletes.
+    Batches are spaced by pause seconds, so the live writer keeps going. Archives are
+    written before the delete commits: a failure may archive a row twice but never loses it.
+    report_table needs the id key and last_seen index of MIGRATE_RETENTION_SQL; the job
+    only checks for them and never alters the table.
+    """
+    def __init__(self, connect, raw_days, archive_dir=None, batch_rows=1000, pause=0.2, idle_interval=600,
+                 max_backoff=600, logger=None):
+        self.connect = connect
+        self.raw_days = raw_days
+        self.archive_dir = archive_dir
+        self.batch_rows = batch_rows
+        self.pause = pause
+        self.idle_interval = idle_interval
+        self.max_backoff = max_backoff
+        self.logger = logger or logging.getLogger('TorrentTracker')
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn = None
+
+    def _prepare(self):
+        conn = self.connect()
+        try:
+            with conn.cursor() as cur:
+                # Metadata reads only: no lock on report_table
+                cur.execute("SHOW COLUMNS FROM report_table LIKE 'id'")
+                has_id = bool(cur.fetchall())
+                cur.execute("SHOW INDEX FROM report_table WHERE Key_name = 'last_seen_idx'")
+                has_index = bool(cur.fetchall())
+                if not (has_id and has_index):
+                    raise RuntimeError("report_table has no id key or last_seen index yet: stop the tracker "
+                                       "and run 'TorrentMonitor.py report migrate' once")
+                cur.execute("SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED")
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        self._conn = conn
+
+    def cutoff(self, now=None):
+        """
+        First day kept raw: rows last seen before it are expired.
+        """
+        now = now or datetime.now(timezone.utc)
+        return (now - timedelta(days=self.raw_days)).strftime('%Y-%m-%d')
+
+    @staticmethod
+    def downsample(rows):
+        """
+        Fold report_table rows into DAILY_SESSION_FIELDS tuples, one per (day, infohash, ip, port).
+        """
+        sessions = {}
+        for row in sorted(rows, key=lambda row: str(row['last_seen'])):
+            key = (str(row['last_seen'])[:10], row['infohash'], row['ip'], row['port'])
+            session = sessions.get(key)
+            if session is None:
+                sessions[key] = session = dict(zip(DAILY_SESSION_FIELDS, key), first_seen=row['first_seen'],
+                                               observations=0, max_downloaded_pieces=None, completed_at=None)
+            # Rows are in last_seen order: the latest one gives the session's closing state
+            session.update(client=row['client'], country=row['country'], isp=row['isp'], last_seen=row['last_seen'],
+                           num_pieces=row['num_pieces'], state=row['state'])
+            session['observations'] += 1
+            if row['first_seen'] and (not session['first_seen'] or str(row['first_seen']) < str(session['first_seen'])):
+                session['first_seen'] = row['first_seen']
+            pieces = to_int(row['downloaded_pieces'])
+            if pieces is not None and (session['max_downloaded_pieces'] is None or pieces > session['max_downloaded_pieces']):
+                session['max_downloaded_pieces'] = pieces
+            if row['completed_at'] and (not session['completed_at'] or str(row['completed_at']) < str(session['completed_at'])):
+                session['completed_at'] = row['completed_at']
+        return [tuple(session[name] for name in DAILY_SESSION_FIELDS) for session in sessions.values()]
+
+    def archive(self, rows):
+        """
+        Write expired rows as gzip CSV, one file per day and batch, named after its first id.
+        """
+        days = {}
+        for row in rows:
+            days.setdefault(str(row['last_seen'])[:10], []).append(row)
+        for day, part in days.items():
+            directory = os.path.join(self.archive_dir, f"date={day}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"part-{part[0]['id']:015d}.csv.gz")
+            tmp_path = path + '.tmp'
+            with gzip.open(tmp_path, 'wt', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(PEER_FIELDS)
+                writer.writerows([row[name] for name in PEER_FIELDS] for row in part)
+            with open(tmp_path, 'rb') as f:
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+
+    def run_batch(self, cutoff):
+        """
+        Archive, roll up and delete one batch of rows last seen before cutoff.
+        Returns the number of rows removed from report_table.
+        """
+        if self._conn is None:
+            self._prepare()
+        with self._conn.cursor() as cur:
+            # Consistent read: takes no locks
+            cur.execute(f"SELECT id, {', '.join(PEER_FIELDS)} FROM report_table WHERE last_seen < %s "
+                        "ORDER BY last_seen, id LIMIT %s", (cutoff, self.batch_rows))
+            rows = cur.fetchall()
+            if not rows:
+                self._conn.rollback()
+                return 0
+            if self.archive_dir:
+                self.archive(rows)
+            cur.executemany(INSERT_DAILY_SESSION_SQL, self.downsample(rows))
+            cur.execute(f"DELETE FROM report_table WHERE id IN ({', '.join(['%s'] * len(rows))})",
+                        [row['id'] for row in rows])
+        self._conn.commit()
+        return len(rows)
+
+    def run_once(self):
+        """
+        Process expired rows batch by batch until none are left or stop() is called.
+        Returns the number of rows removed.
+        """
+        cutoff = self.cutoff()
+        total = 0
+        while not self._stop.is_set():
+            count = self.run_batch(cutoff)
+            total += count
+            if count < self.batch_rows:
+                break
+            self._stop.wait(self.pause)
+        if total:
+            self.logger.info(f"Retention: moved {total} report_table rows last seen before {cutoff} to "
+                             f"daily_session_table" + (f" and {self.archive_dir}" if self.archive_dir else ""))
+        return total
+
+    def _disconnect(self):
+        try:
+            if self._conn is not None:
+                self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+                backoff = 1
+                self._stop.wait(self.idle_interval)
+            except Exception as e:
+                self._disconnect()
+                self.logger.error(f"Retention job failed, retrying in {backoff}s: {e}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='Retention', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """
+        Stop after the current batch; its transaction either committed or is rolled back.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._disconnect()
+
+def parse_endpoint(address):
+    """
+    Parse 'host:port', ':port' or 'unix:/path/to.sock' into (host, port) or ('unix', path).
+    """
+    if address.startswith('unix:'):
+        return 'unix', address[5:]
+    host, _, port = address.rpartition(':')
+    return host.strip('[]') or '127.0.0.1', int(port)
+
+# Rows a collector node may pass through to the aggregator's spool; peers go through dedupe instead
+NODE_TABLES = ('info_torrent', 'swarm_table')
+# Largest compressed frame the aggregator reads from a node; a bigger length header means a
+# corrupt or hostile stream and the connection is dropped instead of buffering it
+MAX_NODE_FRAME = 64 * 1024 * 1024
+
+class AggregatorLink:
+    """
+    Collector node side of the aggregator mode. Takes the place of the PeerSpool: peer
+    observations and passthrough rows are batched into zlib-compressed JSON frames, with
+    the spool's length/CRC header, and streamed to the aggregator, which owns storage and
+    notifications. Frames wait in a bounded queue (oldest dropped) while it is unreachable.
+    """
+    def __init__(self, address, node, max_frames=1000, timeout=5, max_backoff=60, logger=None):
+        self.address = parse_endpoint(address)
+        self.node = node
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.logger = logger or logging.getLogger('TorrentTracker')
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._peers = []
+        self._tables = []
+        self._frames = collections.deque(maxlen=max_frames)
+        self._sock = None
+        self._retry_at = 0
+        self._backoff = 1
+
+    def append(self, table, params):
+        """
+        Queue a passthrough row (one of NODE_TABLES), like PeerSpool.append.
+        """
+        with self._lock:
+            self._tables.append([table, list(params)])
+
+    def send(self, observations):
+        """
+        Queue peer observations as report rows followed by their ASN.
+        """
+        with self._lock:
+            self._peers.extend([*observation.record.as_row(), observation.asn] for observation in observations)
+
+    def _connect(self):
+        if self.address[0] == 'unix':
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.address[1])
+            return sock
+        return socket.create_connection(self.address, timeout=self.timeout)
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+
+    def flush(self):
+        """
+        Seal queued rows into a frame and send every waiting frame.
+        """
+        with self._lock:
+            if self._peers or self._tables:
+                payload = zlib.compress(json.dumps({'node': self.node, 'peers': self._peers, 'tables': self._tables},
+                                                   separators=(',', ':'), default=str).encode('utf-8'))
+                if len(payload) > MAX_NODE_FRAME:
+                    # The aggregator would refuse it on every retry
+                    self.dropped += 1
+                    self.logger.error(f"Dropped a {len(payload)} byte frame over the {MAX_NODE_FRAME} byte limit")
+                else:
+                    if len(self._frames) == self._frames.maxlen:
+                        self.dropped += 1
+                        self.logger.warning(f"Aggregator frame queue full, dropped {self.dropped} frames so far")
+                    self._frames.append(SPOOL_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+                self._peers, self._tables = [], []
+        with self._send_lock:
+            if not self._frames or time.time() < self._retry_at:
+                return
+            try:
+                if self._sock is None:
+                    self._sock = self._connect()
+                    self.logger.info(f"Connected to aggregator {self.address[0]}:{self.address[1]}")
+                while self._frames:
+                    # A frame cut by a failure is discarded by the aggregator and sent again whole
+                    self._sock.sendall(self._frames[0])
+                    self._frames.popleft()
+                self._backoff = 1
+            except OSError as e:
+                self._close()
+                self.logger.error(f"Aggregator unreachable, {len(self._frames)} frames waiting. Retrying in {self._backoff}s: {e}")
+                self._retry_at = time.time() + self._backoff
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        self._retry_at = 0
+        self.flush()
+        if self._frames:
+            self.logger.warning(f"{len(self._frames)} frames were not delivered to the aggregator")
+        self._close()
+
+# peer_info.pieces as an int bitset (bit i = piece i): bools -> ASCII '0'/'1' -> int, all in C
+PIECE_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count
+else:
+    def popcount(bits):
+        return bin(bits).count('1')
+
+def pack_pieces(pieces):
+    """
+    Pack a peer_info.pieces list of booleans into an int bitset; ints are returned as is.
+    """
+    if isinstance(pieces, int):
+        return pieces
+    if not pieces:
+        return 0
+    return int(bytes(pieces).translate(PIECE_DIGITS)[::-1], 2)
+
+class PeerPieces:
+    """
+    Pieces held by one peer, with the counters behind its progress and rate estimates.
+    The rate baseline (first_time, first_count) starts with the first bitfield holding a
+    piece: until then the peer's pieces are unknown, not zero.
+    """
+    __slots__ = ('bits', 'count', 'first_time', 'first_count', 'changed', 'completed_at', 'incomplete')
+
+    def __init__(self, bits, now):
+        self.bits = bits
+        self.count = popcount(bits)
+        self.first_time = now if self.count else None
+        self.first_count = self.count
+        self.changed = now
+        self.completed_at = None
+        # Seen with some but not all pieces: only such a peer can be seen completing
+        self.incomplete = False
+
+class PieceTracker:
+    """
+    Piece bitfields of the connected peers of one torrent.
+    A bitfield is only unpacked when libtorrent's piece count for the peer changed, and the
+    count advances by the popcount of the newly set bits, so idle peers cost one comparison.
+    A peer that gained no piece for stall seconds is 'stopped'.
+    """
+    def __init__(self, num_pieces, stall=600):
+        self.num_pieces = num_pieces
+        self.stall = stall
+        self.peers = {}
+
+    def update(self, key, peer_info, now):
+        """
+        Refresh one peer from its peer_info and return its PeerPieces.
+        """
+        entry = self.peers.get(key)
+        count = getattr(peer_info, 'num_pieces', None)
+        if entry is None:
+            entry = self.peers[key] = PeerPieces(pack_pieces(peer_info.pieces), now)
+        elif count is None or count != entry.count:
+            bits = pack_pieces(peer_info.pieces)
+            if entry.bits & ~bits:
+                # Pieces lost (e.g. a reconnect with a fresh bitfield): recount and restart the rate
+                entry.__init__(bits, now)
+            else:
+                gained = popcount(bits & ~entry.bits)
+                if gained:
+                    entry.bits = bits
+                    entry.count += gained
+                    entry.changed = now
+                    if entry.first_time is None:
+                        # Late bitfield: what it holds was not downloaded since we connected
+                        entry.first_time = now
+                        entry.first_count = entry.count
+        if 0 < entry.count < self.num_pieces:
+            entry.incomplete = True
+        elif entry.completed_at is None and entry.count >= self.num_pieces and entry.incomplete:
+            entry.completed_at = now
+        return entry
+
+    def state(self, entry, now):
+        if entry.count >= self.num_pieces:
+            return 'completed'
+        if now - entry.changed >= self.stall:
+            return 'stopped'
+        return 'downloading'
+
+    def rate(self, entry):
+        """
+        Pieces per second gained by the peer since its first bitfield, or 0.
+        """
+        if entry.first_time is None:
+            return 0
+        elapsed = entry.changed - entry.first_time
+        return (entry.count - entry.first_count) / elapsed if elapsed > 0 else 0
+
+    def retain(self, keys):
+        """
+        Forget peers that are no longer connected.
+        """
+        for key in self.peers.keys() - keys:
+            del self.peers[key]
+
+# Fields of handle.status() and of each get_peer_info() entry that collect_peers() reads
+RECORD_STATUS_FIELDS = ('name', 'progress', 'has_metadata', 'num_seeds', 'num_peers')
+RECORD_PEER_FIELDS = ('ip', 'client', 'progress', 'downloading_piece_index', 'payload_down_speed',
+                      'payload_up_speed', 'num_pieces', 'pieces')
+RECORD_MAGIC = b'TMR1'
+
+class PollRecorder:
+    """
+    Binary log of raw per-poll observations, for replay with ReplayHandle.
+    After a magic header, each poll is one frame with the spool's length/CRC header holding
+    zlib-compressed JSON: [timestamp, source, infohash, status fields, torrent sizes, peers].
+    """
+    def __init__(self, path, flush_interval=5):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(RECORD_MAGIC)
+        self._last_flush = time.time()
+        self.polls = 0
+
+    def record(self, source, handle, status, peers, timestamp=None):
+        torrent = None
+        if status.has_metadata:
+            torrent_file = handle.torrent_file()
+            torrent = [torrent_file.total_size(), torrent_file.num_pieces(), torrent_file.piece_length(),
+                       torrent_file.name()]
+        rows = []
+        for peer_info in peers:
+            try:
+                client = peer_info.client
+            except UnicodeDecodeError:
+                client = 'Unknown'
+            # Bitfields are stored packed, as hex
+            rows.append([list(peer_info.ip), client] + [getattr(peer_info, name) for name in RECORD_PEER_FIELDS[2:-1]]
+                        + [format(pack_pieces(peer_info.pieces), 'x')])
+        poll = [timestamp or time.time(), source, str(handle.info_hash()),
+                [getattr(status, name) for name in RECORD_STATUS_FIELDS], torrent, rows]
+        payload = zlib.compress(json.dumps(poll, separators=(',', ':'), default=str).encode('utf-8'))
+        with self._lock:
+            self._file.write(SPOOL_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            self.polls += 1
+            if time.time() - self._last_flush >= self.flush_interval:
+                self._file.flush()
+                self._last_flush = time.time()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    @staticmethod
+    def read(path):
+        """
+        Yield recorded polls in order, stopping at a torn or corrupt tail.
+        """
+        with open(path, 'rb') as f:
+            if f.read(len(RECORD_MAGIC)) != RECORD_MAGIC:
+                raise ValueError(f"{path} is not a poll recording")
+            while True:
+                header = f.read(SPOOL_HEADER.size)
+                if len(header) < SPOOL_HEADER.size:
+                    return
+                length, checksum = SPOOL_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    return
+                yield json.loads(zlib.decompress(payload))
+
+class ReplayHandle:
+    """
+    Stand-in torrent handle answering collect_peers() from one recorded poll.
+    """
+    def __init__(self, poll):
+        self.timestamp, self.source, self._infohash, status, self._torrent, peers = poll
+        self._status = types.SimpleNamespace(**dict(zip(RECORD_STATUS_FIELDS, status)))
+        self._peers = []
+        for row in peers:
+            peer_info = types.SimpleNamespace(**dict(zip(RECORD_PEER_FIELDS, row)))
+            peer_info.ip = tuple(peer_info.ip)
+            if hasattr(peer_info, 'pieces'):
+                peer_info.pieces = int(peer_info.pieces, 16)
+            self._peers.append(peer_info)
+
+    def status(self):
+        return self._status
+
+    def get_peer_info(self):
+        return self._peers
+
+    def info_hash(self):
+        return self._infohash
+
+    def torrent_file(self):
+        total_size, num_pieces, piece_length, name = self._torrent
+        return types.SimpleNamespace(total_size=lambda: total_size, num_pieces=lambda: num_pieces,
+                                     piece_length=lambda: piece_length, name=lambda: name)
+
+MAGNET_HASH_RE = re.compile(r'xt=urn:btih:([0-9a-fA-F]{40}|[A-Za-z2-7]{32})')
+INFOHASH_RE = re.compile(r'^(?:[0-9a-fA-F]{40}|[A-Za-z2-7]{32})$')
+
+def magnet_infohash(uri):
+    """
+    Return the hex v1 infohash of a magnet URI, or None.
+    """
+    match = MAGNET_HASH_RE.search(uri)
+    if not match:
+        return None
+    infohash = match.group(1)
+    if len(infohash) == 32:
+        infohash = base64.b32decode(infohash.upper()).hex()
+    return infohash.lower()
+
+def to_magnet(line):
+    """
+    Turn an input line (magnet URI or bare infohash) into a magnet URI; None for blanks/comments.
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if line.startswith('magnet:?'):
+        return line
+    if INFOHASH_RE.match(line):
+        return f"magnet:?xt=urn:btih:{line}"
+    return None
+
+def write_file_atomic(path, data):
+    """
+    Replace path with data (bytes) without leaving a truncated file behind on a crash.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+# libtorrent settings presets for --session-profile; a profile file starts from one of them
+SESSION_PRESETS = {
+    # The historical settings: many announces, very little downloading
+    'default': {
+        'download_rate_limit': 10000,
+        'upload_rate_limit': 0,
+        'connections_limit': 800,
+        'announce_to_all_tiers': True,
+        'announce_to_all_trackers': True,
+        'auto_manage_interval': 5,
+        'auto_scrape_interval': 0,
+        'auto_scrape_min_interval': 0,
+        'max_failcount': 1,
+        'aio_threads': 8,
+        'checking_mem_usage': 2048,
+    },
+    # Small boxes: fewer connections and peer list entries, small disk buffers
+    'low-memory': {
+        'download_rate_limit': 10000,
+        'upload_rate_limit': 0,
+        'connections_limit': 200,
+        'max_peerlist_size': 1000,
+        'max_paused_peerlist_size': 500,
+        'announce_to_all_tiers': True,
+        'announce_to_all_trackers': True,
+        'max_failcount': 1,
+        'aio_threads': 2,
+        'checking_mem_usage': 256,
+    },
+    # Maximum swarm coverage: large connection budget, fast connection attempts, big peer lists
+    'high-connection': {
+        'download_rate_limit': 10000,
+        'upload_rate_limit': 0,
+        'connections_limit': 4000,
+        'connection_speed': 200,
+        'torrent_connect_boost': 50,
+        'max_peerlist_size': 20000,
+        'peer_connect_timeout': 5,
+        'listen_queue_size': 200,
+        'close_redundant_connections': False,
+        'announce_to_all_tiers': True,
+        'announce_to_all_trackers': True,
+        'auto_manage_interval': 5,
+        'max_failcount': 1,
+        'aio_threads': 8,
+        'checking_mem_usage': 2048,
+    },
+    # Peer monitoring only: transfers throttled to a trickle so next to nothing reaches the disk
+    'disk-free': {
+        'download_rate_limit': 1,
+        'upload_rate_limit': 1,
+        'connections_limit': 800,
+        'close_redundant_connections': False,
+        'announce_to_all_tiers': True,
+        'announce_to_all_trackers': True,
+        'auto_manage_interval': 5,
+        'max_failcount': 1,
+        'aio_threads': 1,
+        'checking_mem_usage': 16,
+    },
+}
+
+# Settings owned by the tracker (per-session bindings, alerts, rotation), never taken from a profile
+PROFILE_RESERVED = ('listen_interfaces', 'outgoing_interfaces', 'alert_mask', 'user_agent')
+
+class SessionProfile:
+    """
+    Session settings from a preset name or a JSON profile file such as
+    {"preset": "high-connection", "settings": {"connections_limit": 3000}}, where settings
+    override the preset. The file is re-read when it changes; only settings that differ from
+    the applied ones are returned (settings no longer set go back to libtorrent's defaults),
+    and a broken file keeps the previous settings.
+    """
+    def __init__(self, spec='default', logger=None):
+        self.logger = logger or logging.getLogger('TorrentTracker')
+        self.path = None if spec in SESSION_PRESETS else spec
+        self._mtime = None
+        self.settings = {} if self.path else dict(SESSION_PRESETS[spec])
+        if self.path and not self.maybe_reload():
+            raise ValueError(f"Unusable session profile {spec}; presets are {', '.join(SESSION_PRESETS)}")
+
+    def load(self):
+        with open(self.path) as f:
+            profile = json.load(f)
+        preset = profile.get('preset', 'default')
+        if preset not in SESSION_PRESETS:
+            raise ValueError(f"unknown preset {preset!r}")
+        settings = dict(SESSION_PRESETS[preset])
+        settings.update(profile.get('settings', {}))
+        for name in PROFILE_RESERVED:
+            if settings.pop(name, None) is not None:
+                self.logger.warning(f"Ignoring {name} in session profile {self.path}")
+        if hasattr(lt, 'default_settings'):
+            unknown = settings.keys() - lt.default_settings().keys()
+            if unknown:
+                raise ValueError(f"unknown libtorrent settings {', '.join(sorted(unknown))}")
+        return settings
+
+    def maybe_reload(self):
+        """
+        Re-read the profile file if it changed. Returns the settings that changed.
+        """
+        if not self.path:
+            return {}
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            if self._mtime is None:
+                self.logger.error(f"Unable to read session profile {self.path}: {e}")
+                self._mtime = 0
+            return {}
+        if mtime == self._mtime:
+            return {}
+        self._mtime = mtime
+        try:
+            settings = self.load()
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            self.logger.error(f"Invalid session profile {self.path}, keeping the previous settings: {e}")
+            return {}
+        # A session keeps a setting until told otherwise, so dropped ones are reset explicitly
+        defaults = lt.default_settings() if hasattr(lt, 'default_settings') else {}
+        target = {name: defaults[name] for name in self.settings.keys() - settings.keys() if name in defaults}
+        target.update(settings)
+        changed = {name: value for name, value in target.items() if self.settings.get(name) != value}
+        self.settings = settings
+        if changed:
+            self.logger.info(f"Session profile {self.path}: {len(changed)} settings changed")
+        return changed
+
+class SessionStore:
+    """
+    Session state (DHT routing table, settings) and per-torrent resume data (including the
+    known peer list) kept on disk, so a restarted tracker rejoins its swarms immediately.
+    Files are written (and fsync'd) in order by a single writer thread, off the event loop.
+    """
+    def __init__(self, directory='state', logger=None):
+        self.directory = directory
+        self.resume_directory = os.path.join(directory, 'resume')
+        self.session_path = os.path.join(directory, 'session.state')
+        self.logger = logger or logging.getLogger('TorrentTracker')
+        self.outstanding = 0
+        self.writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='StateWriter')
+        os.makedirs(self.resume_directory, exist_ok=True)
+
+    def create_session(self):
+        """
+        Return a libtorrent session restored from the saved state, or a fresh one.
+        """
+        try:
+            with open(self.session_path, 'rb') as f:
+                buf = f.read()
+        except OSError:
+            return lt.session()
+        try:
+            if hasattr(lt, 'read_session_params'):
+                session = lt.session(lt.read_session_params(buf))
+            else:
+                session = lt.session()
+                session.load_state(lt.bdecode(buf))
+            self.logger.info(f"Restored session state from {self.session_path}")
+            return session
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable session state {self.session_path}: {e}")
+            return lt.session()
+
+    def _write(self, path, buf, what):
+        try:
+            write_file_atomic(path, buf)
+        except Exception as e:
+            self.logger.error(f"Could not save {what}: {e}")
+
+    def write(self, path, buf, what):
+        """
+        Queue buf to replace path on the writer thread.
+        """
+        return self.writer.submit(self._write, path, buf, what)
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued file is on disk.
+        """
+        self.writer.submit(int).result(timeout)
+
+    def close(self):
+        self.writer.shutdown(wait=True)
+
+    def save_session(self, session):
+        try:
+            # The 2.0 Python bindings have write_session_params_buf() but no session_state()
+            if hasattr(session, 'session_state'):
+                buf = lt.write_session_params_buf(session.session_state())
+            else:
+                buf = lt.bencode(session.save_state())
+        except Exception as e:
+            self.logger.error(f"Could not save session state: {e}")
+            return
+        self.write(self.session_path, buf, 'session state')
+
+    def resume_path(self, infohash):
+        return os.path.join(self.resume_directory, f"{infohash}.resume")
+
+    def _resume_params(self, infohash, name):
+        try:
+            with open(self.resume_path(infohash), 'rb') as f:
+                return lt.read_resume_data(f.read())
+        except OSError:
+            return None
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable resume data for {name}: {e}")
+            return None
+
+    def torrent_params(self, ti, save_path):
+        """
+        Build add_torrent_params for ti, starting from its resume data when there is any.
+        """
+        atp = self._resume_params(ti.info_hash(), ti.name()) or lt.add_torrent_params()
+        atp.ti = ti
+        atp.save_path = save_path
+        return atp
+
+    def magnet_params(self, uri, infohash, save_path, metadata_path=None):
+        """
+        Build add_torrent_params for a magnet URI, from resume data or cached metadata if available.
+        """
+        atp = self._resume_params(infohash, infohash)
+        if atp is None:
+            atp = lt.parse_magnet_uri(uri)
+            if metadata_path and os.path.exists(metadata_path):
+                try:
+                    atp.ti = lt.torrent_info(metadata_path)
+                except Exception as e:
+                    self.logger.warning(f"Ignoring cached metadata {metadata_path}: {e}")
+        atp.save_path = save_path
+        return atp
+
+    def request_resume_data(self, handles):
+        """
+        Ask libtorrent to produce resume data for the torrents that changed since their last
+        save (or were never saved); files are written from handle_alert().
+        """
+        for handle in handles:
+            if handle is None or not handle.is_valid():
+                continue
+            if not handle.need_save_resume_data() and os.path.exists(self.resume_path(handle.info_hash())):
+                continue
+            handle.save_resume_data(lt.torrent_handle.save_info_dict)
+            self.outstanding += 1
+
+    def handle_alert(self, alert):
+        what = alert.what()
+        if what == 'save_resume_data':
+            self.outstanding -= 1
+            try:
+                # Encoded here: the alert is only valid until the next pop_alerts()
+                buf = lt.write_resume_data_buf(alert.params)
+            except Exception as e:
+                self.logger.error(f"Could not save resume data: {e}")
+                return
+            self.write(self.resume_path(alert.handle.info_hash()), buf, 'resume data')
+        elif what == 'save_resume_data_failed':
+            self.outstanding -= 1
+            self.logger.debug(f"Resume data not saved: {alert.message()}")
+
+# Column types for the Parquet export; remaining PEER_FIELDS are dictionary-encoded strings
+PARQUET_INT32 = ('port', 'num_pieces', 'piece_size', 'downloaded_pieces', 'num_seeds', 'num_peers')
+PARQUET_INT64 = ('total_size', 'download_speed', 'upload_speed')
+PARQUET_TIMES = ('first_seen', 'last_seen', 'completed_at')
+PARQUET_PLAIN = ('ip',)
+
+@functools.lru_cache(maxsize=4096)
+def parse_time(value):
+    """
+    Parse a 'YYYY-mm-dd HH:MM:SS UTC' timestamp as written by the tracker.
+    """
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+@functools.lru_cache(maxsize=4096)
+def parse_duration(value):
+    """
+    Parse an 'HH:MM:SS' estimated time; 'infinite' and unknown values become None.
+    """
+    try:
+        hours, minutes, seconds = (int(x) for x in str(value).split(':'))
+    except ValueError:
+        return None
+    return timedelta(hours=hours, minutes=minutes, seconds=seconds)
+
+def to_int(value):
+    if value is None or value == '':
+        return None
+    return int(value)
+
+def parquet_schema():
+    fields = []
+    for name in PEER_FIELDS:
+        if name in PARQUET_INT32:
+            fields.append(pa.field(name, pa.int32()))
+        elif name in PARQUET_INT64:
+            fields.append(pa.field(name, pa.int64()))
+        elif name in PARQUET_TIMES:
+            fields.append(pa.field(name, pa.timestamp('s', tz='UTC')))
+        elif name == 'estimated_time':
+            fields.append(pa.field(name, pa.duration('s')))
+        elif name in PARQUET_PLAIN:
+            fields.append(pa.field(name, pa.string()))
+        else:
+            fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+    return pa.schema(fields)
+
+class ParquetSink:
+    """
+    Peer observations written as typed Parquet files, partitioned Hive-style by
+    date=YYYY-MM-DD, so readers only open the columns and days they need
+    (read with pyarrow.dataset / pandas using partitioning='hive').
+    Rows are buffered and written every flush_rows rows or flush_interval seconds, one file
+    per date per flush, sorted by infohash so row group statistics skip other torrents.
+    Once a day is over, its files are compacted into one in the background.
+    """
+    def __init__(self, directory, flush_rows=100000, flush_interval=300, logger=None):
+        if pa is None:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+        self.directory = directory
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.logger = logger or logging.getLogger('TorrentTracker')
+        self.schema = parquet_schema()
+        self._rows = []
+        self._last_flush = time.time()
+        self._today = None
+        self._compactor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='ParquetCompact')
+
+    def append(self, row):
+        """
+        Buffer one row in PEER_FIELDS order.
+        """
+        self._rows.append(row)
+        if len(self._rows) >= self.flush_rows:
+            self.flush()
+
+    def maybe_flush(self):
+        if self._rows and time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def _table(self, rows):
+        columns = []
+        for name, values in zip(PEER_FIELDS, zip(*rows)):
+            if name in PARQUET_INT32 or name in PARQUET_INT64:
+                values = [to_int(v) for v in values]
+            elif name in PARQUET_TIMES:
+                values = [parse_time(v) for v in values]
+            elif name == 'estimated_time':
+                values = [parse_duration(v) for v in values]
+            else:
+                values = [None if v is None else str(v) for v in values]
+            columns.append(values)
+        return pa.Table.from_arrays([pa.array(values, type=field.type) if not pa.types.is_dictionary(field.type)
+                                     else pa.array(values, type=pa.string()).dictionary_encode()
+                                     for field, values in zip(self.schema, columns)], schema=self.schema)
+
+    def flush(self):
+        """
+        Write buffered rows, one file per date partition.
+        """
+        rows, self._rows = self._rows, []
+        self._last_flush = time.time()
+        if not rows:
+            return 0
+        date_index = PEER_FIELDS.index('last_seen')
+        infohash_index = PEER_FIELDS.index('infohash')
+        partitions = {}
+        for row in rows:
+            seen = parse_time(row[date_index])
+            date = seen.strftime('%Y-%m-%d') if seen else 'unknown'
+            partitions.setdefault(date, []).append(row)
+        for date, part in partitions.items():
+            path = os.path.join(self.directory, f"date={date}")
+            os.makedirs(path, exist_ok=True)
+            filename = os.path.join(path, f"part-{int(self._last_flush)}-{uuid.uuid4().hex[:12]}.parquet")
+            part.sort(key=lambda row: str(row[infohash_index]))
+            try:
+                # Renamed once complete, so compaction never reads a partial file
+                pq.write_table(self._table(part), f"{filename}.tmp", compression='zstd')
+                os.replace(f"{filename}.tmp", filename)
+            except Exception as e:
+                self.logger.error(f"Could not write Parquet file {filename}: {e}")
+        self.logger.debug(f"Exported {len(rows)} rows to {len(partitions)} Parquet partitions")
+        today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        if today != self._today:
+            # First flush of a day: the days before it are complete
+            self._today = today
+            self._compactor.submit(self.compact_before, today)
+        return len(rows)
+
+    def compact(self, date):
+        """
+        Merge the files of one date partition into a single file. Returns the number of
+        files merged.
+        """
+        path = os.path.join(self.directory, f"date={date}")
+        parts = sorted(glob.glob(os.path.join(path, 'part-*.parquet')))
+        if len(parts) < 2:
+            return 0
+        filename = os.path.join(path, f"part-{int(time.time())}-{uuid.uuid4().hex[:12]}-compacted.parquet")
+        try:
+            # One source file at a time, so a busy day never has to fit in memory
+            with pq.ParquetWriter(f"{filename}.tmp", self.schema, compression='zstd') as writer:
+                for part in parts:
+                    writer.write_table(pq.read_table(part).cast(self.schema))
+            os.replace(f"{filename}.tmp", filename)
+        except Exception as e:
+            self.logger.error(f"Could not compact Parquet partition {path}: {e}")
+            if os.path.exists(f"{filename}.tmp"):
+                os.remove(f"{filename}.tmp")
+            return 0
+        for part in parts:
+            os.remove(part)
+        self.logger.info(f"Compacted {len(parts)} Parquet files of {date}")
+        return len(parts)
+
+    def compact_before(self, date):
+        """
+        Compact every date partition older than date (YYYY-MM-DD).
+        """
+        for path in sorted(glob.glob(os.path.join(self.directory, 'date=*'))):
+            day = os.path.basename(path)[5:]
+            if day < date or day == 'unknown':
+                self.compact(day)
+
+    def close(self, compact=False):
+        """
+        Write the buffered rows; with compact, every date partition is compacted too.
+        """
+        self.flush()
+        if compact:
+            self._compactor.submit(self.compact_before, '9999-12-31')
+        self._compactor.shutdown(wait=True)
+
+def convert_to_parquet(source, directory, connect=None, chunk_rows=200000, logger=None):
+    """
+    One-shot export of existing data: source is a CSV written by the tracker, or 'db' to read
+    report_table through connect(). Returns the number of rows written.
+    """
+    logger = logger or logging.getLogger('TorrentTracker')
+    sink = ParquetSink(directory, flush_rows=chunk_rows, flush_interval=float('inf'), logger=logger)
+    total = 0
+    if source == 'db':
+        conn = connect()
+        try:
+            # Unbuffered cursor: rows are streamed instead of loading the whole table
+            with conn.cursor(pymysql.cursors.SSCursor) as cur:
+                cur.execute(f"SELECT {', '.join(PEER_FIELDS)} FROM report_table")
+                for row in cur:
+                    sink.append(row)
+                    total += 1
+        finally:
+            conn.close()
+    else:
+        with open(source, newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            # CSVs written before a column was added have a prefix of the current columns
+            if header and tuple(header) != PEER_FIELDS[:len(header)]:
+                raise ValueError(f"{source} does not have the report columns")
+            missing = [None] * (len(PEER_FIELDS) - len(header or ()))
+            for row in reader:
+                sink.append(row + missing)
+                total += 1
+    # One file per day instead of one per chunk
+    sink.close(compact=True)
+    logger.info(f"Exported {total} rows from {source} to {directory}")
+    return total
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter with 2**p one-byte registers.
+    Sketches with the same precision merge by taking the register-wise maximum, so counts
+    over several hours, countries or monitor nodes come from merging their sketches.
+    The standard error is 1.04 / sqrt(2**p) (about 1.6% for p=12).
+    """
+    __slots__ = ('p', 'registers')
+
+    def __init__(self, p=12, registers=None):
+        self.p = p
+        self.registers = bytearray(registers) if registers is not None else bytearray(1 << p)
+
+    @property
+    def error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, value):
+        x = int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+        width = 64 - self.p
+        index = x >> width
+        rank = width - (x & ((1 << width) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError(f"Cannot merge HyperLogLog sketches of precision {self.p} and {other.p}")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        m = len(self.registers)
+        estimate = (0.7213 / (1 + 1.079 / m)) * m * m / math.fsum(HLL_POWERS[r] for r in self.registers)
+        if estimate <= 2.5 * m:
+            # Small range correction: linear counting on empty registers
+            zeros = self.registers.count(0)
+            if zeros:
+                estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+HLL_POWERS = [2.0 ** -r for r in range(65)]
+
+# Sketch file: magic, precision, then (key length, key, registers) records, zlib compressed
+SKETCH_MAGIC = b'HLL1'
+SKETCH_KEY = struct.Struct('>H')
+
+class SketchStore:
+    """
+    HyperLogLog sketches of distinct peers per (infohash, country, time bucket).
+    Each bucket lives in one compressed file (sketches/<YYYYmmddTHHMM>.hll); peers are counted
+    in the bucket of their last_seen time. Open buckets are rewritten every flush_interval
+    seconds and merged back in after a restart; only the newest open_buckets stay in memory,
+    and an older one is reopened from its file when late observations arrive.
+    Stores from several monitor nodes (shards) are combined at query time.
+    """
+    def __init__(self, directory='sketches', bucket_seconds=3600, precision=12, flush_interval=60, open_buckets=2,
+                 logger=None):
+        self.directory = directory
+        self.bucket_seconds = bucket_seconds
+        self.precision = precision
+        self.flush_interval = flush_interval
+        self.open_buckets = open_buckets
+        self.logger = logger or logging.getLogger('TorrentTracker')
+        self.buckets = {}
+        self._dirty = set()
+        self._last_flush = time.time()
+        os.makedirs(directory, exist_ok=True)
+
+    def bucket_name(self, now):
+        start = int(now) - int(now) % self.bucket_seconds
+        return time.strftime('%Y%m%dT%H%M', time.gmtime(start))
+
+    def path(self, bucket):
+        return os.path.join(self.directory, f"{bucket}.hll")
+
+    @staticmethod
+    def load(path):
+        """
+        Read a sketch file into {(infohash, country): HyperLogLog}.
+        """
+        with open(path, 'rb') as f:
+            data = zlib.decompress(f.read())
+        if data[:4] != SKETCH_MAGIC:
+            raise ValueError(f"{path} is not a sketch file")
+        p = data[4]
+        size = 1 << p
+        sketches = {}
+        offset = 5
+        while offset < len(data):
+            (length,) = SKETCH_KEY.unpack_from(data, offset)
+            offset += SKETCH_KEY.size
+            infohash, _, country = data[offset:offset + length].decode('utf-8').partition('|')
+            offset += length
+            sketches[(infohash, country)] = HyperLogLog(p, data[offset:offset + size])
+            offset += size
+        return sketches
+
+    def dump(self, bucket):
+        parts = [SKETCH_MAGIC, bytes([self.precision])]
+        for (infohash, country), sketch in self.buckets[bucket].items():
+            key = f"{infohash}|{country}".encode('utf-8')
+            parts.append(SKETCH_KEY.pack(len(key)) + key + bytes(sketch.registers))
+        return zlib.compress(b''.join(parts))
+
+    def _open_bucket(self, bucket):
+        sketches = self.buckets[bucket] = {}
+        if os.path.exists(self.path(bucket)):
+            try:
+                for key, sketch in self.load(self.path(bucket)).items():
+                    if sketch.p == self.precision:
+                        sketches[key] = sketch
+            except (OSError, ValueError, zlib.error) as e:
+                self.logger.error(f"Ignoring unreadable sketch file {self.path(bucket)}: {e}")
+        return sketches
+
+    def add(self, infohash, country, peer, now=None):
+        """
+        Count peer (e.g. "ip:port") as seen in infohash from country at now (a timestamp,
+        the current time by default).
+        """
+        bucket = self.bucket_name(time.time() if now is None else now)
+        sketches = self.buckets.get(bucket)
+        if sketches is None:
+            sketches = self._open_bucket(bucket)
+        sketch = sketches.get((infohash, country))
+        if sketch is None:
+            sketch = sketches[(infohash, country)] = HyperLogLog(self.precision)
+        sketch.add(peer)
+        self._dirty.add(bucket)
+
+    def maybe_flush(self):
+        if time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.time()
+        for bucket in sorted(self._dirty):
+            try:
+                write_file_atomic(self.path(bucket), self.dump(bucket))
+                self._dirty.discard(bucket)
+            except OSError as e:
+                self.logger.error(f"Could not write sketch file {self.path(bucket)}: {e}")
+        # Bucket names sort chronologically; written buckets are cheap to reopen
+        for bucket in sorted(self.buckets)[:-self.open_buckets]:
+            if bucket not in self._dirty:
+                del self.buckets[bucket]
+
+    @classmethod
+    def query(cls, directories, since=None, until=None, infohash=None, country=None, by=()):
+        """
+        Merge sketches from one or more stores. since/until are bucket names (inclusive) and
+        by a subset of ('day', 'hour', 'infohash', 'country'). Returns {group: HyperLogLog}.
+        """
+        groups = {}
+        for directory in directories:
+            for name in sorted(os.listdir(directory)):
+                if not name.endswith('.hll'):
+                    continue
+                bucket = name[:-4]
+                if (since and bucket < since) or (until and bucket > until):
+                    continue
+                for (sketch_infohash, sketch_country), sketch in cls.load(os.path.join(directory, name)).items():
+                    if infohash and sketch_infohash != infohash:
+                        continue
+                    if country and sketch_country.casefold() != country.casefold():
+                        continue
+                    values = {'day': f"{bucket[:4]}-{bucket[4:6]}-{bucket[6:8]}", 'hour': bucket,
+                              'infohash': sketch_infohash, 'country': sketch_country}
+                    group = tuple(values[d] for d in by)
+                    if group in groups:
+                        groups[group].merge(sketch)
+                    else:
+                        groups[group] = HyperLogLog(sketch.p, sketch.registers)
+        return groups
+
+# Never monitored: private, loopback, link-local and unique local ranges
+DEFAULT_BLOCKLIST = ('10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16', '127.0.0.0/8', '169.254.0.0/16',
+                     '::1/128', 'fc00::/7', 'fe80::/10')
+
+def parse_ip_range(text):
+    """
+    Parse one IP list entry: a CIDR, a single address, "first - last", or the PeerGuardian
+    "description:first-last" form. Returns (version, first, last) with integer addresses.
+    """
+    first, sep, last = text.rpartition('-')
+    if not sep:
+        network = ipaddress.ip_network(text, strict=False)
+        return network.version, int(network.network_address), int(network.broadcast_address)
+    try:
+        start = ipaddress.ip_address(first.strip())
+    except ValueError:
+        start = ipaddress.ip_address(first.rpartition(':')[2].strip())
+    end = ipaddress.ip_address(last.strip())
+    if start.version != end.version or start > end:
+        raise ValueError(f"not an address range: {text}")
+    return start.version, int(start), int(end)
+
+def merge_ranges(ranges):
+    """
+    Sort (first, last) ranges and merge the overlapping or adjacent ones.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+def subtract_ranges(ranges, holes):
+    """
+    Remove merged holes from merged ranges, splitting ranges around them.
+    """
+    result = []
+    j = 0
+    for start, end in ranges:
+        while j < len(holes) and holes[j][1] < start:
+            j += 1
+        k = j
+        while k < len(holes) and holes[k][0] <= end:
+            if holes[k][0] > start:
+                result.append((start, holes[k][0] - 1))
+            start = max(start, holes[k][1] + 1)
+            k += 1
+        if start <= end:
+            result.append((start, end))
+    return result
+
+class IPFilterList:
+    """
+    Blocked address ranges: the built-in private ranges plus blocklist files, minus allowlist
+    files. Ranges are merged per IP version into sorted start/end lists, answered with a
+    bisect for in-process exclusion and handed to libtorrent as a single ip_filter.
+    Changed files are recompiled off to the side and the tables swapped in one assignment,
+    so lookups never see a half-built filter.
+    """
+    def __init__(self, blocklists=(), allowlists=(), defaults=DEFAULT_BLOCKLIST, logger=None):
+        self.blocklists = list(blocklists or ())
+        self.allowlists = list(allowlists or ())
+        self.defaults = defaults
+        self.logger = logger or logging.getLogger('TorrentTracker')
+        # Unreadable lists at startup are fatal, later they only keep the previous filter
+        self._tables, ignored = self.compile()
+        self._mtimes = self._list_mtimes()
+        self.logger.info(f"IP filter: {len(self)} blocked ranges from {len(self.blocklists)} blocklists "
+                         f"and {len(self.allowlists)} allowlists, {ignored} unparsable lines ignored")
+
+    def __len__(self):
+        return sum(len(starts) for starts, _ in self._tables.values())
+
+    def __contains__(self, ip):
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        starts, ends = self._tables[address.version]
+        value = int(address)
+        i = bisect.bisect_right(starts, value) - 1
+        return i >= 0 and value <= ends[i]
+
+    def _list_mtimes(self):
+        mtimes = []
+        for path in self.blocklists + self.allowlists:
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+    def _read(self, paths, ranges):
+        ignored = 0
+        for path in paths:
+            with open(path, errors='replace') as f:
+                for line in f:
+                    line = line.split('#', 1)[0].strip()
+                    if not line:
+                        continue
+                    try:
+                        version, start, end = parse_ip_range(line)
+                    except ValueError:
+                        ignored += 1
+                        continue
+                    ranges[version].append((start, end))
+        return ignored
+
+    def compile(self):
+        """
+        Read every list and build the merged tables. Returns (tables, ignored lines).
+        """
+        blocked = {4: [], 6: []}
+        allowed = {4: [], 6: []}
+        for entry in self.defaults:
+            version, start, end = parse_ip_range(entry)
+            blocked[version].append((start, end))
+        ignored = self._read(self.blocklists, blocked) + self._read(self.allowlists, allowed)
+        tables = {}
+        for version in (4, 6):
+            ranges = subtract_ranges(merge_ranges(blocked[version]), merge_ranges(allowed[version]))
+            tables[version] = ([start for start, _ in ranges], [end for _, end in ranges])
+        return tables, ignored
+
+    def maybe_reload(self):
+        """
+        Recompile if a list file changed. Returns True when new tables were swapped in.
+        """
+        mtimes = self._list_mtimes()
+        if mtimes == self._mtimes:
+            return False
+        self._mtimes = mtimes
+        try:
+            tables, ignored = self.compile()
+        except OSError as e:
+            self.logger.error(f"Unable to read IP lists, keeping the previous filter: {e}")
+            return False
+        self._tables = tables
+        self.logger.info(f"IP filter reloaded: {len(self)} blocked ranges, {ignored} unparsable lines ignored")
+        return True
+
+    def session_filter(self):
+        """
+        The blocked ranges as a libtorrent ip_filter.
+        """
+        f = ip_filter()
+        for version, (starts, ends) in self._tables.items():
+            address = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+            for start, end in zip(starts, ends):
+                f.add_rule(str(address(start)), str(address(end)), 1)
+        return f
+
+class PublicIPResolver:
+    """
+    Keep the set of addresses that belong to this host, so they are never recorded as peers.
+    Addresses are learned from libtorrent alerts, local interfaces, an on-disk cache and
+    HTTP endpoints queried in a background thread. Lookups never block the caller.
+    """
+    def __init__(self, endpoints=None, cache_path='public_ip.json', timeout=5, refresh_interval=600, logger=None):
+        self.endpoints = list(endpoints or DEFAULT_IP_ENDPOINTS)
+        self.cache_path = cache_path
+        self.timeout = timeout
+        self.refresh_interval = refresh_interval
+        self.logger = logger or logging.getLogger('TorrentTracker')
+        # Readers only ever see a complete frozenset, swapped under the lock
+        self.addresses = frozenset()
+        self._sources = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def normalize(ip):
+        """
+        Return the canonical text form of an address, or None if it is not an IP.
+        """
+        try:
+            address = ipaddress.ip_address(str(ip).strip())
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        return str(address)
+
+    def _update(self, source, ips):
+        ips = {ip for ip in (self.normalize(x) for x in ips) if ip}
+        with self._lock:
+            if source == 'http' and ips:
+                # A fresh answer supersedes whatever was cached from a previous run
+                self._sources.pop('cache', None)
+            known = self._sources.setdefault(source, set())
+            added = ips - self.addresses
+            if source in ('http', 'local'):
+                known.clear()
+            known.update(ips)
+            self.addresses = frozenset().union(*self._sources.values())
+        for ip in sorted(added):
+            self.logger.info(f"Working with IP \033[30;47m{Fore.YELLOW + Style.BRIGHT + ip + Style.RESET_ALL}\033[0m ({source}). This IP address will not be saved in the database.")
+        return added
+
+    def _local_addresses(self):
+        """
+        Addresses of the local interfaces used for outgoing IPv4/IPv6 traffic.
+        """
+        ips = set()
+        for family, probe in ((socket.AF_INET, '8.8.8.8'), (socket.AF_INET6, '2001:4860:4860::8888')):
+            try:
+                # connect() on a UDP socket only selects a route, no packet is sent
+                with socket.socket(family, socket.SOCK_DGRAM) as sock:
+                    sock.connect((probe, 80))
+                    ips.add(sock.getsockname()[0])
+            except OSError:
+                pass
+        try:
+            for info in socket.getaddrinfo(socket.gethostname(), None):
+                ips.add(info[4][0])
+        except OSError:
+            pass
+        return ips
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f).get('addresses', [])
+        except (OSError, ValueError):
+            return
+        self._update('cache', cached)
+
+    def _save_cache(self, ips):
+        try:
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'addresses': sorted(ips), 'updated': time.time()}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            self.logger.debug(f"Could not write public IP cache {self.cache_path}: {e}")
+
+    def refresh(self):
+        """
+        Query every endpoint once and update the address set.
+        """
+        found = set()
+        for url in self.endpoints:
+            try:
+                response = requests.get(url, timeout=self.timeout)
+                if response.status_code == 200:
+                    ip = self.normalize(response.text)
+                    if ip:
+                        found.add(ip)
+                else:
+                    self.logger.debug(f"Public IP endpoint {url} returned status code {response.status_code}")
+            except Exception as e:
+                self.logger.debug(f"Public IP endpoint {url} failed: {e}")
+        self._update('local', self._local_addresses())
+        if found:
+            self._update('http', found)
+            self._save_cache(found)
+        elif not self.addresses:
+            self.logger.warning("Unable to obtain public IP from any endpoint. Will retry in the background.")
+        return found
+
+    def handle_alert(self, alert):
+        """
+        Learn addresses reported by libtorrent (external_ip_alert, listen_succeeded_alert).
+        """
+        what = alert.what()
+        if what == 'external_ip':
+            self._update('libtorrent', [alert.external_address])
+        elif what == 'listen_succeeded':
+            address = self.normalize(alert.address)
+            if address and not ipaddress.ip_address(address).is_unspecified:
+                self._update('libtorrent', [address])
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.refresh_interval)
+
+    def start(self):
+        """
+        Seed the address set from the cache and local interfaces, then refresh in the background.
+        """
+        self._load_cache()
+        self._update('local', self._local_addresses())
+        self._thread = threading.Thread(target=self._run, name='PublicIPResolver', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def __contains__(self, ip):
+        return ip in self.addresses
+
+# GeoLite2 databases are unpacked under DB_DIR in dated folders, e.g. GeoLite2-City_20250926/GeoLite2-City.mmdb
+DB_DIR = 'dbs'
+CITY_EDITION = 'GeoLite2-City'
+ASN_EDITION = 'GeoLite2-ASN'
+
+def find_mmdb(edition, directory=DB_DIR):
+    """
+    Return the path of the newest database of an edition in directory, or None.
+    Dated folders are compared by their YYYYMMDD suffix; a bare <edition>.mmdb is used when
+    there is no dated folder.
+    """
+    candidates = sorted(glob.glob(os.path.join(directory, f"{edition}_*", f"{edition}.mmdb")))
+    if candidates:
+        return candidates[-1]
+    path = os.path.join(directory, f"{edition}.mmdb")
+    return path if os.path.exists(path) else None
+
+# One collected peer: its record, ASN (not a report column) and the alert rules it matched
+Observation = collections.namedtuple('Observation', 'record asn rules')
+
+# Flattened enrichment result for one address
+GeoRecord = collections.namedtuple('GeoRecord', 'country country_iso city region province isp asn')
+GEO_UNKNOWN = GeoRecord('N/A', 'N/A', 'N/A', 'N/A', 'N/A', 'N/A', None)
+
+class PrefixTable:
+    """
+    Non-overlapping IP networks kept sorted by start address, each mapped to a cached value.
+    Any address inside a stored network is answered with a bisect, without touching the MMDB.
+    """
+    __slots__ = ('_starts', '_ends', '_values')
+
+    def __init__(self):
+        self._starts = []
+        self._ends = []
+        self._values = []
+
+    def __len__(self):
+        return len(self._starts)
+
+    def clear(self):
+        self._starts.clear()
+        self._ends.clear()
+        self._values.clear()
+
+    def get(self, address, default=None):
+        i = bisect.bisect_right(self._starts, address) - 1
+        if i >= 0 and address <= self._ends[i]:
+            return self._values[i]
+        return default
+
+    def add(self, network, value):
+        start = int(network.network_address)
+        i = bisect.bisect_left(self._starts, start)
+        if i < len(self._starts) and self._starts[i] == start:
+            self._values[i] = value
+            return
+        self._starts.insert(i, start)
+        self._ends.insert(i, int(network.broadcast_address))
+        self._values.insert(i, value)
+
+class GeoEnricher:
+    """
+    City and ASN enrichment cached per MMDB network block.
+    The first lookup in a block walks the MMDB tree; every other address in the same
+    block (same /24, /48, ... as reported by the database) is served from a PrefixTable.
+    Without explicit paths the newest databases in directory are used, and start() watches
+    it for newer releases, which are swapped in without stopping collection.
+    """
+    def __init__(self, city_path=None, asn_path=None, logger=None, max_networks=500000,
+                 mode=geoip2.database.MODE_AUTO, workers=0, pool_batch=256, directory=DB_DIR):
+        self.logger = logger or logging.getLogger('TorrentTracker')
+        self.directory = directory
+        self.mode = mode
+        self.city_path = city_path or find_mmdb(CITY_EDITION, directory)
+        self.asn_path = asn_path or find_mmdb(ASN_EDITION, directory)
+        self.city_reader, self.asn_reader = self._open(self.city_path, self.asn_path)
+        self.build = self._build(self.city_reader, self.asn_reader)
+        # Bumped on every database swap; results computed across a swap are discarded
+        self.generation = 0
+        self._retired = []
+        self._rejected = set()
+        self._stop = threading.Event()
+        self._thread = None
+        self.max_networks = max_networks
+        self.hits = 0
+        self.misses = 0
+        # Collectors enrich from several threads; the lock guards the prefix tables and swaps
+        self._lock = threading.Lock()
+        self.pool = None
+        self.pool_batch = pool_batch
+        if workers:
+            # Fork so workers share the parent's loaded modules; each one maps the MMDBs
+            # itself, and the mapped pages are shared through the page cache
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+            self.pool = context.Pool(workers, _init_enrichment_worker, (self.city_path, self.asn_path))
+        self.clear()
+
+    def clear(self):
+        """
+        Drop every cached network block.
+        """
+        self._city = {4: PrefixTable(), 6: PrefixTable()}
+        self._asn = {4: PrefixTable(), 6: PrefixTable()}
+
+    def close(self):
+        self.stop()
+        if self.pool:
+            self.pool.terminate()
+            self.pool.join()
+        for reader in self._retired + [self.city_reader, self.asn_reader]:
+            reader.close()
+
+    def _open(self, city_path, asn_path):
+        """
+        Open a City/ASN database pair and check it can answer lookups. Raises if either is unusable.
+        """
+        readers = []
+        try:
+            for edition, path, kind in ((CITY_EDITION, city_path, 'City'), (ASN_EDITION, asn_path, 'ASN')):
+                if path is None:
+                    raise FileNotFoundError(f"No {edition} database found in {self.directory}")
+                reader = geoip2.database.Reader(path, mode=self.mode)
+                readers.append(reader)
+                database_type = reader.metadata().database_type
+                if kind not in database_type:
+                    raise ValueError(f"{path} is a {database_type} database, expected {kind}")
+                # A truncated or half-copied file fails on the first tree walk
+                try:
+                    (reader.city if kind == 'City' else reader.asn)('8.8.8.8')
+                except geoip2.errors.AddressNotFoundError:
+                    pass
+        except Exception:
+            for reader in readers:
+                reader.close()
+            raise
+        return readers
+
+    @staticmethod
+    def _build(city_reader, asn_reader):
+        """
+        Identify a database pair by build dates, e.g. '20250926/20250929'.
+        """
+        return '/'.join(datetime.fromtimestamp(reader.metadata().build_epoch, timezone.utc).strftime('%Y%m%d')
+                        for reader in (city_reader, asn_reader))
+
+    def swap(self, city_path, asn_path):
+        """
+        Validate a new database pair and switch every later lookup to it.
+        Lookups already running finish on the old readers, which are closed at the next swap.
+        Returns False, keeping the current databases, if the new ones cannot be used.
+        """
+        try:
+            city_reader, asn_reader = self._open(city_path, asn_path)
+        except Exception as e:
+            self.logger.error(f"Keeping GeoLite databases {self.build}, cannot use {city_path} and {asn_path}: {e}")
+            return False
+        with self._lock:
+            for reader in self._retired:
+                reader.close()
+            self._retired = [self.city_reader, self.asn_reader]
+            self.city_reader, self.asn_reader = city_reader, asn_reader
+            self.city_path, self.asn_path = city_path, asn_path
+            self.build = self._build(city_reader, asn_reader)
+            self.generation += 1
+            self.clear()
+        self.logger.info(f"Switched to GeoLite databases {self.build} ({city_path}, {asn_path})")
+        return True
+
+    def check(self):
+        """
+        Swap in the newest databases of the directory if they changed. Returns True on a swap.
+        """
+        city_path = find_mmdb(CITY_EDITION, self.directory) or self.city_path
+        asn_path = find_mmdb(ASN_EDITION, self.directory) or self.asn_path
+        if (city_path, asn_path) == (self.city_path, self.asn_path):
+            return False
+        try:
+            # A rejected pair is retried once its files change (e.g. a copy that completed)
+            key = (city_path, os.path.getmtime(city_path), asn_path, os.path.getmtime(asn_path))
+        except OSError:
+            return False
+        if key in self._rejected:
+            return False
+        if not self.swap(city_path, asn_path):
+            self._rejected.add(key)
+            return False
+        return True
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.logger.error(f"Error checking for new GeoLite databases: {e}")
+
+    def start(self, interval=300):
+        """
+        Watch the database directory for new releases in a background thread.
+        """
+        self._thread = threading.Thread(target=self._run, args=(interval,), name='GeoDatabaseWatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _store(self, table, network, value):
+        if network is None:
+            return
+        with self._lock:
+            if len(table) >= self.max_networks:
+                table.clear()
+            table.add(network, value)
+
+    def _cached(self, tables, address, fetch):
+        table = tables[address.version]
+        with self._lock:
+            value = table.get(int(address))
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value, network = fetch(address)
+        self._store(table, network, value)
+        return value
+
+    def _fetch_city(self, address):
+        try:
+            response = self.city_reader.city(address)
+        except geoip2.errors.AddressNotFoundError as e:
+            return GEO_UNKNOWN[:5], getattr(e, 'network', None)
+        except Exception as e:
+            self.logger.error(f"Error getting geo info for {address}: {e}")
+            return GEO_UNKNOWN[:5], None
+        subdivisions = [subdivision.name or '' for subdivision in response.subdivisions]
+        region = subdivisions[0] if subdivisions else ''
+        province = subdivisions[1] if len(subdivisions) > 1 else ''
+        value = (response.country.name or 'N/A', response.country.iso_code or 'N/A',
+                 response.city.name or '', region, province)
+        return value, response.traits.network
+
+    def _fetch_asn(self, address):
+        try:
+            response = self.asn_reader.asn(address)
+        except geoip2.errors.AddressNotFoundError as e:
+            return GEO_UNKNOWN[5:], getattr(e, 'network', None)
+        except Exception as e:
+            self.logger.error(f"Error getting ISP info for {address}: {e}")
+            return GEO_UNKNOWN[5:], None
+        value = (response.autonomous_system_organization or 'N/A', response.autonomous_system_number)
+        return value, response.network
+
+    def country(self, address):
+        """
+        Return (country name, ISO code) for an ipaddress object, without the ASN lookup.
+        City databases only answer city() (geoip2 refuses country() on them), so this reads
+        the city block, which the full enrichment of a kept peer then finds cached.
+        """
+        return self._cached(self._city, address, self._fetch_city)[:2]
+
+    def asn(self, address):
+        """
+        Return the autonomous system number for an ipaddress object.
+        """
+        return self._cached(self._asn, address, self._fetch_asn)[1]
+
+    def lookup(self, ip):
+        """
+        Return the GeoRecord for an IP address.
+        """
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return GEO_UNKNOWN
+        return GeoRecord(*self._cached(self._city, address, self._fetch_city),
+                         *self._cached(self._asn, address, self._fetch_asn))
+
+    def lookup_many(self, ips):
+        """
+        Enrich a batch of addresses, looking each distinct address up once.
+        With a worker pool, addresses missing from the cache are split into batches of
+        pool_batch and looked up in parallel; smaller batches stay in-process, where
+        they are cheaper than the round trip to a worker.
+        """
+        distinct = set(ips)
+        if self.pool is None or len(distinct) < self.pool_batch:
+            return {ip: self.lookup(ip) for ip in distinct}
+        records = {}
+        misses = []
+        with self._lock:
+            tables = (self._city, self._asn)
+            paths = (self.city_path, self.asn_path)
+            for ip in distinct:
+                try:
+                    address = ipaddress.ip_address(ip)
+                except ValueError:
+                    records[ip] = GEO_UNKNOWN
+                    continue
+                city = self._city[address.version].get(int(address))
+                asn = self._asn[address.version].get(int(address))
+                if city is None or asn is None:
+                    misses.append(ip)
+                else:
+                    records[ip] = GeoRecord(*city, *asn)
+        self.hits += len(records)
+        self.misses += len(misses)
+        batches = [(*paths, misses[i:i + self.pool_batch]) for i in range(0, len(misses), self.pool_batch)]
+        for batch in self.pool.map(_enrich_batch, batches):
+            for ip, city, city_network, asn, asn_network in batch:
+                version = ipaddress.ip_address(ip).version
+                self._store(tables[0][version], city_network, city)
+                self._store(tables[1][version], asn_network, asn)
+                records[ip] = GeoRecord(*city, *asn)
+        return records
+
+    def enrich_peers(self, peers):
+        """
+        Enrich a whole get_peer_info() list in one call.
+        Returns the database build used and GeoRecords aligned with peers; a batch that
+        overlapped a database swap is enriched again, so it never mixes two builds.
+        """
+        ips = [peer_info.ip[0] for peer_info in peers]
+        ips = [ip[7:] if ip.startswith('::ffff:') else ip for ip in ips]
+        while True:
+            generation, build = self.generation, self.build
+            records = self.lookup_many(ips)
+            if self.generation == generation:
+                return build, [records[ip] for ip in ips]
+
+# Enricher of the current enrichment pool worker process
+_worker_enricher = None
+
+def _init_enrichment_worker(city_path, asn_path):
+    global _worker_enricher
+    # Ctrl-C is handled by the parent, which terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # A forked worker inherits the parent's log queue, which nothing drains in the worker
+    # (and a replacement worker may fork while the listener holds its lock): log to stderr
+    logger = logging.getLogger('TorrentTracker')
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(ConsoleFormatter())
+    logger.addHandler(console_handler)
+    _worker_enricher = GeoEnricher(city_path, asn_path, mode=geoip2.database.MODE_MMAP)
+
+def _enrich_batch(args):
+    """
+    Look up a batch of addresses in an enrichment pool worker.
+    Returns flattened (ip, city values, city network, ASN values, ASN network) tuples, so
+    the parent can cache whole network blocks.
+    """
+    global _worker_enricher
+    city_path, asn_path, ips = args
+    if (city_path, asn_path) != (_worker_enricher.city_path, _worker_enricher.asn_path):
+        # The parent swapped databases
+        _worker_enricher.close()
+        _worker_enricher = GeoEnricher(city_path, asn_path, mode=geoip2.database.MODE_MMAP)
+    results = []
+    for ip in ips:
+        address = ipaddress.ip_address(ip)
+        city, city_network = _worker_enricher._fetch_city(address)
+        asn, asn_network = _worker_enricher._fetch_asn(address)
+        results.append((ip, city, city_network, asn, asn_network))
+    return results
+
+class GeoFilter:
+    """
+    Country/ASN filter evaluated before full enrichment.
+    Built from a comma separated spec such as "Spain,PT,AS3352"; countries match by
+    English name or ISO code, a peer passes if its country or its ASN is listed.
+    """
+    def __init__(self, countries=(), asns=()):
+        self.countries = frozenset(c.strip().casefold() for c in countries if c.strip())
+        self.asns = frozenset(int(a) for a in asns)
+
+    @classmethod
+    def parse(cls, spec):
+        countries = []
+        asns = []
+        for token in str(spec).split(','):
+            token = token.strip()
+            number = token[2:] if token[:2].upper() == 'AS' else token
+            if number.isdigit():
+                asns.append(int(number))
+            elif token:
+                countries.append(token)
+        return cls(countries, asns)
+
+    def __bool__(self):
+        return bool(self.countries or self.asns)
+
+    def matches(self, enricher, ip):
+        """
+        Return True if the peer address passes the filter, using the cheapest lookups first.
+        """
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        if self.countries:
+            name, iso_code = enricher.country(address)
+            if name.casefold() in self.countries or iso_code.casefold() in self.countries:
+                return True
+        if self.asns:
+            return enricher.asn(address) in self.asns
+        return False
+
+ALERT_FIELDS = ('country', 'asn', 'cidr', 'client', 'infohash')
+
+class AlertRules:
+    """
+    Alert rules compiled into per-field indexes.
+    Each rule is a dict with optional 'name' and any of ALERT_FIELDS, each a value or a list
+    of values; a rule fires when every field it sets matches (values within a field are ORed).
+    Rules are numbered bits: every field lookup returns the bitmask of rules it satisfies, so
+    evaluating a peer costs one hash lookup per field (one per prefix length for CIDRs),
+    regardless of the number of rules.
+    """
+    def __init__(self, rules=(), path=None, logger=None):
+        self.path = path
+        self.logger = logger or logging.getLogger('TorrentTracker')
+        self._mtime = None
+        self._compiled = self._compile(rules)
+        if path:
+            self.maybe_reload()
+
+    @classmethod
+    def from_filter(cls, geo_filter, logger=None):
+        """
+        Build the rules equivalent to a -c/--country GeoFilter.
+        """
+        rules = []
+        if geo_filter and geo_filter.countries:
+            rules.append({'name': 'country', 'country': sorted(geo_filter.countries)})
+        if geo_filter and geo_filter.asns:
+            rules.append({'name': 'asn', 'asn': sorted(geo_filter.asns)})
+        return cls(rules, logger=logger)
+
+    def __len__(self):
+        return len(self._compiled[0])
+
+    @staticmethod
+    def _key(field, value):
+        if field == 'asn':
+            value = str(value).strip()
+            return int(value[2:] if value[:2].upper() == 'AS' else value)
+        return str(value).strip().casefold()
+
+    def _compile(self, rules):
+        names = []
+        index = {field: {} for field in ALERT_FIELDS if field != 'cidr'}
+        cidrs = {4: {}, 6: {}}
+        wildcard = dict.fromkeys(ALERT_FIELDS, 0)
+        for bit, rule in enumerate(rules):
+            names.append(str(rule.get('name', f'rule-{bit}')))
+            mask = 1 << bit
+            for field in ALERT_FIELDS:
+                values = rule.get(field)
+                if values is None or values == []:
+                    wildcard[field] |= mask
+                    continue
+                if not isinstance(values, (list, tuple, set, frozenset)):
+                    values = [values]
+                for value in values:
+                    if field == 'cidr':
+                        network = ipaddress.ip_network(str(value).strip(), strict=False)
+                        networks = cidrs[network.version].setdefault(network.prefixlen, {})
+                        key = int(network.network_address)
+                    else:
+                        networks = index[field]
+                        key = self._key(field, value)
+                    networks[key] = networks.get(key, 0) | mask
+        cidrs = {version: tuple(sorted(by_length.items())) for version, by_length in cidrs.items()}
+        return tuple(names), index, cidrs, wildcard, (1 << len(names)) - 1
+
+    def load(self, path):
+        """
+        Read rules from a JSON file: a list of rules or {"rules": [...]}.
+        """
+        with open(path) as f:
+            rules = json.load(f)
+        if isinstance(rules, dict):
+            rules = rules.get('rules', [])
+        return self._compile(rules)
+
+    def maybe_reload(self):
+        """
+        Recompile the rules file if it changed; a broken file keeps the previous rules.
+        """
+        if not self.path:
+            return False
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            if self._mtime is None:
+                self.logger.error(f"Unable to read alert rules {self.path}: {e}")
+                self._mtime = 0
+            return False
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            compiled = self.load(self.path)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            self.logger.error(f"Invalid alert rules in {self.path}, keeping the previous ones: {e}")
+            return False
+        # Single assignment, so match() always sees a complete rule set
+        self._compiled = compiled
+        self.logger.info(f"Loaded {len(compiled[0])} alert rules from {self.path}")
+        return True
+
+    def match(self, ip, country, country_iso, asn, client, infohash):
+        """
+        Return the names of the rules matched by a peer.
+        """
+        names, index, cidrs, wildcard, candidates = self._compiled
+        if not candidates:
+            return []
+        by_country = index['country']
+        candidates &= (by_country.get(str(country).casefold(), 0) | by_country.get(str(country_iso).casefold(), 0)
+                       | wildcard['country'])
+        if candidates:
+            candidates &= index['asn'].get(asn, 0) | wildcard['asn']
+        if candidates:
+            by_client = index['client']
+            client = str(client).casefold()
+            candidates &= by_client.get(client, 0) | by_client.get(client.split(' ', 1)[0], 0) | wildcard['client']
+        if candidates:
+            candidates &= index['infohash'].get(str(infohash).casefold(), 0) | wildcard['infohash']
+        if candidates and candidates & ~wildcard['cidr']:
+            try:
+                address = ipaddress.ip_address(ip)
+            except ValueError:
+                address = None
+            matched = wildcard['cidr']
+            if address is not None:
+                value = int(address)
+                width = address.max_prefixlen
+                for prefixlen, networks in cidrs[address.version]:
+                    shift = width - prefixlen
+                    matched |= networks.get(value >> shift << shift, 0)
+            candidates &= matched
+        hits = []
+        while candidates:
+            low = candidates & -candidates
+            hits.append(names[low.bit_length() - 1])
+            candidates ^= low
+        return hits
+
+class SwarmDiscovery:
+    """
+    Active swarm discovery for peers that never connect to us.
+    Every monitored infohash is swept periodically with a DHT get_peers lookup, a tracker
+    re-announce and a scrape. Sweeps are spread over time by a token bucket, so thousands
+    of infohashes never burst the DHT or the trackers.
+    """
+    def __init__(self, session, rate=2.0, interval=900, logger=None, on_peers=None):
+        self.session = session
+        self.rate = rate
+        self.interval = interval
+        self.logger = logger or logging.getLogger('TorrentTracker')
+        self.on_peers = on_peers
+        self._queue = collections.deque()
+        self._tokens = 0.0
+        self._last_refill = time.time()
+
+    def add(self, handle):
+        """
+        Schedule a handle; new handles are staggered so they do not all sweep at once.
+        """
+        due = time.time() + len(self._queue) / self.rate
+        self._queue.append((due, handle))
+
+    def tick(self, now=None):
+        """
+        Run the sweeps that are due and allowed by the rate limit. Returns the number run.
+        """
+        now = now or time.time()
+        # A whole poll cycle may pass between ticks, so the bucket holds up to a minute's worth
+        self._tokens = min(max(1.0, self.rate * 60), self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+        swept = 0
+        while self._queue and self._tokens >= 1 and self._queue[0][0] <= now:
+            _, handle = self._queue.popleft()
+            if not handle.is_valid():
+                continue
+            try:
+                self.session.dht_get_peers(handle.info_hash())
+                handle.force_reannounce()
+                handle.scrape_tracker()
+            except Exception as e:
+                self.logger.debug(f"Discovery sweep failed: {e}")
+            self._queue.append((now + self.interval, handle))
+            self._tokens -= 1
+            swept += 1
+        return swept
+
+    def handle_alert(self, alert):
+        what = alert.what()
+        if what == 'dht_get_peers_reply':
+            peers = alert.peers()
+            self.logger.debug("DHT returned %d peers for %s", len(peers), alert.info_hash)
+            if self.on_peers and peers:
+                self.on_peers(str(alert.info_hash), peers, 'dht')
+        elif what == 'scrape_reply':
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Scrape for %s: %d seeds, %d peers", alert.handle.status().name, alert.complete,
+                                  alert.incomplete)
+
+def interface_endpoints(address, port):
+    """
+    listen_interfaces value for one address or device on port and port + 1
+    (None: every IPv4 and IPv6 address).
+    """
+    if address is None:
+        hosts = ['0.0.0.0', '[::]']
+    else:
+        hosts = [f'[{address}]' if ':' in address else address]
+    return ','.join(f'{host}:{p}' for p in (port, port + 1) for host in hosts)
+
+class HandleGroup:
+    """
+    One torrent added to several sessions, used as a single handle.
+    Peers of every session are merged into one list, a peer connected to several sessions
+    counting once. Announces, scrapes, pause and resume go to every session; status, metadata
+    and other calls go to the first session's handle.
+    """
+    def __init__(self, handles):
+        self.handles = handles
+
+    def get_peer_info(self):
+        merged = {}
+        for handle in self.handles:
+            for peer_info in handle.get_peer_info():
+                merged.setdefault(tuple(peer_info.ip), peer_info)
+        return list(merged.values())
+
+    def is_valid(self):
+        return all(handle.is_valid() for handle in self.handles)
+
+    def force_reannounce(self, *args):
+        for handle in self.handles:
+            handle.force_reannounce(*args)
+
+    def scrape_tracker(self, *args):
+        for handle in self.handles:
+            handle.scrape_tracker(*args)
+
+    def pause(self, *args):
+        for handle in self.handles:
+            handle.pause(*args)
+
+    def resume(self):
+        for handle in self.handles:
+            handle.resume()
+
+    def __getattr__(self, name):
+        return getattr(self.handles[0], name)
+
+def peer_state(downloading_piece_index, progress):
+    """
+    Classify a peer as 'completed', 'stopped' or 'downloading'.
+    """
+    if downloading_piece_index == -1:
+        return 'completed' if progress == 1 else 'stopped'
+    return 'downloading'
 
-# Initialize Telegram client
-client = telethon.TelegramClient('session.session', api_id, api_hash)
+# Console colors for structured events; other records are printed as they are
+EVENT_COLORS = {'peer_completed': Fore.RED, 'peer_updated': Fore.GREEN}
+# LogRecord attributes that are not structured fields passed with extra=
+LOG_RECORD_ATTRS = frozenset(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+ANSI_RE = re.compile(r'\x1b\[[0-9;]*m')
 
-client.connect()
+class ConsoleFormatter(logging.Formatter):
+    """
+    Console lines as '<time> - <message>', colored by event type.
+    """
+    def __init__(self):
+        super().__init__('%(asctime)s - %(message)s')
 
-if not client.is_user_authorized():
-    client.send_code_request(phone)
+    def format(self, record):
+        line = super().format(record)
+        color = EVENT_COLORS.get(getattr(record, 'event', None))
+        return color + line + Style.RESET_ALL if color else line
 
-    try:
-        client.sign_in(phone, input('Enter the code: '))
-    except telethon.errors.SessionPasswordNeededError:
-        password = getpass.getpass("Password: ")
-        client.sign_in(password=password)
-
-def send_notification(recipient, peer_dict):
-    """
-    Send a notification message to a Telegram channel with peer information.
-    """
-    message = f"✔️ A connected peer has been detected from <code>{peer_dict['country']}</code>:\n"
-    message += f"IP: <code>{peer_dict['ip']}</code>\n"
-    message += f"Port: <code>{peer_dict['port']}</code>\n"
-    message += f"ISP: <code>{peer_dict['isp']}</code>\n"
-    message += f"City: <code>{peer_dict['city']}</code>\n"
-    message += f"Region: <code>{peer_dict['province']}</code>\n"
-    message += f"Client: <code>{peer_dict['client']}</code>\n"
-    message += f"Torrent: <code>{peer_dict['name']}</code>\n"
-    message += f"Infohash: <code>{peer_dict['infohash']}</code>\n"
-    message += f"First seen: <code>{peer_dict['first_seen']}</code>\n"
-    message += f"🔚\n"
+class JsonLinesFormatter(logging.Formatter):
+    """
+    One JSON object per record: time, level, message and the structured fields given with extra=.
+    """
+    def format(self, record):
+        entry = {'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+                 'level': record.levelname, 'message': ANSI_RE.sub('', record.getMessage())}
+        entry.update((key, value) for key, value in record.__dict__.items() if key not in LOG_RECORD_ATTRS)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to a QueueListener thread untouched, so message formatting and I/O happen
+    off the caller's thread (log arguments must not change after the call). When the queue
+    is full, records are dropped and counted instead of blocking the peer loop.
+    """
+    def __init__(self, records):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def configure_logging(logger, json_log=None, queue_size=10000, start=True):
+    """
+    Console output for logger, plus a JSON-lines file when json_log is set. With a JSON log,
+    both handlers run behind a LogQueueHandler, which is returned (stop its listener at exit).
+    With start=False the listener thread is left to the caller to start; records queue up
+    until then. Handlers left by a previous configuration (a restarted tracker) are replaced.
+    """
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        if isinstance(handler, LogQueueHandler):
+            handler.listener.stop()
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(ConsoleFormatter())
+    if not json_log:
+        logger.addHandler(console_handler)
+        return None
+    json_handler = logging.FileHandler(json_log, encoding='utf-8')
+    json_handler.setFormatter(JsonLinesFormatter())
+    handler = LogQueueHandler(queue.Queue(queue_size))
+    handler.listener = logging.handlers.QueueListener(handler.queue, console_handler, json_handler,
+                                                      respect_handler_level=True)
+    if start:
+        handler.listener.start()
+    logger.addHandler(handler)
+    return handler
+
+class EventThrottle:
+    """
+    Rate limit for high-volume log events: at most rate records of each event type per
+    interval seconds pass allow(); the rest are counted and reported in one line when the
+    window closes. Checked before logging, so throttled records are never even built.
+    """
+    def __init__(self, logger, rate=20, interval=10):
+        self.logger = logger
+        self.rate = rate
+        self.interval = interval
+        # event -> [window start, records allowed, records suppressed]
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def allow(self, event):
+        now = time.monotonic()
+        closed = None
+        with self._lock:
+            window = self._windows.get(event)
+            if window is None or now - window[0] >= self.interval:
+                closed = window
+                window = self._windows[event] = [now, 0, 0]
+            if window[1] < self.rate:
+                window[1] += 1
+                allowed = True
+            else:
+                window[2] += 1
+                allowed = False
+        if closed and closed[2]:
+            self._report(event, closed, now)
+        return allowed
+
+    def flush(self):
+        """
+        Report windows that closed without a later record of their event.
+        """
+        now = time.monotonic()
+        with self._lock:
+            closed = [(event, window) for event, window in self._windows.items()
+                      if window[2] and now - window[0] >= self.interval]
+            for event, _ in closed:
+                del self._windows[event]
+        for event, window in closed:
+            self._report(event, window, now)
+
+    def _report(self, event, window, now):
+        self.logger.info("%d %s messages suppressed in the last %.0fs", window[2], event, now - window[0],
+                         extra={'event': 'suppressed', 'suppressed_event': event, 'count': window[2]})
+
+class PollSummary:
+    """
+    Results of the polls of every collector, added up and logged as one poll_summary line
+    per interval seconds, so the summary volume does not grow with the number of torrents.
+    """
+    def __init__(self, logger, interval=30):
+        self.logger = logger
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._reset(time.monotonic())
+
+    def _reset(self, now):
+        self.started = now
+        self.polls = 0
+        self.torrents = set()
+        # updated, completed, unchanged, gone
+        self.counts = [0, 0, 0, 0]
+
+    def add(self, infohash, updated, completed, unchanged, gone):
+        with self._lock:
+            self.polls += 1
+            self.torrents.add(infohash)
+            for i, value in enumerate((updated, completed, unchanged, gone)):
+                self.counts[i] += value
+
+    def flush(self, force=False):
+        """
+        Log the totals once the interval is over (or now, with force) and start a new one.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self.started < self.interval:
+                return
+            started, polls, torrents, counts = self.started, self.polls, len(self.torrents), self.counts
+            self._reset(now)
+        if not polls:
+            return
+        updated, completed, unchanged, gone = counts
+        self.logger.info("%d peers updated in %d polls of %d torrents in the last %.0fs "
+                         "(%d completed, %d unchanged, %d gone)",
+                         updated, polls, torrents, now - started, completed, unchanged, gone,
+                         extra={'event': 'poll_summary', 'polls': polls, 'torrents': torrents, 'updated': updated,
+                                'completed': completed, 'unchanged': unchanged, 'gone': gone})
 
-    channel_id = -1001234567890  # Replace with your actual channel ID
-    entity = client.get_entity(channel_id)
-    client.send_message(entity, message, parse_mode='html')
+# Bulk loading: torrent adds in flight at once, parser threads (files parsed ahead are
+# twice that), and seconds between progress lines
+LOAD_BATCH = 500
+LOAD_PARSERS = 8
+LOAD_PROGRESS_INTERVAL = 5
 
 class TorrentTracker:
     def __init__(self, torrent_folder, output, geo, database, country=None, time_interval=30, 
-                 db_host='localhost', db_port=3306, db_user='root', db_password='', db_name='torrent_monitor'):
+                 db_host='localhost', db_port=3306, db_user='root', db_password='', db_name='torrent_monitor',
+                 ip_endpoints=None, ip_cache='public_ip.json', rules_file=None, spool_dir='spool',
+                 state_dir='state', resume_interval=300, discover=False, discovery_rate=2.0,
+                 discovery_interval=900, magnets=None, metadata_dir='metadata', parquet_dir=None,
+                 sketch_dir=None, workers=8, queue_size=10000, enrich_workers=0, geo_dir=DB_DIR,
+                 aggregator=None, aggregate=None, node_id=None, listen_port=6881,
+                 record=None, replay=None, replay_speed=1.0, heartbeat=300, delta_progress=0.05,
+                 interfaces=None, connections_limit=None, session_profile='default', user_agent_interval=600,
+                 blocklists=None, allowlists=None, retention_days=None, archive_dir=None, json_log=None,
+                 log_peer_rate=20):
+        self.logger = logging.getLogger('TorrentTracker') 
+        self.logger.setLevel(logging.INFO)
+        # The listener thread starts once the enrichment workers are forked
+        self.log_queue = configure_logging(self.logger, json_log, start=False)
+        # Per-peer lines are sampled; poll results are summed up in one line per poll interval
+        self.log_throttle = EventThrottle(self.logger, rate=log_peer_rate)
+        self.poll_summary = PollSummary(self.logger, interval=time_interval)
         self.torrent_folder = torrent_folder
+        self.magnets = magnets
+        self.metadata_dir = metadata_dir
+        self.magnet_queue = queue.Queue()
+        self.parquet_dir = parquet_dir
+        self.sketches = SketchStore(sketch_dir) if sketch_dir else None
+        self.workers = workers
+        self.queue_size = queue_size
+        self.handles = []
+        self.sources = []
+        self.collectors = None
+        self.torrent_files = []
+        # Torrents submitted with async_add_torrent, by infohash, until every session answered
+        self.pending_adds = {}
+        self.loaded = set()
+        self.load_failed = 0
+        self.seen_times = {}
+        self.notified_peers = set()
+        self.notifier = None
+        self.parquet = None
+        # Collector node: address of the aggregator that receives our observations
+        self.aggregator = aggregator
+        # Aggregator: address we accept collector nodes on
+        self.aggregate = aggregate
+        self.node_id = node_id or f"{socket.gethostname()}-{listen_port}"
+        self.last_slot = {}
+        self.duplicates = 0
+        self.recorder = PollRecorder(record) if record else None
+        # Last emitted (state, progress, time) per connected peer, by infohash; an unchanged
+        # peer is emitted again only after heartbeat seconds (0: every poll)
+        self.peer_state = {}
+        # PieceTracker per infohash
+        self.pieces = {}
+        self.heartbeat = heartbeat
+        self.delta_progress = delta_progress
+        # Replay: recorded polls are fed to the pipeline instead of live torrents
+        self.replay = replay
+        self.replay_speed = replay_speed
         self.output = output
         self.geo = geo
-        self.database = database
+        # database: the SQLite file of older versions, still accepted but unused (storage is MariaDB)
         self.country = country
+        self.geo_filter = GeoFilter.parse(country) if country else None
         self.time_interval = time_interval
         # Configurações do MariaDB
         self.db_host = db_host
@@ -76,109 +2844,235 @@ class TorrentTracker:
         self.db_user = db_user
         self.db_password = db_password
         self.db_name = db_name
+        self.spool_dir = spool_dir
         self.user_agents = ['uTorrent 3.5.5', 'BitTorrent 7.10.5', 'qBittorrent 4.3.6', 
                             'Transmission 3.00', 'Deluge 2.0.4', 'Vuze 5.7.7']
-        self.session_settings = {
+        # Settings from the profile, plus the ones owned by the tracker
+        self.profile = SessionProfile(session_profile)
+        self.session_settings = dict(self.profile.settings)
+        self.connections_limit = connections_limit
+        if connections_limit:
+            self.session_settings['connections_limit'] = connections_limit
+        self.session_settings.update({
             'user_agent': random.choice(self.user_agents),
-            'listen_interfaces': '0.0.0.0:6881,[::]:6881,0.0.0.0:6882,[::]:6882',
-            'download_rate_limit': 10000,
-            'upload_rate_limit': 0,
-            'connections_limit': 800,
-            'alert_mask': lt.alert.category_t.all_categories,
+            'listen_interfaces': interface_endpoints(None, listen_port),
             'outgoing_interfaces': '',
-            'announce_to_all_tiers': True,
-            'announce_to_all_trackers': True,
-            'auto_manage_interval': 5,
-            'auto_scrape_interval': 0,
-            'auto_scrape_min_interval': 0,
-            'max_failcount': 1,
-            'aio_threads': 8,
-            'checking_mem_usage': 2048,
-        }
+            'alert_mask': lt.alert.category_t.all_categories,
+        })
+        self.user_agent_interval = user_agent_interval
         
-        self.session = lt.session()
-        self.session.apply_settings(self.session_settings)
-        f = ip_filter()
-        f.add_rule("192.168.0.0", "192.168.255.255", 1)
-        f.add_rule("10.0.0.0", "10.255.255.255", 1)
-        f.add_rule("192.168.1.0", "192.168.1.255", 1)
-        f.add_rule("127.0.0.0", "127.0.0.255", 1)
-        self.session.set_ip_filter(f)
-        random_user_agent = random.choice(self.user_agents)
-        self.session_settings['user_agent'] = random_user_agent
-        self.session.apply_settings(self.session_settings) 
-        self.reader = geoip2.database.Reader('dbs/GeoLite2-City_20250926/GeoLite2-City.mmdb')
-        self.logger = logging.getLogger('TorrentTracker') 
-        self.logger.setLevel(logging.INFO)
-        formatter = logging.Formatter('%(asctime)s - %(message)s')
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        self.logger.addHandler(console_handler)
-        self.seen_peers = set()
+        self.resume_interval = resume_interval
+        # Created before the libtorrent session and the log listener, so enrichment workers
+        # fork from a process without running session or logging threads
+        try:
+            self.enricher = GeoEnricher(workers=enrich_workers, directory=geo_dir)
+        finally:
+            if self.log_queue:
+                self.log_queue.listener.start()
+        # Blocked peers are refused by libtorrent and dropped before enrichment
+        self.ip_filters = IPFilterList(blocklists, allowlists)
+        f = self.ip_filters.session_filter()
+        # One session per interface, each with its own connection budget, DHT node and state
+        # folder; every torrent joins all of them and their peers are merged by HandleGroup
+        self.sessions = []
+        self.stores = []
+        for i, interface in enumerate(interfaces or [None]):
+            store = SessionStore(state_dir if i == 0 else os.path.join(state_dir, f'session-{i}'))
+            session = store.create_session()
+            settings = dict(self.session_settings)
+            if interface is not None:
+                settings['listen_interfaces'] = interface_endpoints(interface, listen_port)
+                settings['outgoing_interfaces'] = interface
+            session.apply_settings(settings)
+            session.set_ip_filter(f)
+            self.sessions.append(session)
+            self.stores.append(store)
+        self.store = self.stores[0]
+        self.session = self.sessions[0]
+        self.own_ips = PublicIPResolver(ip_endpoints, ip_cache, logger=self.logger)
+        self.spool = None
+        self.retention_days = retention_days
+        self.archive_dir = archive_dir
+        self.retention = None
+        self.swarm_seen = {}
+        self.discovery = None
+        if discover:
+            self.discovery = SwarmDiscovery(self.session, discovery_rate, discovery_interval, 
+                                            logger=self.logger, on_peers=self.record_swarm_peers)
+        if rules_file:
+            self.alert_rules = AlertRules(path=rules_file, logger=self.logger)
+        else:
+            self.alert_rules = AlertRules.from_filter(self.geo_filter, logger=self.logger)
 
         init()
 
-    def add_torrent(self, torrent_path):
+    def prepare_torrent(self, torrent_path):
         """
-        Add a torrent file to the session.
+        Parse a torrent file and build its add_torrent_params for every session, plus the
+        transmission-show details stored in info_torrent. Blocking; runs in a loader thread.
         """
+        ti = lt.torrent_info(torrent_path)
         try:
-            random_user_agent = random.choice(self.user_agents)
-            self.session_settings['user_agent'] = random_user_agent
-            self.session.apply_settings(self.session_settings) 
-            handle = self.session.add_torrent({'ti': lt.torrent_info(torrent_path), 
-                                               'save_path': 'Downloads'})
-            return handle
+            result = subprocess.run(['transmission-show', torrent_path], capture_output=True)
+            details = result.stdout.decode('utf-8')
         except Exception as e:
-            self.logger.error(f"Error creating torrent handler for {torrent_path}: {e}")
-
-    def get_geo_info(self, ip):
-        """
-        Get geographical information for an IP address.
-        """
-        try:
-            response = self.reader.city(ip)
-            return {
-                'country': {
-                    'names': {'en': response.country.name},
-                    'iso_code': response.country.iso_code
-                },
-                'city': {
-                    'names': {'en': response.city.name}
-                },
-                'subdivisions': [
-                    {
-                        'names': {'en': subdivision.name}
-                    } for subdivision in response.subdivisions
-                ]
-            }
+            self.logger.error(f"Unable to obtain details of torrent file {torrent_path}: {e}")
+            details = None
+        return ti, details, [store.torrent_params(ti, 'Downloads') for store in self.stores]
+
+    def submit_torrent(self, source, ti, details, params):
+        """
+        Hand a parsed torrent to every session with async_add_torrent. The handles arrive as
+        add_torrent alerts, see torrent_added().
+        """
+        infohash = str(ti.info_hash())
+        if infohash in self.pending_adds or infohash in self.loaded:
+            self.logger.warning(f"Skipping {source}: infohash {infohash} is already tracked")
+            return False
+        self.pending_adds[infohash] = {'source': source, 'handles': [None] * len(self.sessions), 'answers': 0}
+        for session, atp in zip(self.sessions, params):
+            session.async_add_torrent(atp)
+        if self.spool and details is not None:
+            self.spool.append('info_torrent', (infohash, details))
+        return True
+
+    def torrent_added(self, index, alert):
+        """
+        add_torrent alert from session index: once every session answered, the torrent joins
+        self.handles and its collector starts.
+        """
+        try:
+            infohash = str(alert.handle.info_hash()) if alert.handle.is_valid() else str(alert.params.ti.info_hash())
+        except Exception:
+            return
+        pending = self.pending_adds.get(infohash)
+        if pending is None:
+            # Magnets are added synchronously and get their handle directly
+            return
+        if alert.error.value():
+            self.logger.error(f"The torrent file {pending['source']} cannot be added to the session: "
+                              f"{alert.error.message()}")
+        else:
+            pending['handles'][index] = alert.handle
+        pending['answers'] += 1
+        if pending['answers'] < len(self.sessions):
+            return
+        del self.pending_adds[infohash]
+        handles = pending['handles']
+        if None in handles:
+            # HandleGroup and request_state() need one handle per session: all or nothing
+            for session, handle in zip(self.sessions, handles):
+                if handle is not None:
+                    session.remove_torrent(handle)
+            self.load_failed += 1
+            return
+        handle = handles[0] if len(handles) == 1 else HandleGroup(handles)
+        self.loaded.add(infohash)
+        self.handles.append(handle)
+        self.sources.append(pending['source'])
+        if self.discovery:
+            self.discovery.add(handle)
+        if self.collectors is not None:
+            self.start_collector(handle, pending['source'])
+
+    async def load_torrents(self, torrent_files):
+        """
+        Bulk load torrent files: parse them in LOAD_PARSERS loader threads (kept apart from the
+        collector pool, so polls go on), submit each one with async_add_torrent as soon as it
+        is parsed, and log progress until every session answered. Files are only parsed a
+        little ahead of the submissions, and at most LOAD_BATCH adds are in flight, so neither
+        the parsed torrents nor the alert queue pile up.
+        """
+        loop = asyncio.get_running_loop()
+        started = last_report = loop.time()
+        total = len(torrent_files)
+        parser = concurrent.futures.ThreadPoolExecutor(LOAD_PARSERS, thread_name_prefix='Loader')
+
+        async def parse(f):
+            try:
+                return f, await loop.run_in_executor(parser, self.prepare_torrent,
+                                                     os.path.join(self.torrent_folder, f))
+            except Exception as e:
+                self.logger.error(f"The torrent file {f} is not valid or cannot be added to the session: {e}")
+                return f, None
+
+        files = iter(torrent_files)
+        parsing = set()
+        done = 0
+        try:
+            while True:
+                for f in itertools.islice(files, 2 * LOAD_PARSERS - len(parsing)):
+                    parsing.add(loop.create_task(parse(f)))
+                if not parsing:
+                    break
+                finished, parsing = await asyncio.wait(parsing, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    source, prepared = task.result()
+                    while len(self.pending_adds) >= LOAD_BATCH:
+                        self.handle_alerts()
+                        await asyncio.sleep(0.05)
+                    if prepared is None or not self.submit_torrent(source, *prepared):
+                        self.load_failed += 1
+                    done += 1
+                if loop.time() - last_report >= LOAD_PROGRESS_INTERVAL:
+                    self.logger.info(f"Loading torrents: {done}/{total} parsed, {len(self.loaded)} monitored, "
+                                     f"{self.load_failed} failed")
+                    last_report = loop.time()
+        finally:
+            for task in parsing:
+                task.cancel()
+            parser.shutdown(wait=False, cancel_futures=True)
+        while self.pending_adds:
+            self.handle_alerts()
+            await asyncio.sleep(0.05)
+        self.logger.info(f"Loaded {len(self.loaded)} of {total} torrent files in {loop.time() - started:.1f}s "
+                         f"({self.load_failed} failed), tracking {len(self.handles)} torrents")
+
+    def add_magnet(self, uri):
+        """
+        Add a magnet URI to the session. Peers are collected right away from DHT/trackers
+        while libtorrent fetches the metadata in the background.
+        """
+        infohash = magnet_infohash(uri)
+        if infohash is None:
+            self.logger.error(f"Not a valid magnet URI or infohash: {uri}")
+            return None, None
+        try:
+            metadata_path = os.path.join(self.metadata_dir, f"{infohash}.torrent") if self.metadata_dir else None
+            handles = [session.add_torrent(store.magnet_params(uri, infohash, 'Downloads', metadata_path))
+                       for session, store in zip(self.sessions, self.stores)]
+            return (handles[0] if len(handles) == 1 else HandleGroup(handles)), infohash
         except Exception as e:
-            self.logger.error(f"Error getting geo info for {ip}: {e}")
-            return None
+            self.logger.error(f"Error creating torrent handler for {uri}: {e}")
+            return None, None
 
-    def get_isp_info(self, ip):
+    def cache_metadata(self, handle):
         """
-        Get ISP information for an IP address.
+        Save metadata fetched for a magnet as a .torrent file, reused on the next start.
         """
+        if not self.metadata_dir:
+            return
         try:
-            # Criar um leitor para a base ASN
-            asn_reader = geoip2.database.Reader('dbs/GeoLite2-ASN_20250929/GeoLite2-ASN.mmdb')
-            response = asn_reader.asn(ip)
-            asn_reader.close()
-            
-            return {
-                'autonomous_system_organization': response.autonomous_system_organization,
-                'autonomous_system_number': response.autonomous_system_number
-            }
+            ti = handle.torrent_file()
+            os.makedirs(self.metadata_dir, exist_ok=True)
+            path = os.path.join(self.metadata_dir, f"{ti.info_hash()}.torrent")
+            write_file_atomic(path, lt.bencode(lt.create_torrent(ti).generate()))
+            self.logger.info(f"Metadata received for {ti.name()}, cached in {path}")
         except Exception as e:
-            self.logger.error(f"Error getting ISP info for {ip}: {e}")
-            return 'N/A'
+            self.logger.error(f"Could not cache metadata: {e}")
 
-    def format_time(self, timestamp):
+    def read_magnets(self, source):
         """
-        Format a timestamp to a readable string.
+        Queue magnet URIs/infohashes read line by line from a file or '-' for stdin.
         """
-        return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S %Z')
+        stream = sys.stdin if source == '-' else open(source)
+        with stream:
+            for line in stream:
+                uri = to_magnet(line)
+                if uri:
+                    self.magnet_queue.put(uri)
+                elif line.strip() and not line.lstrip().startswith('#'):
+                    self.logger.warning(f"Ignoring input line, not a magnet URI or infohash: {line.strip()}")
 
     def remove_prefix(self, ip):
         """
@@ -189,77 +3083,101 @@ class TorrentTracker:
         else:
             return ip
 
-    def main(self):
+    def apply_settings(self, settings):
         """
-        Main method to run the torrent tracker.
+        Apply a partial settings pack to every session at runtime.
         """
-        if os.path.exists('notified_peers.txt'):
-            os.remove('notified_peers.txt')
-
-        try:
-            with open('notified_peers.txt', 'w') as f:
-                pass
-            self.logger.info("File 'notified_peers.txt' created successfully.")
-        except Exception as e:
-            self.logger.error(f"Error creating 'notified_peers.txt' file: {e}")
-        
-        fieldnames = ['ip', 'port', 'isp', 'client', 'countryISO', 'country', 'city', 'region', 'province',
-                      'first_seen', 'last_seen', 'torrent', 'name', 'infohash', 'total_size', 
-                      'num_pieces', 'piece_size', 
-                      'downloaded_pieces', 
-                      'download_speed', 
-                      'upload_speed',
-                      'num_seeds',
-                      'num_peers',
-                      'estimated_time',
-                      'state'
-                      ]  
-        
-        if not os.path.exists(self.torrent_folder): 
-            self.logger.error(f"The folder {self.torrent_folder} does not exist or cannot be read.")
-            exit(1) 
-        
-        torrent_files = [f for f in os.listdir(self.torrent_folder) if f.endswith('.torrent')]
-        
-        if not torrent_files:
-            self.logger.warning(f"The folder {self.torrent_folder} is empty. There are no torrent files to track.")
-            exit(1) 
-
-        handles = []
-        for f in torrent_files:
+        self.session_settings.update(settings)
+        for session in self.sessions:
             try:
-                handle = self.add_torrent(os.path.join(self.torrent_folder, f))
-                handles.append(handle)
+                session.apply_settings(settings)
             except Exception as e:
-                self.logger.error(f"The torrent file {f} is not valid or cannot be added to the session: {e}")
+                self.logger.error(f"Could not apply session settings {sorted(settings)}: {e}")
 
-        self.handles = handles  # Expor handles para acesso externo
-        self.logger.info(f'Starting to track {len(handles)} torrents') 
-        
-        if self.output:
-            if not os.path.exists(f"{self.output}.csv"): 
-                try:
-                    with open(f"{self.output}.csv", 'a+', newline='') as f:
-                        writer = csv.DictWriter(f, fieldnames=fieldnames)
-                        writer.writeheader()
-                except Exception as e:
-                    self.logger.error(f"The output path {self.output}.csv is not valid or cannot be written to: {e}")
-                    exit(1) 
-            else:
-                f = open(f"{self.output}.csv", 'a+', newline='') 
-            
-            # Conectar ao MariaDB
-            conn = pymysql.connect(
-                host=self.db_host,
-                port=self.db_port,
-                user=self.db_user,
-                password=self.db_password,
-                database=self.db_name,
-                charset='utf8mb4',
-                cursorclass=pymysql.cursors.DictCursor
-            )
-            cur = conn.cursor() 
+    def reload_ip_filter(self):
+        """
+        Recompile changed block/allow lists and hand the new filter to every session.
+        Blocking for large lists; runs off the event loop.
+        """
+        if self.ip_filters.maybe_reload():
+            f = self.ip_filters.session_filter()
+            for session in self.sessions:
+                session.set_ip_filter(f)
+
+    def rotate_user_agent(self):
+        """
+        Switch every session to another user agent, touching no other setting.
+        """
+        self.apply_settings({'user_agent': random.choice(self.user_agents)})
+
+    def handle_alerts(self):
+        """
+        Drain pending libtorrent alerts and dispatch the ones the tracker uses.
+        """
+        for index, (session, store) in enumerate(zip(self.sessions, self.stores)):
+            for alert in session.pop_alerts():
+                if alert.what() == 'add_torrent':
+                    self.torrent_added(index, alert)
+                self.own_ips.handle_alert(alert)
+                store.handle_alert(alert)
+                if self.discovery:
+                    self.discovery.handle_alert(alert)
+                if alert.what() == 'metadata_received':
+                    self.cache_metadata(alert.handle)
+
+    def record_swarm_peers(self, infohash, endpoints, source):
+        """
+        Record endpoints seen in a swarm without a connection (DHT replies).
+        Each endpoint is written again at most once per discovery interval.
+        """
+        now = time.time()
+        today = datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%d %H:%M:%S %Z")
+        for ip, port in endpoints:
+            ip = self.remove_prefix(ip)
+            if ip in self.own_ips or ip in self.ip_filters:
+                continue
+            key = (ip, port, infohash)
+            last = self.swarm_seen.get(key)
+            if last is not None and now - last < self.discovery.interval:
+                continue
+            self.swarm_seen[key] = now
+            if self.spool:
+                self.spool.append('swarm_table', (ip, port, infohash, source, today, today))
+
+    def save_state(self, timeout=10):
+        """
+        Persist session state and resume data for every handle, waiting up to timeout
+        seconds for libtorrent to hand over the resume data.
+        """
+        self.request_state()
+        deadline = time.time() + timeout
+        while any(store.outstanding > 0 for store in self.stores) and time.time() < deadline:
+            for session, store in zip(self.sessions, self.stores):
+                if store.outstanding > 0:
+                    session.wait_for_alert(500 // len(self.sessions))
+            self.handle_alerts()
+        for store in self.stores:
+            store.outstanding = 0
+            store.flush()
+
+    def request_state(self):
+        """
+        Save the state of every session and ask for the resume data of its torrents,
+        which arrives as alerts and is written by handle_alerts().
+        """
+        for i, (session, store) in enumerate(zip(self.sessions, self.stores)):
+            store.save_session(session)
+            store.request_resume_data([handle.handles[i] if isinstance(handle, HandleGroup) else handle
+                                       for handle in self.handles])
+
+    def connect_db(self):
+        """
+        Open a MariaDB connection and make sure the report tables exist.
+        """
+        conn = connect_mariadb(self.db_host, self.db_port, self.db_user, self.db_password, self.db_name)
+        with conn.cursor() as cur:
             cur.execute("""CREATE TABLE IF NOT EXISTS report_table (
+                id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
                 ip VARCHAR(50),
                 port INTEGER,
                 isp TEXT,
@@ -283,45 +3201,170 @@ class TorrentTracker:
                 num_seeds INTEGER,
                 num_peers INTEGER,
                 estimated_time VARCHAR(50),
-                state VARCHAR(50)
+                state VARCHAR(50),
+                geo_db VARCHAR(20),
+                completed_at VARCHAR(50),
+                KEY last_seen_idx (last_seen)
             )""")
+            cur.execute("ALTER TABLE report_table ADD COLUMN IF NOT EXISTS geo_db VARCHAR(20)")
+            cur.execute("ALTER TABLE report_table ADD COLUMN IF NOT EXISTS completed_at VARCHAR(50)")
             cur.execute("""CREATE TABLE IF NOT EXISTS info_torrent (
                 torrent_infohash VARCHAR(100) PRIMARY KEY,
                 details TEXT
             )""")
-            conn.commit() 
+            cur.execute("""CREATE TABLE IF NOT EXISTS swarm_table (
+                ip VARCHAR(50),
+                port INTEGER,
+                infohash VARCHAR(100),
+                source VARCHAR(20),
+                first_seen VARCHAR(50),
+                last_seen VARCHAR(50),
+                PRIMARY KEY (ip, port, infohash)
+            )""")
+            cur.execute("""CREATE TABLE IF NOT EXISTS daily_peer_table (
+                day DATE,
+                infohash VARCHAR(100),
+                ip VARCHAR(50),
+                port INTEGER,
+                country VARCHAR(100),
+                asn INTEGER,
+                isp VARCHAR(255),
+                client VARCHAR(255),
+                PRIMARY KEY (day, infohash, ip, port),
+                KEY (infohash, day)
+            )""")
+            cur.execute("""CREATE TABLE IF NOT EXISTS daily_session_table (
+                day DATE,
+                infohash VARCHAR(100),
+                ip VARCHAR(50),
+                port INTEGER,
+                client VARCHAR(255),
+                country VARCHAR(100),
+                isp TEXT,
+                first_seen VARCHAR(50),
+                last_seen VARCHAR(50),
+                observations INTEGER,
+                num_pieces INTEGER,
+                max_downloaded_pieces INTEGER,
+                state VARCHAR(50),
+                completed_at VARCHAR(50),
+                PRIMARY KEY (day, infohash, ip, port),
+                KEY (infohash, day)
+            )""")
+            cur.execute("""CREATE TABLE IF NOT EXISTS daily_completion_table (
+                day DATE,
+                infohash VARCHAR(100),
+                ip VARCHAR(50),
+                port INTEGER,
+                country VARCHAR(100),
+                PRIMARY KEY (day, infohash, ip, port),
+                KEY (infohash, day)
+            )""")
+        conn.commit()
+        return conn
 
-        seen_times = {}
+    def main(self):
+        """
+        Main method to run the torrent tracker.
+        """
+        # Kept across restarts, so already notified peers are not announced again
+        try:
+            with open('notified_peers.txt', 'a') as f:
+                pass
+        except Exception as e:
+            self.logger.error(f"Error creating 'notified_peers.txt' file: {e}")
+        
+        torrent_files = []
+        if self.torrent_folder:
+            if not os.path.exists(self.torrent_folder): 
+                self.logger.error(f"The folder {self.torrent_folder} does not exist or cannot be read.")
+                exit(1) 
+            
+            torrent_files = [f for f in os.listdir(self.torrent_folder) if f.endswith('.torrent')]
 
-        if self.output:
-            cur.execute("SELECT ip, port, infohash, first_seen FROM report_table")
-            for row in cur.fetchall():
-                ip = row['ip']
-                port = row['port']
-                infohash = row['infohash']
-                first_seen = row['first_seen']
-                seen_times[(ip, port, infohash)] = {'first_seen': first_seen, 'last_seen': first_seen}
-
-        response = requests.get('http://ifconfig.me') 
-        if response.status_code == 200: 
-            my_ip = response.text
-            self.logger.info(f"Working with IP \033[30;47m{Fore.YELLOW + Style.BRIGHT + my_ip + Style.RESET_ALL}\033[0m. This IP address will not be saved in the database.") 
-        else:
-            self.logger.error(f"Unable to obtain public IP. Status code: {response.status_code}")
+        if self.magnets == '-':
+            # stdin is a stream: magnets keep arriving while we monitor
+            threading.Thread(target=self.read_magnets, args=('-',), name='MagnetReader', daemon=True).start()
+        elif self.magnets:
+            try:
+                self.read_magnets(self.magnets)
+            except OSError as e:
+                self.logger.error(f"The magnet list {self.magnets} cannot be read: {e}")
+                exit(1)
+        
+        if (not torrent_files and self.magnet_queue.empty() and self.magnets != '-' and not self.aggregate
+                and not self.replay):
+            self.logger.warning(f"The folder {self.torrent_folder} is empty. There are no torrent files to track.")
             exit(1) 
 
-        for f in torrent_files: 
+        # Loaded in the background by run(); handles and sources (name stored in the 'torrent'
+        # column: .torrent file name, or infohash for magnets) fill up as torrents are added
+        self.torrent_files = torrent_files
+        self.logger.info(f'Loading {len(torrent_files)} torrent files') 
+        
+        if self.aggregator:
+            # Collector node: storage and notifications belong to the aggregator
+            self.spool = AggregatorLink(self.aggregator, self.node_id, logger=self.logger)
+        elif self.output:
+            if os.path.exists(f"{self.output}.csv"):
+                with open(f"{self.output}.csv", newline='') as f:
+                    header = next(csv.reader(f), None)
+                if header and tuple(header) != PEER_FIELDS:
+                    # Written with older columns: keep it aside instead of mixing row layouts
+                    old_csv = f"{self.output}-{datetime.now():%Y%m%d%H%M%S}.csv"
+                    os.rename(f"{self.output}.csv", old_csv)
+                    self.logger.warning(f"{self.output}.csv has older columns, moved to {old_csv}")
+            new_csv = not os.path.exists(f"{self.output}.csv")
+            try:
+                self.csv_file = open(f"{self.output}.csv", 'a+', newline='')
+                self.csv_writer = csv.writer(self.csv_file)
+                if new_csv:
+                    self.csv_writer.writerow(PEER_FIELDS)
+                    self.csv_file.flush()
+            except Exception as e:
+                self.logger.error(f"The output path {self.output}.csv is not valid or cannot be written to: {e}")
+                exit(1) 
+            
+
+            # Rows reach MariaDB through the spool, so the loop keeps running during outages
+            self.spool = PeerSpool(self.spool_dir, self.connect_db, logger=self.logger)
+            self.spool.start()
+            if self.retention_days:
+                self.retention = RetentionJob(self.connect_db, self.retention_days, self.archive_dir, logger=self.logger)
+                self.retention.start()
+
+        self.seen_times = {}
+
+        if self.output:
             try:
-                result = subprocess.run(['transmission-show', os.path.join(self.torrent_folder, f)], capture_output=True) 
-                details = result.stdout.decode('utf-8') 
-                infohash = lt.torrent_info(os.path.join(self.torrent_folder, f)).info_hash() 
-                if self.output:
-                    cur.execute("INSERT IGNORE INTO info_torrent (torrent_infohash, details) VALUES (%s, %s)", (str(infohash), details)) 
-                    conn.commit() 
+                conn = self.connect_db()
+                with conn.cursor() as cur:
+                    cur.execute("SELECT ip, port, infohash, first_seen FROM report_table")
+                    for row in cur.fetchall():
+                        ip = row['ip']
+                        port = row['port']
+                        infohash = row['infohash']
+                        first_seen = row['first_seen']
+                        self.seen_times[(ip, port, infohash)] = {'first_seen': first_seen, 'last_seen': first_seen}
+                conn.close()
             except Exception as e:
-                self.logger.error(f"Unable to obtain details of torrent file {f}: {e}")
+                self.logger.warning(f"Unable to load first-seen times from MariaDB, starting empty: {e}")
 
-        notified_peers = set()
+        # Own addresses are resolved in the background; startup does not wait for them
+        self.own_ips.start()
+        self.enricher.start()
+
+        self.add_queued_magnets()
+
+        self.parquet = None
+        if self.parquet_dir:
+            try:
+                self.parquet = ParquetSink(self.parquet_dir, logger=self.logger)
+            except RuntimeError as e:
+                self.logger.error(str(e))
+                exit(1)
+
+        self.notified_peers = set()
 
         try:
             with open('notified_peers.txt', 'r+') as f: 
@@ -336,191 +3379,48 @@ class TorrentTracker:
                                 f.write(line2) 
                         f.truncate() 
                         f.write(','.join(str(x) for x in peer_tuple) + '\n') 
-                    notified_peers.add(peer_tuple)
-                if peer_tuple not in notified_peers:
+                    self.notified_peers.add(peer_tuple)
+                if peer_tuple not in self.notified_peers:
                     f.write(','.join(str(x) for x in peer_tuple))
 
         except FileNotFoundError:
             self.logger.info("The notified peers file does not exist. A new one will be created.")
 
+        if not self.replay and not self.aggregator:
+            # Collector nodes alert through the aggregator; replays never alert
+            notifier = TelegramNotifier(api_id, api_hash, phone, channel_id, logger=self.logger)
+            try:
+                notifier.start()
+                self.notifier = notifier
+            except Exception as e:
+                self.logger.error(f"Unable to connect to Telegram, alerts will not be sent: {e}")
+
         try:
-            while True:
-                for i, handle in enumerate(handles):
-                    status = handle.status()
-
-                    self.logger.debug(f"Processing torrent {status.name} - {status.progress * 100:.2f}% completed")
-
-                    peers = handle.get_peer_info()
-                    today = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S %Z")
-                    if peers:
-                        peer_dict = {}
-                        for peer_info in peers:
-                            ip, port = peer_info.ip
-                            ip = self.remove_prefix(ip)
-
-                            if ip == my_ip:
-                                continue
-                            
-                            infohash = handle.info_hash()
-
-                            if self.output:
-                                cur.execute("SELECT max(first_seen) as max_first_seen FROM report_table WHERE ip = %s AND port = %s AND infohash = %s", (ip, port, str(infohash))) 
-                                result = cur.fetchone()
-                                if result and result['max_first_seen']: 
-                                    first_seen = result['max_first_seen'] 
-                                else:
-                                    first_seen = today
-                            else:
-                                first_seen = today 
-                            try:
-                                client = peer_info.client
-                            except UnicodeDecodeError:
-                                client = 'Unknown'
-                            if not client: 
-                                client = 'unknown' 
-                            peer_tuple = (ip, port, client, infohash, first_seen)
-
-                            max_retries = 2
-                            retries = 0
-                            while retries < max_retries:
-                                try:
-                                    geo_info = self.get_geo_info(ip)
-                                    country = geo_info['country']['names']['en']
-                                    country_iso = geo_info['country']['iso_code']
-                                    city = geo_info['city']['names']['en'] if 'city' in geo_info else ''
-
-                                    if 'subdivisions' in geo_info:
-                                        if len(geo_info['subdivisions']) > 1:
-                                            region = geo_info['subdivisions'][0]['names']['en']
-                                            province = geo_info['subdivisions'][1]['names']['en']
-                                        elif len(geo_info['subdivisions']) == 1:
-                                            region = geo_info['subdivisions'][0]['names']['en']
-                                            province = ''
-                                    else:
-                                        region = ''
-                                        province = ''
-                                    break
-                                except TypeError:
-                                    retries += 1
-                                    self.logger.warning(f"Unable to get geographic information for IP {ip}. Retrying... ({retries}/{max_retries})")
-                            else:
-                                self.logger.error(f"Unable to get geographic information for IP {ip} after {max_retries} attempts.")
-                                country = 'N/A'
-                                country_iso = 'N/A'
-                                city = 'N/A'
-                                region = 'N/A'
-                                province = 'N/A'
-
-                            isp_info = self.get_isp_info(ip)
-                            if isinstance(isp_info, dict):
-                                isp = isp_info.get('autonomous_system_organization', 'N/A')
-                            else:
-                                isp = isp_info
-
-                            try:
-                                client = peer_info.client
-                            except UnicodeDecodeError:
-                                client = 'Unknown'
-                            infohash = handle.info_hash()
-                            total_size = handle.torrent_file().total_size()
-                            num_pieces = handle.torrent_file().num_pieces()
-                            piece_size = handle.torrent_file().piece_length()
-                            downloaded_pieces = peer_info.downloading_piece_index
-
-                            progress = peer_info.progress
-                            if downloaded_pieces == -1 and progress == 1:
-                                peer_dict['downloaded_pieces'] = downloaded_pieces
-                                peer_dict['state'] = 'completed'
-                            elif downloaded_pieces == -1 and progress < 1:
-                                peer_dict['downloaded_pieces'] = downloaded_pieces
-                                peer_dict['state'] = 'stopped'
-                            else:
-                                peer_dict['downloaded_pieces'] = downloaded_pieces
-                                peer_dict['state'] = 'downloading'
-
-                            download_speed = peer_info.payload_down_speed
-                            upload_speed = peer_info.payload_up_speed
-
-                            num_seeds = status.num_seeds
-                            num_peers = status.num_peers
-
-                            if download_speed > 0:
-                                estimated_time_seconds = (total_size - downloaded_pieces * piece_size) / download_speed
-                                estimated_time_string = time.strftime('%H:%M:%S', time.gmtime(estimated_time_seconds))
-                            else:
-                                estimated_time_string = 'infinite'
-
-                            torrent_name = handle.torrent_file().name()
-
-                            peer_dict = {
-                                'ip': ip, 'port': port, 'isp': isp, 'client': client, 'countryISO': country_iso,
-                                'country': country, 'city': city, 'region': region, 'province': province,
-                                'first_seen': first_seen, 
-                                'last_seen': today, 'torrent': torrent_files[i], 'name': torrent_name, 
-                                'infohash': str(infohash), 
-                                'total_size': total_size, 'num_pieces': num_pieces,
-                                'piece_size': piece_size, 'downloaded_pieces': downloaded_pieces,
-                                'download_speed': download_speed, 
-                                'upload_speed': upload_speed,
-                                'num_seeds': num_seeds,
-                                'num_peers': num_peers,
-                                'estimated_time': estimated_time_string,
-                                'state': peer_dict['state']
-                            }
-
-                            if (ip, port, str(infohash)) in seen_times:
-                                peer_dict['first_seen'] = seen_times[(ip, port, str(infohash))]['first_seen']
-                            else:
-                                seen_times[(ip, port, str(infohash))] = {'first_seen': today, 'last_seen': today}
-                                peer_dict['first_seen'] = today
-                                peer_dict['last_seen'] = today
-
-                            if self.country and country == self.country:
-                                peer_tuple = (ip, port, client, infohash, first_seen)
-                                if peer_tuple not in notified_peers:
-                                    with open('notified_peers.txt', 'r') as f:
-                                        peer_string = ','.join(str(x) for x in peer_tuple)
-                                        if peer_string in f.read():
-                                            pass
-                                        else:
-
-                                            # This section would contain sensitive or custom logic
-                                            # It has been removed for privacy and security reasons
-                                            # You can implement your own custom logic here
-
-                                            try:
-                                                self.logger.info(f"Notification sent via Telegram.")
-                                                send_notification(recipient, peer_dict)
-
-                                                # Additional custom logic can be implemented here
-                                                # This section has been removed for privacy and security reasons
-
-                                            except Exception as e:
-                                                self.logger.error(f"Error sending Telegram notification: {e}")
-                                            notified_peers.add(peer_tuple)
-                                            with open('notified_peers.txt', 'a') as f:
-                                                f.write(','.join(str(x) for x in peer_tuple) + '\n')
-
-                            if self.country is None or country == self.country:
-                                if self.output:
-                                    with open(f"{self.output}.csv", 'a+', newline='') as f:
-                                        writer = csv.DictWriter(f, fieldnames=fieldnames)
-                                        writer.writerow(peer_dict)
-                                    cur.execute("INSERT INTO report_table VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", list(peer_dict.values())) 
-                                    conn.commit() 
-
-                                if downloaded_pieces == -1:
-                                    self.logger.info(Fore.RED + f"Peer {Fore.BLUE + ip + Fore.RED} has completed downloading the torrent {torrent_name}. The peer is in the province of {Fore.BLUE + province + Fore.RED}." + Style.RESET_ALL)
-                                else:
-                                    self.logger.info(Fore.GREEN + f"New data inserted for peer {Fore.BLUE + ip + Fore.GREEN} and torrent {torrent_name}. The peer is in the province of {Fore.BLUE + province + Fore.GREEN} and has downloaded {downloaded_pieces} out of {num_pieces} pieces. The download speed is {download_speed} bytes per second and the estimated time to complete the download is {estimated_time_string}." + Style.RESET_ALL)
-
-                time.sleep(self.time_interval)
-                
+            asyncio.run(self.run())
         except KeyboardInterrupt:
+            pass
+        finally:
             self.logger.info("\nCleaning up")
-            if self.output:
-                f.close()
-                conn.close() 
+            self.own_ips.stop()
+            if self.notifier:
+                self.notifier.stop()
+            if self.recorder:
+                self.recorder.close()
+            self.enricher.close()
+            self.save_state()
+            for store in self.stores:
+                store.close()
+            if self.parquet:
+                self.parquet.close()
+            if self.sketches:
+                self.sketches.flush()
+            if self.aggregator:
+                self.spool.stop()
+            if self.retention:
+                self.retention.stop()
+            if self.output and not self.aggregator:
+                self.csv_file.close()
+                self.spool.stop()
                 download_path = 'Downloads' 
                 try:
                     for root, dirs, files in os.walk(download_path):
@@ -533,7 +3433,6 @@ class TorrentTracker:
                     self.logger.error(f"Could not delete content of 'Downloads' folder: {e}")
 
             if self.geo:
-                self.reader.close()
                 download_path = 'Downloads' 
                 try:
                     for root, dirs, files in os.walk(download_path):
@@ -545,18 +3444,751 @@ class TorrentTracker:
                 except Exception as e:
                     self.logger.error(f"Could not delete content of 'Downloads' folder: {e}")
 
+            self.poll_summary.flush(force=True)
+            if self.log_queue:
+                if self.log_queue.dropped:
+                    self.logger.warning(f"{self.log_queue.dropped} log records were dropped with the log queue full")
+                self.log_queue.listener.stop()
+
+    def add_queued_magnets(self):
+        """
+        Add magnets waiting in magnet_queue and start collecting their peers.
+        """
+        added = 0
+        while not self.magnet_queue.empty():
+            uri = self.magnet_queue.get_nowait()
+            handle, infohash = self.add_magnet(uri)
+            if handle is None:
+                continue
+            self.handles.append(handle)
+            self.sources.append(infohash)
+            if self.discovery:
+                self.discovery.add(handle)
+            if self.spool:
+                self.spool.append('info_torrent', (infohash, uri))
+            if self.collectors is not None:
+                self.start_collector(handle, infohash)
+            added += 1
+        if added:
+            self.logger.info(f'Added {added} magnets, tracking {len(self.handles)} torrents')
+
+    def collect_peers(self, handle, source, now=None):
+        """
+        Poll one torrent: read its peers, drop excluded ones, enrich the rest and build
+        their records. Blocking (libtorrent and MMDB calls); runs in the collector pool.
+        now replaces the current time when replaying a recorded poll.
+        """
+        status = handle.status()
+
+        self.logger.debug("Processing torrent %s - %.2f%% completed", status.name, status.progress * 100)
+
+        peers = handle.get_peer_info()
+        now = now or datetime.now(timezone.utc)
+        if self.recorder:
+            # Same timestamp as the rows, so a replay rebuilds them exactly
+            self.recorder.record(source, handle, status, peers, now.timestamp())
+        today = now.strftime("%Y-%m-%d %H:%M:%S %Z")
+        observations = []
+        infohash = str(handle.info_hash())
+        if not peers:
+            self.peer_state.pop(infohash, None)
+            self.pieces.pop(infohash, None)
+            return observations
+        if status.has_metadata:
+            torrent_file = handle.torrent_file()
+            total_size = torrent_file.total_size()
+            num_pieces = torrent_file.num_pieces()
+            piece_size = torrent_file.piece_length()
+            torrent_name = torrent_file.name()
+        else:
+            # Magnet still fetching metadata: peers are recorded without sizes
+            total_size = num_pieces = piece_size = 0
+            torrent_name = status.name or infohash
+        num_seeds = status.num_seeds
+        num_peers = status.num_peers
+        # Without metadata the piece count is unknown and libtorrent's progress is used instead
+        tracker = None
+        if num_pieces:
+            tracker = self.pieces.get(infohash)
+            if tracker is None or tracker.num_pieces != num_pieces:
+                tracker = self.pieces[infohash] = PieceTracker(num_pieces)
+        entries = {}
+        # Drop our own addresses, peers unchanged since they were last emitted and, when
+        # filtering, peers outside the wanted countries/ASNs before any enrichment or storage
+        timestamp = now.timestamp()
+        previous = self.peer_state.get(infohash, {})
+        current = {}
+        wanted = []
+        for peer_info in peers:
+            ip = self.remove_prefix(peer_info.ip[0])
+            if ip in self.own_ips or ip in self.ip_filters:
+                continue
+            key = (ip, peer_info.ip[1])
+            if tracker:
+                entry = entries[key] = tracker.update(key, peer_info, timestamp)
+                state = tracker.state(entry, timestamp)
+                progress = entry.count / num_pieces
+            else:
+                state = peer_state(peer_info.downloading_piece_index, peer_info.progress)
+                progress = peer_info.progress
+            last = previous.get(key)
+            if (self.heartbeat and last is not None and last[0] == state
+                    and abs(progress - last[1]) < self.delta_progress and timestamp - last[2] < self.heartbeat):
+                current[key] = last
+                continue
+            if self.geo_filter and not self.geo_filter.matches(self.enricher, ip):
+                continue
+            current[key] = (state, progress, timestamp)
+            wanted.append(peer_info)
+        self.peer_state[infohash] = current
+        if tracker:
+            tracker.retain(entries.keys())
+        geo_db, geo_records = self.enricher.enrich_peers(wanted)
+        completed = 0
+        for j, peer_info in enumerate(wanted):
+            ip, port = peer_info.ip
+            ip = self.remove_prefix(ip)
+
+            try:
+                client = peer_info.client
+            except UnicodeDecodeError:
+                client = 'Unknown'
+            if not client: 
+                client = 'unknown' 
+
+            geo = geo_records[j]
+            country = geo.country
+            country_iso = geo.country_iso
+            city = geo.city
+            region = geo.region
+            province = geo.province
+            isp = geo.isp
+
+            download_speed = peer_info.payload_down_speed
+            upload_speed = peer_info.payload_up_speed
+
+            # downloaded_pieces counts the pieces the peer has; the ETA comes from the rate at
+            # which its bitfield fills, not from our transfer speed with it
+            entry = entries.get((ip, port))
+            completed_at = None
+            peer_rate = 0
+            estimated_time_string = 'infinite'
+            if entry is not None:
+                downloaded_pieces = entry.count
+                state = tracker.state(entry, timestamp)
+                peer_rate = tracker.rate(entry) * piece_size
+                if entry.completed_at is not None:
+                    completed_at = datetime.fromtimestamp(entry.completed_at, timezone.utc).strftime("%Y-%m-%d %H:%M:%S %Z")
+                if state == 'completed':
+                    estimated_time_string = '00:00:00'
+                elif state == 'downloading' and peer_rate > 0:
+                    estimated_time_seconds = (num_pieces - entry.count) / tracker.rate(entry)
+                    estimated_time_string = time.strftime('%H:%M:%S', time.gmtime(estimated_time_seconds))
+            else:
+                downloaded_pieces = getattr(peer_info, 'num_pieces', 0)
+                state = peer_state(peer_info.downloading_piece_index, peer_info.progress)
+
+            seen_key = (ip, port, infohash)
+            if seen_key in self.seen_times:
+                first_seen = self.seen_times[seen_key]['first_seen']
+            else:
+                self.seen_times[seen_key] = {'first_seen': today, 'last_seen': today}
+                first_seen = today
+
+            record = PeerRecord(
+                ip, port, isp, client, country_iso,
+                country, city, region, province,
+                first_seen, today, source, torrent_name,
+                infohash,
+                total_size, num_pieces,
+                piece_size, downloaded_pieces,
+                download_speed,
+                upload_speed,
+                num_seeds,
+                num_peers,
+                estimated_time_string,
+                state,
+                geo_db,
+                completed_at
+            )
+
+            matched_rules = self.alert_rules.match(ip, country, country_iso, geo.asn, client, infohash)
+            observations.append(Observation(record, geo.asn, matched_rules))
+
+            if state == 'completed':
+                completed += 1
+                if self.log_throttle.allow('peer_completed'):
+                    self.logger.info("Peer %s has completed downloading the torrent %s. The peer is in the province of %s.",
+                                     ip, torrent_name, province,
+                                     extra={'event': 'peer_completed', 'ip': ip, 'port': port, 'infohash': infohash})
+            elif self.log_throttle.allow('peer_updated'):
+                self.logger.info("New data inserted for peer %s and torrent %s. The peer is in the province of %s and "
+                                 "has downloaded %s out of %s pieces. The peer downloads at about %.0f bytes per second "
+                                 "and the estimated time to complete the download is %s.",
+                                 ip, torrent_name, province, downloaded_pieces, num_pieces, peer_rate, estimated_time_string,
+                                 extra={'event': 'peer_updated', 'ip': ip, 'port': port, 'infohash': infohash,
+                                        'downloaded_pieces': downloaded_pieces, 'state': state})
+        gone = len(previous.keys() - current.keys())
+        unchanged = len(current) - len(wanted)
+        self.poll_summary.add(infohash, len(wanted), completed, unchanged, gone)
+        if (wanted or gone) and self.logger.isEnabledFor(logging.DEBUG) and self.log_throttle.allow('torrent_poll'):
+            self.logger.debug("%d peers updated for torrent %s (%d completed, %d unchanged, %d gone)",
+                              len(wanted), torrent_name, completed, unchanged, gone,
+                              extra={'event': 'torrent_poll', 'infohash': infohash, 'updated': len(wanted),
+                                     'completed': completed, 'unchanged': unchanged, 'gone': gone})
+        return observations
+
+    def store_batch(self, observations):
+        """
+        Write observations to every enabled output (CSV, spool, rollups, Parquet, sketches).
+        Runs on the single storage thread, so outputs are never written concurrently.
+        On a collector node, observations are sent to the aggregator instead.
+        """
+        if self.aggregator:
+            self.spool.send(observations)
+            self.spool.flush()
+            return
+        for record, asn, _ in observations:
+            ip = record.ip
+            port = record.port
+            infohash = record.infohash
+            country = record.country
+            if self.sketches:
+                # Bucketed by observation time, so replayed or relayed peers land in their own hour
+                seen = parse_time(record.last_seen)
+                self.sketches.add(infohash, country, f"{ip}:{port}", seen.timestamp() if seen else None)
+
+            row = record.as_row()
+            if self.parquet:
+                self.parquet.append(row)
+            if self.output:
+                self.csv_writer.writerow(row)
+                self.spool.append('report_table', row)
+                # Daily rollups get one row per peer per day
+                day = record.last_seen[:10]
+                if day != self.daily_day:
+                    self.daily_day = day
+                    self.daily_peers.clear()
+                    self.daily_completions.clear()
+                daily_key = (infohash, ip, port)
+                if daily_key not in self.daily_peers:
+                    self.daily_peers.add(daily_key)
+                    self.spool.append('daily_peer', (day, infohash, ip, port, country, asn, record.isp, record.client))
+                if record.state == 'completed' and daily_key not in self.daily_completions:
+                    self.daily_completions.add(daily_key)
+                    self.spool.append('daily_completion', (day, infohash, ip, port, country))
+
+        if self.output:
+            self.csv_file.flush()
+            self.spool.flush()
+        if self.parquet:
+            self.parquet.maybe_flush()
+        if self.sketches:
+            self.sketches.maybe_flush()
+
+    def notify(self, observation):
+        """
+        Send the Telegram notification for a peer that matched alert rules, once per peer.
+        Runs on the single notification thread.
+        """
+        record, _, matched_rules = observation
+        peer_tuple = (record.ip, record.port, record.client, record.infohash, record.first_seen)
+        peer_tuple = tuple(str(x) for x in peer_tuple)
+        if peer_tuple in self.notified_peers:
+            return
+        if self.replay:
+            # Replayed traffic must not alert anyone or mark real peers as notified
+            self.notified_peers.add(peer_tuple)
+            self.logger.info(f"Replay: alert for {record.ip} ({', '.join(matched_rules)}) not sent")
+            return
+
+        # This section would contain sensitive or custom logic
+        # It has been removed for privacy and security reasons
+        # You can implement your own custom logic here
+
+        if self.notifier is None:
+            self.logger.warning(f"Telegram unavailable, alert for {record.ip} ({', '.join(matched_rules)}) not sent")
+            return
+        try:
+            self.notifier.send(record, matched_rules)
+
+            # Additional custom logic can be implemented here
+            # This section has been removed for privacy and security reasons
+
+        except Exception as e:
+            # Not marked as notified: the next poll that matches the peer retries
+            self.logger.error(f"Error sending Telegram notification for {record.ip}: {e}")
+            return
+        self.logger.info(f"Notification sent via Telegram.")
+        self.notified_peers.add(peer_tuple)
+        with open('notified_peers.txt', 'a') as f:
+            f.write(','.join(peer_tuple) + '\n')
+
+    def accept(self, record, asn):
+        """
+        Aggregator side: drop a peer already received (from any node) in the current poll
+        window, give it its first-seen time from the shared index and match the alert rules.
+        Returns the Observation to store, or None for a duplicate.
+        """
+        key = (record.ip, record.port, record.infohash)
+        # The earliest sighting by any node wins, duplicates included
+        seen = self.seen_times.get(key)
+        if seen is None or record.first_seen < seen['first_seen']:
+            self.seen_times[key] = {'first_seen': record.first_seen, 'last_seen': record.last_seen}
+        else:
+            record.first_seen = seen['first_seen']
+        slot = int(time.time() // self.time_interval)
+        if self.last_slot.get(key) == slot:
+            self.duplicates += 1
+            return None
+        self.last_slot[key] = slot
+        rules = self.alert_rules.match(record.ip, record.country, record.countryISO, asn, record.client, record.infohash)
+        return Observation(record, asn, rules)
+
+    async def queue_observation(self, observation):
+        # Storage applies backpressure; alerts are dropped rather than stalling collection
+        await self.storage_queue.put(observation)
+        if observation.rules and not self.aggregator:
+            try:
+                self.notify_queue.put_nowait(observation)
+            except asyncio.QueueFull:
+                self.logger.warning(f"Notification queue full, dropping alert for {observation.record.ip}")
+
+    async def _serve_node(self, reader, writer):
+        """
+        Aggregator side: read frames from one collector node until it disconnects.
+        """
+        node = writer.get_extra_info('peername') or 'unix socket'
+        received = 0
+        try:
+            while True:
+                length, checksum = SPOOL_HEADER.unpack(await reader.readexactly(SPOOL_HEADER.size))
+                if length > MAX_NODE_FRAME:
+                    raise ValueError(f"frame of {length} bytes over the {MAX_NODE_FRAME} byte limit")
+                payload = await reader.readexactly(length)
+                if zlib.crc32(payload) != checksum:
+                    raise ValueError("corrupt frame")
+                frame = json.loads(zlib.decompress(payload))
+                if frame['node'] != node:
+                    node = frame['node']
+                    self.logger.info(f"Collector node {node} connected")
+                for table, params in frame['tables']:
+                    if table in NODE_TABLES and self.spool:
+                        self.spool.append(table, params)
+                for values in frame['peers']:
+                    observation = self.accept(PeerRecord(*values[:len(PEER_FIELDS)]), values[len(PEER_FIELDS)])
+                    if observation:
+                        await self.queue_observation(observation)
+                received += len(frame['peers'])
+        except asyncio.IncompleteReadError:
+            pass
+        except Exception as e:
+            self.logger.error(f"Dropping connection of collector node {node}: {e}")
+        finally:
+            writer.close()
+        self.logger.info(f"Collector node {node} disconnected after {received} observations")
+
+    async def serve_nodes(self):
+        host, port = parse_endpoint(self.aggregate)
+        if host == 'unix':
+            if os.path.exists(port):
+                os.remove(port)
+            server = await asyncio.start_unix_server(self._serve_node, port)
+        else:
+            server = await asyncio.start_server(self._serve_node, host, port)
+        self.logger.info(f"Aggregating collector nodes on {self.aggregate}")
+        async with server:
+            await server.serve_forever()
+
+    def start_collector(self, handle, source):
+        self.collectors[handle] = asyncio.get_running_loop().create_task(self._collector(handle, source))
+
+    async def _collector(self, handle, source):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            try:
+                observations = await loop.run_in_executor(self.executor, self.collect_peers, handle, source)
+            except Exception as e:
+                self.logger.error(f"Error collecting peers for {source}: {e}")
+                observations = []
+            for observation in observations:
+                if self.aggregate:
+                    # Our own peers are deduplicated against the nodes' like any other
+                    observation = self.accept(observation.record, observation.asn)
+                    if observation is None:
+                        continue
+                await self.queue_observation(observation)
+            await asyncio.sleep(max(0.0, self.time_interval - (loop.time() - started)))
+
+    async def _storage_sink(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                batch = [await asyncio.wait_for(self.storage_queue.get(), timeout=1.0)]
+            except asyncio.TimeoutError:
+                batch = []
+            while batch and len(batch) < 1000 and not self.storage_queue.empty():
+                batch.append(self.storage_queue.get_nowait())
+            try:
+                # An empty batch still flushes time-based outputs
+                await loop.run_in_executor(self.storage_executor, self.store_batch, batch)
+            except Exception as e:
+                self.logger.error(f"Error writing {len(batch)} observations: {e}")
+            for _ in batch:
+                self.storage_queue.task_done()
+
+    async def _notification_sink(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            observation = await self.notify_queue.get()
+            await loop.run_in_executor(self.notify_executor, self.notify, observation)
+
+    async def _housekeeping(self):
+        loop = asyncio.get_running_loop()
+        last_save = last_prune = last_rotation = time.time()
+        while True:
+            await loop.run_in_executor(None, self.reload_ip_filter)
+            changed = self.profile.maybe_reload()
+            if self.connections_limit:
+                # --connections-limit wins over the profile
+                changed.pop('connections_limit', None)
+            if changed:
+                self.apply_settings(changed)
+            if self.user_agent_interval and time.time() - last_rotation >= self.user_agent_interval:
+                self.rotate_user_agent()
+                last_rotation = time.time()
+            if time.time() - last_prune >= 60:
+                # Only the current poll window matters for dedupe
+                slot = int(time.time() // self.time_interval)
+                self.last_slot = {key: value for key, value in self.last_slot.items() if value >= slot - 1}
+                if self.discovery:
+                    # Endpoints not seen for a discovery interval would be written again anyway
+                    horizon = time.time() - self.discovery.interval
+                    self.swarm_seen = {key: seen for key, seen in self.swarm_seen.items() if seen >= horizon}
+                last_prune = time.time()
+            self.handle_alerts()
+            if time.time() - last_save >= self.resume_interval:
+                self.request_state()
+                last_save = time.time()
+            self.alert_rules.maybe_reload()
+            self.log_throttle.flush()
+            self.poll_summary.flush()
+            self.add_queued_magnets()
+            if self.discovery:
+                self.discovery.tick()
+            await asyncio.sleep(1)
+
+    async def replay_log(self):
+        """
+        Feed a recording through enrichment, storage and notifications, paced like the original
+        polls (sped up by replay_speed) or as fast as possible when replay_speed is 0.
+        Returns once every replayed observation has been stored.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        first = None
+        polls = count = 0
+        for poll in PollRecorder.read(self.replay):
+            handle = ReplayHandle(poll)
+            if first is None:
+                first = handle.timestamp
+            if self.replay_speed:
+                delay = (handle.timestamp - first) / self.replay_speed - (loop.time() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            now = datetime.fromtimestamp(handle.timestamp, timezone.utc)
+            observations = await loop.run_in_executor(self.executor, self.collect_peers, handle, handle.source, now)
+            for observation in observations:
+                await self.queue_observation(observation)
+            polls += 1
+            count += len(observations)
+        await self.storage_queue.join()
+        elapsed = loop.time() - started
+        self.logger.info(f"Replayed {polls} polls and {count} observations in {elapsed:.1f}s "
+                         f"({count / max(elapsed, 1e-6):.0f} observations/s)")
+
+    async def run(self):
+        """
+        Asyncio core: one collector task per torrent, plus storage, notification and
+        housekeeping tasks, connected by bounded queues. Blocking libtorrent/MMDB calls run
+        in a thread pool, so a slow torrent or sink never delays the other collectors.
+        Runs until cancelled, then stops the collectors and writes what was already collected.
+        """
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix='Collector')
+        self.storage_executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='Storage')
+        self.notify_executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='Notify')
+        self.storage_queue = asyncio.Queue(maxsize=self.queue_size)
+        self.notify_queue = asyncio.Queue(maxsize=1000)
+        self.daily_day = None
+        self.daily_peers = set()
+        self.daily_completions = set()
+        self.collectors = {}
+        for handle, source in zip(self.handles, self.sources):
+            self.start_collector(handle, source)
+        sinks = [asyncio.create_task(self._storage_sink()), asyncio.create_task(self._notification_sink()),
+                 asyncio.create_task(self._housekeeping())]
+        if self.aggregate:
+            sinks.append(asyncio.create_task(self.serve_nodes()))
+        if self.torrent_files:
+            # Collectors start torrent by torrent while the rest is still loading
+            sinks.append(asyncio.create_task(self.load_torrents(self.torrent_files)))
+        try:
+            if self.replay:
+                await self.replay_log()
+            else:
+                await asyncio.gather(*sinks)
+        finally:
+            collectors = list(self.collectors.values())
+            self.collectors = None
+            for task in collectors + sinks:
+                task.cancel()
+            await asyncio.gather(*collectors, *sinks, return_exceptions=True)
+            self.executor.shutdown(wait=True)
+            self.storage_executor.shutdown(wait=True)
+            self.notify_executor.shutdown(wait=False)
+            pending = []
+            while not self.storage_queue.empty():
+                pending.append(self.storage_queue.get_nowait())
+            if pending:
+                self.store_batch(pending)
+            if not self.notify_queue.empty():
+                self.logger.warning(f"{self.notify_queue.qsize()} pending notifications were not sent")
+
+def connect_mariadb(host, port, user, password, database):
+    """
+    Open a MariaDB connection returning rows as dicts.
+    """
+    # Conectar ao MariaDB
+    return pymysql.connect(
+        host=host,
+        port=port,
+        user=user,
+        password=password,
+        database=database,
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.DictCursor
+    )
+
+# Dimensions accepted by "report --by"
+REPORT_DIMENSIONS = ('day', 'infohash', 'country', 'asn', 'isp', 'client')
+
+REBUILD_DAILY_SQL = ("INSERT IGNORE INTO daily_peer_table (day, infohash, ip, port, country, asn, isp, client) "
+                     "SELECT LEFT(last_seen, 10), infohash, ip, port, country, NULL, isp, client FROM report_table")
+REBUILD_COMPLETIONS_SQL = ("INSERT IGNORE INTO daily_completion_table (day, infohash, ip, port, country) "
+                           "SELECT LEFT(last_seen, 10), infohash, ip, port, country FROM report_table "
+                           "WHERE state = 'completed'")
+
+def report_main(argv):
+    """
+    "report" subcommand: answer swarm questions from the daily rollup tables.
+    """
+    parser = argparse.ArgumentParser(prog='TorrentMonitor.py report',
+                                     description="Unique peers and completions from the daily rollups")
+    parser.add_argument("metric", choices=['peers', 'completions', 'rebuild', 'uniques', 'migrate'],
+                        help="peers: unique peers; completions: peers that completed; rebuild: backfill rollups from report_table; "
+                             "uniques: approximate distinct peers from HyperLogLog sketches; "
+                             "migrate: add the id key and last_seen index --retention-days needs (rebuilds report_table, "
+                             "run it once with the tracker stopped)")
+    parser.add_argument("--by", help=f"Comma separated grouping among {', '.join(REPORT_DIMENSIONS)}", default='day')
+    parser.add_argument("--infohash", help="Only this infohash", default=None)
+    parser.add_argument("--since", help="First day (YYYY-MM-DD), inclusive", default=None)
+    parser.add_argument("--until", help="Last day (YYYY-MM-DD), inclusive", default=None)
+    parser.add_argument("--top", help="Only the N largest groups", type=int, default=None)
+    parser.add_argument("--csv", help="Print CSV instead of a table", default=False, action='store_true')
+    parser.add_argument("--country", help="uniques: only this country", default=None)
+    parser.add_argument("--sketch-dir", help="uniques: comma separated sketch folders (one per monitor node)", default='sketches')
+    parser.add_argument("--db-host", default='localhost')
+    parser.add_argument("--db-port", type=int, default=3306)
+    parser.add_argument("--db-user", default='root')
+    parser.add_argument("--db-password", default='')
+    parser.add_argument("--db-name", default='torrent_monitor')
+    args = parser.parse_args(argv)
+    dimensions = [d.strip() for d in args.by.split(',') if d.strip()]
+    if args.metric == 'uniques':
+        if set(dimensions) - {'day', 'hour', 'infohash', 'country'}:
+            parser.error("uniques can only be grouped by day, hour, infohash and country")
+        since = args.since.replace('-', '') + 'T0000' if args.since else None
+        until = args.until.replace('-', '') + 'T2359' if args.until else None
+        groups = SketchStore.query([d for d in args.sketch_dir.split(',') if d], since, until,
+                                   args.infohash and args.infohash.lower(), args.country, dimensions)
+        rows = [dict(zip(dimensions, group), uniques=sketch.count(), error=f"±{sketch.error:.1%}")
+                for group, sketch in groups.items()]
+        rows.sort(key=lambda row: row['uniques'], reverse=True)
+        print_report(dimensions + ['uniques', 'error'], rows[:args.top] if args.top else rows, args.csv)
+        return
+    unknown = [d for d in dimensions if d not in REPORT_DIMENSIONS]
+    if unknown or not dimensions:
+        parser.error(f"--by accepts {', '.join(REPORT_DIMENSIONS)}")
+    if args.metric == 'completions' and set(dimensions) - {'day', 'infohash', 'country'}:
+        parser.error("completions can only be grouped by day, infohash and country")
+
+    conn = connect_mariadb(args.db_host, args.db_port, args.db_user, args.db_password, args.db_name)
+    try:
+        with conn.cursor() as cur:
+            if args.metric == 'migrate':
+                cur.execute(MIGRATE_RETENTION_SQL)
+                conn.commit()
+                print("report_table has its id key and last_seen index: --retention-days can be used")
+                return
+            if args.metric == 'rebuild':
+                cur.execute(REBUILD_DAILY_SQL)
+                peers = cur.rowcount
+                cur.execute(REBUILD_COMPLETIONS_SQL)
+                conn.commit()
+                print(f"Backfilled {peers} daily peer rows and {cur.rowcount} completions from report_table")
+                return
+            table = 'daily_peer_table' if args.metric == 'peers' else 'daily_completion_table'
+            where = []
+            params = []
+            if args.infohash:
+                where.append("infohash = %s")
+                params.append(args.infohash.lower())
+            if args.since:
+                where.append("day >= %s")
+                params.append(args.since)
+            if args.until:
+                where.append("day <= %s")
+                params.append(args.until)
+            columns = ', '.join(dimensions)
+            sql = f"SELECT {columns}, COUNT(DISTINCT ip, port) AS {args.metric} FROM {table}"
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            sql += f" GROUP BY {columns} ORDER BY {args.metric} DESC"
+            if args.top:
+                sql += f" LIMIT {int(args.top)}"
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+    finally:
+        conn.close()
+
+    print_report(dimensions + [args.metric], rows, args.csv)
+
+def print_report(header, rows, as_csv=False):
+    """
+    Print report rows (dicts) as an aligned table or CSV.
+    """
+    if as_csv:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow([row[c] for c in header])
+        return
+    table = [[str(row[c]) for c in header] for row in rows]
+    widths = [max([len(h)] + [len(r[i]) for r in table]) for i, h in enumerate(header)]
+    print('  '.join(h.ljust(w) for h, w in zip(header, widths)).rstrip())
+    for r in table:
+        print('  '.join(v.ljust(w) for v, w in zip(r, widths)).rstrip())
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'report':
+        report_main(sys.argv[2:])
+        sys.exit(0)
+
     parser = argparse.ArgumentParser()
-    parser.add_argument('-d', "--torrent_folder", help="Folder containing torrent files", required=True)
+    parser.add_argument('-d', "--torrent_folder", help="Folder containing torrent files", default=None)
+    parser.add_argument('-m', "--magnets", help="File with magnet URIs or infohashes, one per line ('-' reads stdin)", default=None)
+    parser.add_argument("--metadata-dir", help="Folder caching metadata fetched for magnets", default='metadata')
     parser.add_argument("-o", "--output", help="Output path", default=False)     
     parser.add_argument("-g", "--geo", help="Enable IP geolocation", default=False, action='store_true')     
     parser.add_argument("-T", "--time", help="Wait time between peer downloads", default=30)         
     parser.add_argument("-v", "--verbose", help="Enable verbose mode", default=False, action='store_true')
-    parser.add_argument("-c", "--country", help="Country or ISO code to save data", default=None)  
+    parser.add_argument("--log-level", help="Console and JSON log level (-v is DEBUG)", default='INFO',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    parser.add_argument("--log-json", help="Also write logs as JSON lines to this file, through a non-blocking queue", 
+                        default=None)
+    parser.add_argument("--log-peer-rate", help="Per-peer log lines allowed per event type every 10s (0: summaries only)", 
+                        type=int, default=20)
+    parser.add_argument("-c", "--country", help="Comma separated countries, ISO codes or ASNs (e.g. Spain,PT,AS3352) to save data", default=None)  
     parser.add_argument("-db", "--database", help="Database to use", default="Monitor.db")
+    parser.add_argument("--ip-endpoint", help="URL returning our public IP (repeatable)", action='append', default=None)
+    parser.add_argument("--ip-cache", help="File caching the last known public IPs", default='public_ip.json')
+    parser.add_argument("--spool-dir", help="Folder for rows waiting to be written to MariaDB", default='spool')
+    parser.add_argument("--retention-days", help="Days report_table keeps raw rows; older ones are rolled up "
+                        "into daily_session_table and deleted", type=float, default=None)
+    parser.add_argument("--archive-dir", help="Folder for gzip CSV archives of rows removed by --retention-days", default=None)
+    parser.add_argument("--state-dir", help="Folder for saved session state and resume data", default='state')
+    parser.add_argument("--discover", help="Actively sweep DHT and trackers for swarm peers", default=False, action='store_true')
+    parser.add_argument("--discovery-rate", help="Maximum discovery sweeps per second", type=float, default=2.0)
+    parser.add_argument("--discovery-interval", help="Seconds between sweeps of the same torrent", type=float, default=900)
+    parser.add_argument("--parquet", help="Folder for partitioned Parquet export of peer observations", default=None)
+    parser.add_argument("--convert-parquet", help="Export an existing CSV (path) or report_table ('db') to --parquet and exit", default=None)
+    parser.add_argument("--rules", help="JSON file with alert rules (reloaded when it changes)", default=None)
+    parser.add_argument("--sketch-dir", help="Folder for hourly HyperLogLog distinct-peer sketches", default=None)
+    parser.add_argument("--workers", help="Threads polling torrents and enriching peers", type=int, default=8)
+    parser.add_argument("--geo-dir", help="Folder watched for GeoLite2-City_*/GeoLite2-ASN_* database releases", default=DB_DIR)
+    parser.add_argument("--enrich-workers", help="Processes for geo/ASN enrichment of large peer batches (0: in-process)", 
+                        type=int, default=0)
+    parser.add_argument("--aggregator", help="Collector node: send observations to this aggregator (host:port or unix:/path)", default=None)
+    parser.add_argument("--aggregate", help="Aggregator: accept collector nodes on host:port or unix:/path", default=None)
+    parser.add_argument("--node-id", help="Name of this collector node (default: hostname-listen port)", default=None)
+    parser.add_argument("--listen-port", help="First of the two BitTorrent listen ports", type=int, default=6881)
+    parser.add_argument("--heartbeat", help="Seconds before an unchanged peer is written again (0: every poll)", 
+                        type=float, default=300)
+    parser.add_argument("--delta-progress", help="Progress change (0-1) that makes a peer count as changed", 
+                        type=float, default=0.05)
+    parser.add_argument("--record", help="Append raw per-poll observations to this binary log", default=None)
+    parser.add_argument("--replay", help="Replay a --record log through the pipeline instead of live torrents", default=None)
+    parser.add_argument("--replay-speed", help="Replay speed factor (1: real time, 0: as fast as possible)", 
+                        type=float, default=1.0)
+    parser.add_argument("--interface", help="Run one session bound to this address or device (repeat for several)", 
+                        action='append', default=None)
+    parser.add_argument("--connections-limit", help="Peer connections allowed per session (default: from the profile)", 
+                        type=int, default=None)
+    parser.add_argument("--session-profile", help=f"Session settings preset ({', '.join(SESSION_PRESETS)}) or JSON profile file, "
+                        "reloaded when it changes", default='default')
+    parser.add_argument("--user-agent-interval", help="Seconds between user agent rotations (0: never)", type=float, default=600)
+    parser.add_argument("--blocklist", help="File of CIDRs or address ranges never monitored, reloaded when it changes "
+                        "(repeat for several)", action='append', default=None)
+    parser.add_argument("--allowlist", help="File of CIDRs or address ranges exempt from the blocklists (repeat for several)", 
+                        action='append', default=None)
+    parser.add_argument("--db-host", help="MariaDB host", default='localhost')
+    parser.add_argument("--db-port", help="MariaDB port", type=int, default=3306)
+    parser.add_argument("--db-user", help="MariaDB user", default='root')
+    parser.add_argument("--db-password", help="MariaDB password", default='')
+    parser.add_argument("--db-name", help="MariaDB database", default='torrent_monitor')
     args = parser.parse_args()
+    if args.convert_parquet:
+        if not args.parquet:
+            parser.error("--convert-parquet needs --parquet")
+    elif args.replay:
+        if args.torrent_folder or args.magnets or args.record:
+            parser.error("--replay feeds recorded polls instead of -d/-m torrents and cannot be recorded again")
+    elif not args.torrent_folder and not args.magnets and not args.aggregate:
+        parser.error("one of -d/--torrent_folder or -m/--magnets is required")
+    if args.archive_dir and not args.retention_days:
+        parser.error("--archive-dir needs --retention-days")
+    if args.retention_days and not args.output:
+        parser.error("--retention-days applies to report_table and needs -o")
+    if args.aggregator and (args.output or args.parquet or args.sketch_dir):
+        parser.error("collector nodes do not store data: pass -o/--parquet/--sketch-dir to the aggregator")
+    if args.convert_parquet:
+        # One-shot export: no torrents, sessions or geo databases needed
+        logger = logging.getLogger('TorrentTracker')
+        configure_logging(logger)
+        logger.setLevel(logging.DEBUG if args.verbose else args.log_level)
+        convert_to_parquet(args.convert_parquet, args.parquet, logger=logger,
+                           connect=lambda: connect_mariadb(args.db_host, args.db_port, args.db_user,
+                                                           args.db_password, args.db_name))
+        sys.exit(0)
 
-    t = TorrentTracker(args.torrent_folder, args.output, args.geo, args.database)
-    if args.verbose:
-        t.logger.setLevel(logging.DEBUG)
+    t = TorrentTracker(args.torrent_folder, args.output, args.geo, args.database, country=args.country,
+                       time_interval=float(args.time),
+                       db_host=args.db_host, db_port=args.db_port, db_user=args.db_user,
+                       db_password=args.db_password, db_name=args.db_name,
+                       ip_endpoints=args.ip_endpoint, ip_cache=args.ip_cache, rules_file=args.rules,
+                       spool_dir=args.spool_dir, state_dir=args.state_dir,
+                       discover=args.discover, discovery_rate=args.discovery_rate,
+                       discovery_interval=args.discovery_interval, magnets=args.magnets,
+                       metadata_dir=args.metadata_dir, parquet_dir=args.parquet, sketch_dir=args.sketch_dir,
+                       workers=args.workers, enrich_workers=args.enrich_workers,
+                       geo_dir=args.geo_dir, aggregator=args.aggregator, aggregate=args.aggregate,
+                       node_id=args.node_id, listen_port=args.listen_port, record=args.record,
+                       replay=args.replay, replay_speed=args.replay_speed, heartbeat=args.heartbeat,
+                       delta_progress=args.delta_progress, interfaces=args.interface,
+                       connections_limit=args.connections_limit, session_profile=args.session_profile,
+                       user_agent_interval=args.user_agent_interval, blocklists=args.blocklist,
+                       allowlists=args.allowlist, retention_days=args.retention_days,
+                       archive_dir=args.archive_dir, json_log=args.log_json, log_peer_rate=args.log_peer_rate)
+    t.logger.setLevel(logging.DEBUG if args.verbose else args.log_level)
     t.main()
@@ -0,0 +1,105 @@
+"""
+Shared fixtures: a transactional stand-in for MariaDB behind pymysql-like connections.
+"""
+import pymysql
+import pytest
+
+
+class FakeDatabase:
+    """
+    Writes are kept per connection until commit and a rejected statement is undone alone.
+    report_table is held in rows (dicts with an id) for the retention job's SELECT/DELETE,
+    the other tables only collect their committed (table, params) statements. The first
+    word of every statement is logged, and the server can be taken down with up = False.
+    """
+    def __init__(self):
+        self.up = True
+        self.committed = []
+        self.rows = []
+        self.migrated = True
+        self.statements = []
+
+    def connect(self):
+        if not self.up:
+            raise pymysql.err.OperationalError(2003, "Can't connect to MySQL server")
+        return FakeConnection(self)
+
+    def check(self):
+        if not self.up:
+            raise pymysql.err.OperationalError(2013, "Lost connection to MySQL server during query")
+
+    def execute(self, connection, sql, params=None):
+        """
+        Run one statement for connection; returns the rows of a query.
+        """
+        self.check()
+        words = sql.split()
+        self.statements.append(words[0])
+        if words[0] == 'SHOW':
+            return [{'Field': 'id'}] if self.migrated else []
+        if words[0] == 'SELECT':
+            cutoff, limit = params
+            expired = [row for row in self.rows if row['last_seen'] < cutoff]
+            return sorted(expired, key=lambda row: (row['last_seen'], row['id']))[:limit]
+        if words[0] == 'DELETE':
+            connection.pending.append(('DELETE', tuple(params)))
+        elif 'INTO' in words:
+            if params[0] == 'bad':
+                raise pymysql.err.DataError(1406, "Data too long for column 'ip' at row 1")
+            connection.pending.append((words[words.index('INTO') + 1], tuple(params)))
+        return []
+
+    def table(self, name):
+        return [params for table, params in self.committed if table == name]
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+        self.pending = []
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.database.check()
+        for table, params in self.pending:
+            if table == 'DELETE':
+                self.database.rows = [row for row in self.database.rows if row['id'] not in params]
+            else:
+                self.database.committed.append((table, params))
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.result = self.connection.database.execute(self.connection, sql, params)
+
+    def executemany(self, sql, batch):
+        for params in batch:
+            self.execute(sql, params)
+
+    def fetchall(self):
+        return self.result
+
+
+@pytest.fixture
+def database():
+    return FakeDatabase()
@@ -87,19 +87,24 @@ if not any(TORRENT_DIR.glob("*.torrent")):
     sys.exit(1)
 
 # Geo is MANDATORY in lean monitor: validate early for more friendly error
-city_mmdb = CWD / "dbs" / "GeoLite2-City_20250926" / "GeoLite2-City.mmdb"
-asn_mmdb = CWD / "dbs" / "GeoLite2-ASN_20250929" / "GeoLite2-ASN.mmdb"
-missing = [p for p in [city_mmdb, asn_mmdb] if not p.exists()]
+# The newest dated release of each database is used (and newer ones are picked up while running)
+def newest_mmdb(edition):
+    found = sorted((CWD / "dbs").glob(f"{edition}_*/{edition}.mmdb"))
+    return found[-1] if found else None
+
+city_mmdb = newest_mmdb("GeoLite2-City")
+asn_mmdb = newest_mmdb("GeoLite2-ASN")
+missing = [name for name, p in [("GeoLite2-City", city_mmdb), ("GeoLite2-ASN", asn_mmdb)] if p is None]
 if missing:
     print("[ERROR] Required Geo databases not found in dbs/ folder.")
     print("       Check if files are in:")
-    print("       - dbs/GeoLite2-City_20250926/GeoLite2-City.mmdb")
-    print("       - dbs/GeoLite2-ASN_20250929/GeoLite2-ASN.mmdb")
+    print("       - dbs/GeoLite2-City_YYYYMMDD/GeoLite2-City.mmdb")
+    print("       - dbs/GeoLite2-ASN_YYYYMMDD/GeoLite2-ASN.mmdb")
     for m in missing:
         print(f"       - missing: {m}")
     sys.exit(1)
 else:
-    print("[Runner] GeoIP: MMDBs detected -> geolocation ENABLED")
+    print(f"[Runner] GeoIP: MMDBs detected ({city_mmdb.parent.name}, {asn_mmdb.parent.name}) -> geolocation ENABLED")
 
 # Dependency warnings (best-effort)
 for mod in ("libtorrent", "geoip2", "colorama", "requests", "telethon", "pymysql"):
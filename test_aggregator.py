@@ -0,0 +1,113 @@
+"""
+Aggregator mode: collector nodes streaming frames over a unix socket, deduplicated by peer.
+"""
+import asyncio
+import logging
+import os
+import socket
+
+import TorrentMonitor as tm
+
+INFOHASH = 'aa' * 20
+
+
+def observation(ip, first_seen):
+    values = dict.fromkeys(tm.PEER_FIELDS, '')
+    values.update(ip=ip, port=6881, country='Spain', client='qBittorrent 4.6.2', infohash=INFOHASH,
+                  first_seen=first_seen, last_seen='2026-10-19 10:10:00 UTC')
+    return tm.Observation(tm.PeerRecord(*(values[field] for field in tm.PEER_FIELDS)), 3352, [])
+
+
+def aggregator(path):
+    # serve_nodes() and accept() only need these attributes of a TorrentTracker
+    tracker = tm.TorrentTracker.__new__(tm.TorrentTracker)
+    tracker.aggregate = f'unix:{path}'
+    tracker.aggregator = None
+    tracker.spool = None
+    tracker.time_interval = 3600
+    tracker.seen_times = {}
+    tracker.last_slot = {}
+    tracker.duplicates = 0
+    tracker.alert_rules = tm.AlertRules()
+    tracker.logger = logging.getLogger('test_aggregator')
+    return tracker
+
+
+async def wait_for(condition, timeout=5):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def run_aggregator(tracker, path, nodes):
+    """
+    Serve tracker on path while nodes(loop) runs, and return the observations stored.
+    """
+    async def main():
+        tracker.storage_queue = asyncio.Queue()
+        tracker.notify_queue = asyncio.Queue()
+        server = asyncio.create_task(tracker.serve_nodes())
+        await wait_for(lambda: os.path.exists(path))
+        try:
+            await nodes(asyncio.get_running_loop())
+        finally:
+            server.cancel()
+        stored = []
+        while not tracker.storage_queue.empty():
+            stored.append(tracker.storage_queue.get_nowait())
+        return stored
+    return asyncio.run(main())
+
+
+def test_same_peer_from_two_nodes_is_stored_once(tmp_path):
+    path = str(tmp_path / 'aggregator.sock')
+    tracker = aggregator(path)
+    first, second = tm.AggregatorLink(f'unix:{path}', 'node-a'), tm.AggregatorLink(f'unix:{path}', 'node-b')
+
+    async def nodes(loop):
+        # node-a connected later, so it reports a later first sighting than node-b
+        first.send([observation('81.32.10.1', '2026-10-19 10:05:00 UTC')])
+        await loop.run_in_executor(None, first.flush)
+        await wait_for(lambda: tracker.storage_queue.qsize() == 1)
+        second.send([observation('81.32.10.1', '2026-10-19 10:00:00 UTC'),
+                     observation('81.32.10.2', '2026-10-19 10:00:00 UTC')])
+        await loop.run_in_executor(None, second.flush)
+        await wait_for(lambda: tracker.storage_queue.qsize() == 2 and tracker.duplicates == 1)
+        # Next poll window: the peer is stored again, with the earliest first-seen of both nodes
+        tracker.last_slot.clear()
+        first.send([observation('81.32.10.1', '2026-10-19 10:05:00 UTC')])
+        await loop.run_in_executor(None, first.flush)
+        await wait_for(lambda: tracker.storage_queue.qsize() == 3)
+        first.stop()
+        second.stop()
+
+    stored = run_aggregator(tracker, path, nodes)
+    assert [(o.record.ip, o.record.first_seen) for o in stored] == [
+        ('81.32.10.1', '2026-10-19 10:05:00 UTC'),
+        ('81.32.10.2', '2026-10-19 10:00:00 UTC'),
+        ('81.32.10.1', '2026-10-19 10:00:00 UTC')]
+    assert tracker.duplicates == 1
+    assert tracker.seen_times[('81.32.10.1', 6881, INFOHASH)]['first_seen'] == '2026-10-19 10:00:00 UTC'
+    assert (first.dropped, second.dropped) == (0, 0)
+
+
+def test_oversized_frame_drops_the_connection(tmp_path, caplog):
+    path = str(tmp_path / 'aggregator.sock')
+    tracker = aggregator(path)
+
+    def send_header():
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(5)
+            sock.connect(path)
+            sock.sendall(tm.SPOOL_HEADER.pack(tm.MAX_NODE_FRAME + 1, 0))
+            # Closed by the aggregator without waiting for the announced payload
+            return sock.recv(1)
+
+    async def nodes(loop):
+        assert await loop.run_in_executor(None, send_header) == b''
+
+    with caplog.at_level(logging.ERROR, logger='test_aggregator'):
+        assert run_aggregator(tracker, path, nodes) == []
+    assert 'byte limit' in caplog.text
@@ -0,0 +1,147 @@
+"""
+Alert rule matching and the Telegram notification call.
+"""
+import json
+import logging
+import threading
+import types
+
+import pytest
+
+import TorrentMonitor as tm
+
+RULES = [
+    {'name': 'spain', 'country': ['Spain', 'PT']},
+    {'name': 'isp', 'asn': 'AS3352', 'client': 'qBittorrent'},
+    {'name': 'lan', 'cidr': ['10.0.0.0/8', '2001:db8::/32']},
+    {'name': 'watched', 'infohash': 'AA' * 20, 'country': 'FR'},
+]
+
+
+def match(rules, ip='1.2.3.4', country='Germany', country_iso='DE', asn=0, client='Transmission 4.0',
+          infohash='bb' * 20):
+    return rules.match(ip, country, country_iso, asn, client, infohash)
+
+
+def test_rules_match_by_field():
+    rules = tm.AlertRules(RULES)
+    assert len(rules) == 4
+    assert match(rules) == []
+    assert match(rules, country='spain') == ['spain']
+    assert match(rules, country='Portugal', country_iso='PT') == ['spain']
+    # Every field a rule sets must match; clients match by name without the version
+    assert match(rules, asn=3352) == []
+    assert match(rules, asn=3352, client='qBittorrent 4.6.2') == ['isp']
+    assert match(rules, ip='10.20.30.40') == ['lan']
+    assert match(rules, ip='2001:db8::1') == ['lan']
+    assert match(rules, ip='not an ip') == []
+    assert match(rules, country='France', country_iso='FR', infohash='aa' * 20) == ['watched']
+    assert match(rules, ip='10.0.0.1', country='Spain', asn=3352, client='qBittorrent') == ['spain', 'isp', 'lan']
+
+
+def test_rules_from_filter():
+    rules = tm.AlertRules.from_filter(tm.GeoFilter.parse('Spain,AS2860'))
+    assert match(rules, country='Spain') == ['country']
+    assert match(rules, asn=2860) == ['asn']
+    assert tm.AlertRules.from_filter(None).match('1.2.3.4', 'Spain', 'ES', 1, '', '') == []
+
+
+def test_rules_reload_keeps_previous_on_error(tmp_path):
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps({'rules': [{'name': 'spain', 'country': 'ES'}]}))
+    rules = tm.AlertRules(path=str(path))
+    assert match(rules, country_iso='ES') == ['spain']
+    path.write_text('{broken')
+    # Different mtime, so the file is read again
+    stat = path.stat()
+    tm.os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert not rules.maybe_reload()
+    assert match(rules, country_iso='ES') == ['spain']
+
+
+class FakeClient:
+    """
+    Asynchronous stand-in for telethon.TelegramClient recording where messages are sent from.
+    """
+    fail = False
+
+    def __init__(self, session, api_id, api_hash):
+        self.sent = []
+
+    async def connect(self):
+        pass
+
+    async def is_user_authorized(self):
+        return True
+
+    async def get_entity(self, channel_id):
+        return f'channel:{channel_id}'
+
+    async def send_message(self, entity, message, parse_mode=None):
+        if self.fail:
+            raise ConnectionError("Telegram is down")
+        self.sent.append((entity, message, threading.current_thread().name))
+
+    async def disconnect(self):
+        pass
+
+
+def make_record(ip='81.32.10.1'):
+    values = dict.fromkeys(tm.PEER_FIELDS, '')
+    values.update(ip=ip, port=6881, country='Spain', client='qBittorrent 4.6.2', infohash='aa' * 20,
+                  first_seen='2026-10-19 10:00:00')
+    return tm.PeerRecord(*(values[field] for field in tm.PEER_FIELDS))
+
+
+@pytest.fixture
+def tracker(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(tm, 'telethon', types.SimpleNamespace(TelegramClient=FakeClient), raising=False)
+    FakeClient.fail = False
+    notifier = tm.TelegramNotifier(1, 'hash', '+1', -100, timeout=5)
+    notifier.start()
+    # notify() only needs these attributes of a TorrentTracker
+    tracker = tm.TorrentTracker.__new__(tm.TorrentTracker)
+    tracker.notified_peers = set()
+    tracker.replay = False
+    tracker.notifier = notifier
+    tracker.logger = logging.getLogger('test_alerts')
+    yield tracker
+    notifier.stop()
+
+
+def test_notification_message_lists_rules():
+    message = tm.notification_message(make_record(), ['spain', 'isp'])
+    assert '<code>81.32.10.1</code>' in message
+    assert 'Rules: <code>spain, isp</code>' in message
+
+
+def test_notify_sends_once_from_the_telegram_thread(tracker, tmp_path):
+    record = make_record()
+    tracker.notify((record, 3352, ['spain']))
+    tracker.notify((record, 3352, ['spain']))
+    sent = tracker.notifier.client.sent
+    assert len(sent) == 1
+    entity, message, thread = sent[0]
+    assert (entity, thread) == ('channel:-100', 'Telegram')
+    assert 'Rules: <code>spain</code>' in message
+    assert (tmp_path / 'notified_peers.txt').read_text().startswith('81.32.10.1,6881,')
+
+
+def test_failed_notification_is_retried(tracker, tmp_path):
+    record = make_record()
+    FakeClient.fail = True
+    tracker.notify((record, 3352, ['spain']))
+    assert not tracker.notified_peers
+    assert not (tmp_path / 'notified_peers.txt').exists()
+    FakeClient.fail = False
+    tracker.notify((record, 3352, ['spain']))
+    assert len(tracker.notifier.client.sent) == 1
+    assert len(tracker.notified_peers) == 1
+
+
+def test_replay_does_not_send(tracker):
+    tracker.replay = True
+    tracker.notify((make_record(), 3352, ['spain']))
+    assert tracker.notifier.client.sent == []
+    assert len(tracker.notified_peers) == 1
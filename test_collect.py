@@ -0,0 +1,266 @@
+"""
+Peer collection: which peers a poll enriches and writes, peers merged across sessions,
+and recorded polls replayed.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import types
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import TorrentMonitor as tm
+
+START = datetime(2026, 10, 19, 10, 0, 0, tzinfo=timezone.utc)
+
+
+def peer(n, progress=0.5, downloading=3):
+    return types.SimpleNamespace(ip=(f'81.32.10.{n}', 6881), client='qBittorrent 4.6.2', progress=progress,
+                                 downloading_piece_index=downloading, payload_down_speed=0, payload_up_speed=0,
+                                 num_pieces=0, pieces=[])
+
+
+class FakeHandle:
+    """
+    Magnet handle still fetching metadata, so progress comes from peer_info.progress.
+    """
+    def __init__(self):
+        self.peers = []
+
+    def status(self):
+        return types.SimpleNamespace(name='test', progress=0.1, has_metadata=False, num_seeds=1, num_peers=2)
+
+    def get_peer_info(self):
+        return self.peers
+
+    def info_hash(self):
+        return 'aa' * 20
+
+
+class FakeEnricher:
+    def enrich_peers(self, peers):
+        return 'test', [tm.GEO_UNKNOWN] * len(peers)
+
+
+def make_tracker():
+    # collect_peers() only needs these attributes of a TorrentTracker
+    tracker = tm.TorrentTracker.__new__(tm.TorrentTracker)
+    tracker.logger = logging.getLogger('test_collect')
+    tracker.recorder = None
+    tracker.peer_state = {}
+    tracker.pieces = {}
+    tracker.seen_times = {}
+    tracker.own_ips = set()
+    tracker.ip_filters = set()
+    tracker.geo_filter = None
+    tracker.enricher = FakeEnricher()
+    tracker.alert_rules = tm.AlertRules()
+    tracker.log_throttle = tm.EventThrottle(tracker.logger)
+    tracker.poll_summary = tm.PollSummary(tracker.logger, interval=3600)
+    tracker.heartbeat = 300
+    tracker.delta_progress = 0.05
+    tracker.replay = None
+    return tracker
+
+
+@pytest.fixture
+def tracker():
+    return make_tracker()
+
+
+def poll_observations(tracker, handle, peers, seconds):
+    handle.peers = peers
+    return tracker.collect_peers(handle, 'test.torrent', START + timedelta(seconds=seconds))
+
+
+def poll(tracker, handle, peers, seconds):
+    return sorted(observation.record.ip[-1] for observation in poll_observations(tracker, handle, peers, seconds))
+
+
+def test_only_new_and_changed_peers_are_emitted(tracker):
+    handle = FakeHandle()
+    assert poll(tracker, handle, [peer(1), peer(2), peer(3)], 0) == ['1', '2', '3']
+    assert poll(tracker, handle, [peer(1), peer(2), peer(3)], 30) == []
+    # 1: moved by the threshold, 2: under it, 3: stopped, 4: new
+    assert poll(tracker, handle, [peer(1, 0.55), peer(2, 0.54), peer(3, downloading=-1), peer(4)], 60) == ['1', '3', '4']
+    # Small moves add up against the last emitted progress, not the last poll
+    assert poll(tracker, handle, [peer(1, 0.55), peer(2, 0.551), peer(3, downloading=-1), peer(4)], 90) == ['2']
+
+
+def test_unchanged_peers_heartbeat(tracker):
+    handle = FakeHandle()
+    assert poll(tracker, handle, [peer(1)], 0) == ['1']
+    assert poll(tracker, handle, [peer(1), peer(2)], 200) == ['2']
+    # 1 is due again 300s after it was last written, 2 is not yet
+    assert poll(tracker, handle, [peer(1), peer(2)], 300) == ['1']
+    assert poll(tracker, handle, [peer(1), peer(2)], 500) == ['2']
+
+
+def test_heartbeat_zero_emits_every_poll(tracker):
+    tracker.heartbeat = 0
+    handle = FakeHandle()
+    for seconds in (0, 30, 60):
+        assert poll(tracker, handle, [peer(1), peer(2)], seconds) == ['1', '2']
+
+
+def test_gone_peers_are_counted_not_written(tracker):
+    handle = FakeHandle()
+    poll(tracker, handle, [peer(1), peer(2)], 0)
+    assert poll(tracker, handle, [peer(1)], 30) == []
+    assert list(tracker.peer_state['aa' * 20]) == [('81.32.10.1', 6881)]
+    # updated, completed, unchanged, gone
+    assert tracker.poll_summary.counts == [2, 0, 1, 1]
+    # A peer coming back is new again, with its original first-seen time
+    handle.peers = [peer(1), peer(2)]
+    (observation,) = tracker.collect_peers(handle, 'test.torrent', START + timedelta(seconds=60))
+    assert (observation.record.ip, observation.record.first_seen) == ('81.32.10.2', '2026-10-19 10:00:00 UTC')
+
+
+class SessionHandle(FakeHandle):
+    """
+    The same torrent's handle in one session, recording the calls fanned out to it.
+    """
+    def __init__(self, peers, valid=True):
+        super().__init__()
+        self.peers = peers
+        self.valid = valid
+        self.calls = []
+
+    def is_valid(self):
+        return self.valid
+
+    def force_reannounce(self, *args):
+        self.calls.append(('force_reannounce', args))
+
+    def scrape_tracker(self, *args):
+        self.calls.append(('scrape_tracker', args))
+
+
+def test_handle_group_merges_peers_across_sessions(tracker):
+    # 1 is connected to both sessions (through each local address), 2 and 3 to one each
+    first = SessionHandle([peer(1, 0.5), peer(2)])
+    second = SessionHandle([peer(3), peer(1, 0.9)])
+    group = tm.HandleGroup([first, second])
+    peers = group.get_peer_info()
+    assert [peer_info.ip[0] for peer_info in peers] == ['81.32.10.1', '81.32.10.2', '81.32.10.3']
+    # The first session's view of a shared peer is kept
+    assert peers[0].progress == 0.5
+    # Same address on another port is another peer
+    second.peers.append(types.SimpleNamespace(**dict(vars(peer(1)), ip=('81.32.10.1', 6882))))
+    assert len(group.get_peer_info()) == 4
+
+    observations = tracker.collect_peers(group, 'test.torrent', START)
+    assert len(observations) == 4
+    assert len({(o.record.ip, o.record.port) for o in observations}) == 4
+
+
+def test_handle_group_fans_out_and_delegates():
+    first, second = SessionHandle([]), SessionHandle([], valid=False)
+    group = tm.HandleGroup([first, second])
+    group.force_reannounce(0, -1)
+    group.scrape_tracker()
+    assert first.calls == second.calls == [('force_reannounce', (0, -1)), ('scrape_tracker', ())]
+    assert not group.is_valid()
+    # Everything else is answered by the first session
+    assert group.info_hash() == 'aa' * 20
+    assert group.status().name == 'test'
+
+
+def replay(tracker, path):
+    """
+    Run replay_log() with the storage and notification sinks reduced to lists.
+    """
+    stored = []
+
+    async def sink(queue, consume):
+        while True:
+            consume(await queue.get())
+            queue.task_done()
+
+    async def main():
+        tracker.storage_queue = asyncio.Queue()
+        tracker.notify_queue = asyncio.Queue()
+        sinks = [asyncio.create_task(sink(tracker.storage_queue, stored.append)),
+                 asyncio.create_task(sink(tracker.notify_queue, tracker.notify))]
+        try:
+            await tracker.replay_log()
+            await tracker.notify_queue.join()
+        finally:
+            for task in sinks:
+                task.cancel()
+
+    tracker.replay = str(path)
+    tracker.replay_speed = 0
+    tracker.aggregator = None
+    tracker.notified_peers = set()
+    tracker.notifier = None
+    with concurrent.futures.ThreadPoolExecutor(1) as tracker.executor:
+        asyncio.run(main())
+    return stored
+
+
+def record_polls(path, polls):
+    tracker = make_tracker()
+    tracker.recorder = tm.PollRecorder(str(path))
+    handle = FakeHandle()
+    rows = []
+    for seconds, peers in polls:
+        rows.extend(o.record.as_row() for o in poll_observations(tracker, handle, peers, seconds))
+    tracker.recorder.close()
+    return rows
+
+
+POLLS = [(0, [peer(1), peer(2)]), (30, [peer(1, 0.7), peer(2)]), (60, [peer(2, downloading=-1), peer(3)])]
+
+
+def test_replay_rebuilds_the_recorded_rows(tmp_path, caplog, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / 'polls.rec'
+    rows = record_polls(path, POLLS)
+    assert len(rows) == 5
+    tracker = make_tracker()
+    tracker.alert_rules = tm.AlertRules([{'name': 'isp', 'cidr': '81.32.10.0/24'}])
+    with caplog.at_level(logging.INFO, logger='test_collect'):
+        stored = replay(tracker, path)
+    # Same rows, stamped with the recorded poll times instead of the replay time
+    assert [o.record.as_row() for o in stored] == rows
+    assert sorted({o.record.last_seen for o in stored}) == [
+        '2026-10-19 10:00:00 UTC', '2026-10-19 10:00:30 UTC', '2026-10-19 10:01:00 UTC']
+    # Alerts are logged, never sent, and nothing is marked as notified on disk
+    replayed = [r.getMessage() for r in caplog.records if r.getMessage().startswith('Replay: alert')]
+    assert len(replayed) == 3
+    assert 'Telegram unavailable' not in caplog.text
+    assert not (tmp_path / 'notified_peers.txt').exists()
+
+
+def frames(path):
+    """
+    Offsets of the frames in a recording.
+    """
+    data = path.read_bytes()
+    offsets, offset = [], len(tm.RECORD_MAGIC)
+    while offset < len(data):
+        offsets.append(offset)
+        length, _ = tm.SPOOL_HEADER.unpack_from(data, offset)
+        offset += tm.SPOOL_HEADER.size + length
+    return data, offsets
+
+
+def test_torn_or_corrupt_tail_ends_the_replay(tmp_path):
+    path = tmp_path / 'polls.rec'
+    record_polls(path, POLLS)
+    data, offsets = frames(path)
+    assert len(list(tm.PollRecorder.read(str(path)))) == 3
+    # Last frame cut short by a crash
+    path.write_bytes(data[:-10])
+    assert [poll[0] for poll in tm.PollRecorder.read(str(path))] == [START.timestamp(), START.timestamp() + 30]
+    # Flipped byte in the second frame: its CRC fails and the rest is not trusted
+    corrupt = bytearray(data)
+    corrupt[offsets[1] + tm.SPOOL_HEADER.size + 2] ^= 0xff
+    path.write_bytes(bytes(corrupt))
+    assert len(list(tm.PollRecorder.read(str(path)))) == 1
+    assert len(replay(make_tracker(), path)) == 2
+    path.write_bytes(b'JUNK' + data[4:])
+    with pytest.raises(ValueError):
+        list(tm.PollRecorder.read(str(path)))
@@ -30,21 +30,14 @@ def test_torrent_tracker():
         for ip in test_ips:
             print(f"\n🔍 Testando IP: {ip}")
             
-            # Testar get_geo_info
-            geo_info = tracker.get_geo_info(ip)
-            if geo_info:
-                country = geo_info.get('country', {}).get('names', {}).get('en', 'N/A')
-                city = geo_info.get('city', {}).get('names', {}).get('en', 'N/A')
-                print(f"  📍 País: {country}, Cidade: {city}")
+            geo = tracker.enricher.lookup(ip)
+            if geo.country != 'N/A':
+                print(f"  📍 País: {geo.country}, Cidade: {geo.city}")
             else:
                 print(f"  ❌ Geolocation error")
             
-            # Testar get_isp_info
-            isp_info = tracker.get_isp_info(ip)
-            if isinstance(isp_info, dict):
-                org = isp_info.get('autonomous_system_organization', 'N/A')
-                asn = isp_info.get('autonomous_system_number', 'N/A')
-                print(f"  🏢 ISP: {org} (AS{asn})")
+            if geo.asn is not None:
+                print(f"  🏢 ISP: {geo.isp} (AS{geo.asn})")
             else:
                 print(f"  ❌ ISP information error")
         
@@ -0,0 +1,112 @@
+"""
+Country/ASN filter pushdown against a GeoLite2-City database.
+"""
+import glob
+import ipaddress
+import types
+
+import geoip2.database
+import geoip2.errors
+import pytest
+
+import TorrentMonitor as tm
+
+# Country, ISO code and network per address block of the fake databases
+BLOCKS = {
+    '81.32.0.0/16': ('Spain', 'ES'),
+    '85.240.0.0/16': ('Portugal', 'PT'),
+    '8.8.8.0/24': ('United States', 'US'),
+}
+ASNS = {'81.32.0.0/16': (3352, 'Telefonica'), '85.240.0.0/16': (2860, 'NOS'), '8.8.8.0/24': (15169, 'Google')}
+
+
+class FakeReader:
+    """
+    Stands in for geoip2.database.Reader, including its refusal to run country() on a
+    City database, as geoip2 5.x does.
+    """
+    calls = []
+
+    def __init__(self, path, mode=None):
+        self.kind = 'City' if 'City' in path else 'ASN'
+
+    def metadata(self):
+        return types.SimpleNamespace(database_type=f'GeoLite2-{self.kind}', build_epoch=1758844800)
+
+    def _block(self, address):
+        address = ipaddress.ip_address(address)
+        for network in BLOCKS:
+            if address in ipaddress.ip_network(network):
+                return network
+        raise geoip2.errors.AddressNotFoundError(f"{address} not found")
+
+    def country(self, address):
+        if self.kind == 'City':
+            raise TypeError(f"The country method cannot be used with the GeoLite2-{self.kind} database")
+        raise AssertionError("not reached")
+
+    def city(self, address):
+        if self.kind != 'City':
+            raise TypeError(f"The city method cannot be used with the GeoLite2-{self.kind} database")
+        network = self._block(address)
+        self.calls.append(('city', str(address)))
+        name, iso_code = BLOCKS[network]
+        return types.SimpleNamespace(country=types.SimpleNamespace(name=name, iso_code=iso_code),
+                                     city=types.SimpleNamespace(name=''), subdivisions=[],
+                                     traits=types.SimpleNamespace(network=ipaddress.ip_network(network)))
+
+    def asn(self, address):
+        network = self._block(address)
+        self.calls.append(('asn', str(address)))
+        number, organization = ASNS[network]
+        return types.SimpleNamespace(autonomous_system_number=number, autonomous_system_organization=organization,
+                                     network=ipaddress.ip_network(network))
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def enricher(monkeypatch):
+    monkeypatch.setattr(geoip2.database, 'Reader', FakeReader)
+    FakeReader.calls = []
+    enricher = tm.GeoEnricher('GeoLite2-City.mmdb', 'GeoLite2-ASN.mmdb')
+    FakeReader.calls = []
+    yield enricher
+    enricher.close()
+
+
+def test_country_filter_on_city_database(enricher):
+    geo_filter = tm.GeoFilter.parse('Spain,PT')
+    assert geo_filter.matches(enricher, '81.32.10.1')
+    assert geo_filter.matches(enricher, '85.240.1.1')
+    assert not geo_filter.matches(enricher, '8.8.8.8')
+
+
+def test_country_filter_caches_by_network(enricher):
+    geo_filter = tm.GeoFilter.parse('ES')
+    assert geo_filter.matches(enricher, '81.32.10.1')
+    assert geo_filter.matches(enricher, '81.32.200.7')
+    assert FakeReader.calls == [('city', '81.32.10.1')]
+    # A kept peer is then enriched from the block already cached by the filter
+    record = enricher.lookup('81.32.200.7')
+    assert (record.country, record.country_iso) == ('Spain', 'ES')
+    assert FakeReader.calls == [('city', '81.32.10.1'), ('asn', '81.32.200.7')]
+
+
+def test_asn_filter(enricher):
+    geo_filter = tm.GeoFilter.parse('AS2860')
+    assert geo_filter.matches(enricher, '85.240.1.1')
+    assert not geo_filter.matches(enricher, '81.32.10.1')
+    assert not geo_filter.matches(enricher, 'not an ip')
+
+
+@pytest.mark.skipif(not glob.glob(f'{tm.DB_DIR}/{tm.CITY_EDITION}*/*.mmdb'),
+                    reason="no GeoLite2 databases in dbs/")
+def test_country_filter_on_real_city_database():
+    enricher = tm.GeoEnricher()
+    try:
+        assert tm.GeoFilter.parse('US').matches(enricher, '8.8.8.8')
+        assert not tm.GeoFilter.parse('Spain').matches(enricher, '8.8.8.8')
+    finally:
+        enricher.close()
@@ -0,0 +1,102 @@
+"""
+IP range parsing and the merged blocklist/allowlist filter.
+"""
+import ipaddress
+import os
+
+import pytest
+
+import TorrentMonitor as tm
+
+
+def v4(text):
+    return int(ipaddress.IPv4Address(text))
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('1.2.3.0/24', (4, v4('1.2.3.0'), v4('1.2.3.255'))),
+    ('1.2.3.4', (4, v4('1.2.3.4'), v4('1.2.3.4'))),
+    ('1.2.3.7/24', (4, v4('1.2.3.0'), v4('1.2.3.255'))),
+    ('1.2.3.4 - 1.2.4.10', (4, v4('1.2.3.4'), v4('1.2.4.10'))),
+    ('Some ISP:1.2.3.4-1.2.3.8', (4, v4('1.2.3.4'), v4('1.2.3.8'))),
+    ('Bad: range - name:5.6.7.8-5.6.7.9', (4, v4('5.6.7.8'), v4('5.6.7.9'))),
+    ('2001:db8::/32', (6, int(ipaddress.IPv6Address('2001:db8::')),
+                       int(ipaddress.IPv6Address('2001:db8:ffff:ffff:ffff:ffff:ffff:ffff')))),
+    ('2001:db8::1-2001:db8::5', (6, int(ipaddress.IPv6Address('2001:db8::1')),
+                                 int(ipaddress.IPv6Address('2001:db8::5')))),
+])
+def test_parse_ip_range(text, expected):
+    assert tm.parse_ip_range(text) == expected
+
+
+@pytest.mark.parametrize('text', ['1.2.3.9-1.2.3.4', '1.2.3.4-2001:db8::1', 'not an address', '1.2.3.4/33'])
+def test_parse_ip_range_rejects(text):
+    with pytest.raises(ValueError):
+        tm.parse_ip_range(text)
+
+
+def test_merge_ranges():
+    assert tm.merge_ranges([]) == []
+    assert tm.merge_ranges([(10, 20), (0, 5), (21, 25), (3, 8), (30, 40), (32, 35)]) == [(0, 8), (10, 25), (30, 40)]
+
+
+def test_subtract_ranges():
+    ranges = [(0, 100), (200, 300)]
+    assert tm.subtract_ranges(ranges, []) == ranges
+    assert tm.subtract_ranges(ranges, [(10, 20), (50, 60)]) == [(0, 9), (21, 49), (61, 100), (200, 300)]
+    # Holes over range edges, across two ranges, and covering a whole range
+    assert tm.subtract_ranges(ranges, [(0, 10), (90, 210)]) == [(11, 89), (211, 300)]
+    assert tm.subtract_ranges(ranges, [(150, 400)]) == [(0, 100)]
+    assert tm.subtract_ranges(ranges, [(-5, 500)]) == []
+
+
+@pytest.fixture
+def lists(tmp_path):
+    blocklist = tmp_path / 'block.txt'
+    blocklist.write_text("# PeerGuardian and CIDR entries\n"
+                         "Bad Corp:5.5.0.0-5.5.255.255\n"
+                         "6.6.6.0/24  # trailing comment\n"
+                         "\n"
+                         "garbage line\n"
+                         "2001:db8::/32\n")
+    allowlist = tmp_path / 'allow.txt'
+    allowlist.write_text("5.5.5.5\n192.168.1.0/24\n")
+    return str(blocklist), str(allowlist)
+
+
+def test_filter_lists(lists):
+    blocklist, allowlist = lists
+    ip_filter = tm.IPFilterList([blocklist], [allowlist])
+    assert '5.5.0.1' in ip_filter
+    assert '5.5.5.5' not in ip_filter
+    assert '6.6.6.200' in ip_filter
+    assert '6.6.7.1' not in ip_filter
+    assert '2001:db8::42' in ip_filter
+    # Built-in private ranges, minus the allowed LAN
+    assert '10.1.2.3' in ip_filter
+    assert '192.168.2.1' in ip_filter
+    assert '192.168.1.20' not in ip_filter
+    assert '8.8.8.8' not in ip_filter
+    assert 'not an ip' not in ip_filter
+    tables, ignored = ip_filter.compile()
+    assert ignored == 1
+
+    session_filter = ip_filter.session_filter()
+    assert session_filter.access('5.5.0.1') == 1
+    assert session_filter.access('5.5.5.5') == 0
+
+
+def test_filter_reload(lists):
+    blocklist, allowlist = lists
+    ip_filter = tm.IPFilterList([blocklist])
+    assert not ip_filter.maybe_reload()
+    with open(blocklist, 'a') as f:
+        f.write("8.8.8.0/24\n")
+    stat = os.stat(blocklist)
+    os.utime(blocklist, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert ip_filter.maybe_reload()
+    assert '8.8.8.8' in ip_filter
+    # A list that disappears keeps the previous filter
+    os.remove(blocklist)
+    assert not ip_filter.maybe_reload()
+    assert '8.8.8.8' in ip_filter
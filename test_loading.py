@@ -0,0 +1,119 @@
+"""
+Bulk torrent loading: bounded adds in flight, duplicate infohashes, all-or-nothing sessions.
+"""
+import asyncio
+import logging
+import types
+
+import pytest
+
+import TorrentMonitor as tm
+
+FILES = [f'{i:02d}.torrent' for i in range(10)] + ['copy-of-03.torrent', 'broken.torrent']
+
+
+class FakeTorrentInfo:
+    def __init__(self, path):
+        if 'broken' in path:
+            raise RuntimeError("bdecode error")
+        self.number = path[-10:-8]
+
+    def info_hash(self):
+        return self.number * 20
+
+
+class Error:
+    def __init__(self, value):
+        self._value = value
+
+    def value(self):
+        return self._value
+
+    def message(self):
+        return "rejected"
+
+
+class FakeHandle:
+    def __init__(self, infohash):
+        self.infohash = infohash
+
+    def is_valid(self):
+        return True
+
+    def info_hash(self):
+        return self.infohash
+
+
+class FakeSession:
+    """
+    Answers async_add_torrent with an add_torrent alert on the next pop_alerts().
+    """
+    def __init__(self, tracker, rejects=()):
+        self.tracker = tracker
+        self.rejects = rejects
+        self.alerts = []
+        self.removed = []
+        self.in_flight = []
+
+    def async_add_torrent(self, atp):
+        self.in_flight.append(len(self.tracker.pending_adds))
+        infohash = atp.ti.info_hash()
+        self.alerts.append(types.SimpleNamespace(what=lambda: 'add_torrent', handle=FakeHandle(infohash),
+                                                 params=atp, error=Error(int(infohash in self.rejects))))
+
+    def pop_alerts(self):
+        alerts, self.alerts = self.alerts, []
+        return alerts
+
+    def remove_torrent(self, handle):
+        self.removed.append(handle.info_hash())
+
+
+@pytest.fixture
+def tracker(monkeypatch):
+    monkeypatch.setattr(tm, 'LOAD_BATCH', 3)
+    # load_torrents() only needs these attributes of a TorrentTracker
+    tracker = tm.TorrentTracker.__new__(tm.TorrentTracker)
+    tracker.logger = logging.getLogger('test_loading')
+    tracker.torrent_folder = 'torrents'
+    tracker.sessions = [FakeSession(tracker), FakeSession(tracker, rejects={'05' * 20})]
+    tracker.stores = [types.SimpleNamespace(handle_alert=lambda alert: None)] * 2
+    tracker.own_ips = types.SimpleNamespace(handle_alert=lambda alert: None)
+    tracker.pending_adds = {}
+    tracker.loaded = set()
+    tracker.handles = []
+    tracker.sources = []
+    tracker.load_failed = 0
+    tracker.spool = None
+    tracker.discovery = None
+    tracker.collectors = None
+
+    def prepare_torrent(path):
+        ti = FakeTorrentInfo(path)
+        return ti, None, [types.SimpleNamespace(ti=ti) for _ in tracker.sessions]
+
+    tracker.prepare_torrent = prepare_torrent
+    return tracker
+
+
+def test_load_caps_adds_in_flight_and_skips_duplicates(tracker, caplog):
+    with caplog.at_level(logging.WARNING, logger='test_loading'):
+        asyncio.run(tracker.load_torrents(FILES))
+    assert tracker.pending_adds == {}
+    # Never more than LOAD_BATCH torrents waiting for their add_torrent alerts
+    assert max(tracker.sessions[0].in_flight) == tm.LOAD_BATCH
+    # The copy, the broken file and the torrent one session rejected
+    assert tracker.load_failed == 3
+    assert 'already tracked' in caplog.text
+    assert sum(source in tracker.sources for source in ('03.torrent', 'copy-of-03.torrent')) == 1
+    assert len(tracker.handles) == len(tracker.sources) == 9
+    assert all(isinstance(handle, tm.HandleGroup) for handle in tracker.handles)
+    assert sorted(tracker.loaded) == sorted(f'{i:02d}' * 20 for i in range(10) if i != 5)
+
+
+def test_torrent_rejected_by_one_session_is_removed_from_the_others(tracker):
+    asyncio.run(tracker.load_torrents(['05.torrent']))
+    assert tracker.handles == []
+    assert tracker.sessions[0].removed == ['05' * 20]
+    assert tracker.sessions[1].removed == []
+    assert tracker.load_failed == 1
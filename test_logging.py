@@ -0,0 +1,71 @@
+"""
+Logging: the JSON-lines queue, and enrichment workers forked around it.
+"""
+import json
+import logging
+import multiprocessing
+
+import pytest
+
+import TorrentMonitor as tm
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger('TorrentTracker')
+    handlers, level = list(logger.handlers), logger.level
+    logger.setLevel(logging.INFO)
+    yield logger
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        if isinstance(handler, tm.LogQueueHandler) and handler.listener._thread is not None:
+            handler.listener.stop()
+    for handler in handlers:
+        logger.addHandler(handler)
+    logger.setLevel(level)
+
+
+def worker_handlers():
+    return [type(handler).__name__ for handler in logging.getLogger('TorrentTracker').handlers]
+
+
+def read_messages(path):
+    return [json.loads(line)['message'] for line in path.read_text().splitlines()]
+
+
+def test_records_queued_until_listener_starts(logger, tmp_path):
+    path = tmp_path / 'log.jsonl'
+    handler = tm.configure_logging(logger, str(path), start=False)
+    logger.info("before the listener")
+    assert not path.read_text()
+    handler.listener.start()
+    logger.info("after the listener")
+    handler.listener.stop()
+    assert read_messages(path) == ["before the listener", "after the listener"]
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_workers_do_not_log_into_the_parent_queue(logger, tmp_path, monkeypatch):
+    monkeypatch.setattr(tm, 'GeoEnricher', lambda *args, **kwargs: None)
+    handler = tm.configure_logging(logger, str(tmp_path / 'log.jsonl'))
+    # A worker forked while the listener runs, as a replacement worker would be
+    with multiprocessing.get_context('fork').Pool(1, tm._init_enrichment_worker, ('city', 'asn')) as pool:
+        assert pool.apply(worker_handlers) == ['StreamHandler']
+    assert logger.handlers == [handler]
+
+
+def test_poll_summary_is_one_line_per_interval(caplog):
+    logger = logging.getLogger('test_poll_summary')
+    summary = tm.PollSummary(logger, interval=3600)
+    for i in range(500):
+        summary.add(f'{i % 250:040x}', 2, 1 if i % 100 == 0 else 0, 3, 1)
+    with caplog.at_level(logging.INFO, logger='test_poll_summary'):
+        summary.flush()
+        assert caplog.records == []
+        summary.flush(force=True)
+        summary.flush(force=True)
+    (record,) = caplog.records
+    assert record.event == 'poll_summary'
+    assert (record.polls, record.torrents, record.updated, record.completed, record.unchanged, record.gone) == (
+        500, 250, 1000, 5, 1500, 500)
+    assert record.getMessage().startswith("1000 peers updated in 500 polls of 250 torrents")
@@ -0,0 +1,72 @@
+"""
+Parquet export layout: date partitions only, compacted into one file per day.
+"""
+import csv
+import glob
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+ds = pytest.importorskip('pyarrow.dataset')
+
+import TorrentMonitor as tm
+
+
+def row(day, infohash):
+    values = dict.fromkeys(tm.PEER_FIELDS, '')
+    values.update(ip='1.1.1.1', port=6881, infohash=infohash, first_seen=f'{day} 09:00:00 UTC',
+                  last_seen=f'{day} 10:00:00 UTC', num_pieces=8)
+    return [values[field] for field in tm.PEER_FIELDS]
+
+
+def parts(directory):
+    return sorted(os.path.relpath(path, directory).split(os.sep)[0] for path in glob.glob(f'{directory}/*/*'))
+
+
+def test_flushes_partition_by_date_and_compact(tmp_path):
+    # Days not over yet, so nothing is compacted before close()
+    today = datetime.now(timezone.utc)
+    days = [(today + timedelta(days=n)).strftime('%Y-%m-%d') for n in (0, 1)]
+    sink = tm.ParquetSink(str(tmp_path), flush_rows=4)
+    for i in range(12):
+        sink.append(row(days[i % 2], f'{i % 3:02d}' * 20))
+    sink.flush()
+    # Three flushes, each writing one file per date holding several torrents
+    assert parts(tmp_path) == [f'date={days[0]}'] * 3 + [f'date={days[1]}'] * 3
+    sink.close(compact=True)
+    assert parts(tmp_path) == [f'date={days[0]}', f'date={days[1]}']
+
+    table = ds.dataset(str(tmp_path), partitioning='hive').to_table()
+    assert table.num_rows == 12
+    assert sorted(set(table.column('infohash').to_pylist())) == ['00' * 20, '01' * 20, '02' * 20]
+    assert [path for path in glob.glob(f'{tmp_path}/*/*') if path.endswith('.tmp')] == []
+
+
+def test_rows_sorted_by_infohash_within_a_file(tmp_path):
+    sink = tm.ParquetSink(str(tmp_path))
+    for infohash in ('cc', 'aa', 'bb', 'aa'):
+        sink.append(row('2026-10-18', infohash * 20))
+    sink.close()
+    (path,) = glob.glob(f'{tmp_path}/date=2026-10-18/*.parquet')
+    infohashes = tm.pq.read_table(path).column('infohash').to_pylist()
+    assert infohashes == sorted(infohashes)
+
+
+def test_convert_csv_without_geo_databases(tmp_path):
+    source = tmp_path / 'peers.csv'
+    with open(source, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(tm.PEER_FIELDS)
+        writer.writerows(row('2026-10-17', infohash * 20) for infohash in ('aa', 'bb', 'aa'))
+    # Run from a folder with no dbs/: the export must not build a tracker
+    script = os.path.join(os.path.dirname(os.path.abspath(tm.__file__)), 'TorrentMonitor.py')
+    result = subprocess.run([sys.executable, script, '--convert-parquet', str(source), '--parquet', 'out'],
+                            cwd=tmp_path, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert "Exported 3 rows" in result.stderr
+    assert sorted(os.listdir(tmp_path)) == ['out', 'peers.csv']
+    assert parts(tmp_path / 'out') == ['date=2026-10-17']
+    assert ds.dataset(str(tmp_path / 'out'), partitioning='hive').to_table().num_rows == 3
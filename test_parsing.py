@@ -0,0 +1,48 @@
+"""
+Parsing of magnet URIs and network endpoints.
+"""
+import base64
+
+import pytest
+
+import TorrentMonitor as tm
+
+INFOHASH = '0123456789abcdef0123456789abcdef01234567'
+BASE32 = base64.b32encode(bytes.fromhex(INFOHASH)).decode('ascii')
+
+
+def test_magnet_infohash_hex_and_base32():
+    assert tm.magnet_infohash(f'magnet:?xt=urn:btih:{INFOHASH}&dn=name') == INFOHASH
+    assert tm.magnet_infohash(f'magnet:?xt=urn:btih:{INFOHASH.upper()}') == INFOHASH
+    assert tm.magnet_infohash(f'magnet:?dn=name&xt=urn:btih:{BASE32}') == INFOHASH
+    assert tm.magnet_infohash(f'magnet:?xt=urn:btih:{BASE32.lower()}') == INFOHASH
+
+
+@pytest.mark.parametrize('uri', ['magnet:?dn=name', f'magnet:?xt=urn:btih:{INFOHASH[:-1]}', '', 'not a magnet'])
+def test_magnet_infohash_invalid(uri):
+    assert tm.magnet_infohash(uri) is None
+
+
+def test_to_magnet():
+    assert tm.to_magnet(f'  {INFOHASH}\n') == f'magnet:?xt=urn:btih:{INFOHASH}'
+    assert tm.to_magnet(BASE32) == f'magnet:?xt=urn:btih:{BASE32}'
+    assert tm.to_magnet(f'magnet:?xt=urn:btih:{INFOHASH}') == f'magnet:?xt=urn:btih:{INFOHASH}'
+    assert tm.to_magnet('') is None
+    assert tm.to_magnet(f'# {INFOHASH}') is None
+    assert tm.to_magnet('not a hash') is None
+
+
+@pytest.mark.parametrize('address, expected', [
+    ('collector.example:7000', ('collector.example', 7000)),
+    ('10.0.0.5:7000', ('10.0.0.5', 7000)),
+    (':7000', ('127.0.0.1', 7000)),
+    ('[::1]:7000', ('::1', 7000)),
+    ('unix:/run/tracker.sock', ('unix', '/run/tracker.sock')),
+])
+def test_parse_endpoint(address, expected):
+    assert tm.parse_endpoint(address) == expected
+
+
+def test_parse_endpoint_needs_a_port():
+    with pytest.raises(ValueError):
+        tm.parse_endpoint('collector.example')
@@ -0,0 +1,76 @@
+"""
+Peer progress from piece bitfields: rate baseline and completion detection.
+"""
+import types
+
+import TorrentMonitor as tm
+
+PIECES = 10
+
+
+def peer(have):
+    pieces = [i < have for i in range(PIECES)]
+    return types.SimpleNamespace(num_pieces=have, pieces=pieces)
+
+
+def no_bitfield():
+    # libtorrent reports no pieces until the peer's bitfield arrives
+    return types.SimpleNamespace(num_pieces=0, pieces=[])
+
+
+def test_pack_pieces():
+    assert tm.pack_pieces([]) == 0
+    assert tm.pack_pieces([True, False, True]) == 0b101
+    assert tm.pack_pieces(0b110) == 0b110
+    assert tm.popcount(tm.pack_pieces(peer(7).pieces)) == 7
+
+
+def test_late_bitfield_starts_the_baseline():
+    tracker = tm.PieceTracker(PIECES)
+    entry = tracker.update('peer', no_bitfield(), 100)
+    assert entry.first_time is None
+    assert tracker.rate(entry) == 0
+    # Bitfield of a peer that already had 6 pieces when it connected
+    entry = tracker.update('peer', peer(6), 110)
+    assert (entry.first_time, entry.first_count) == (110, 6)
+    assert tracker.rate(entry) == 0
+    entry = tracker.update('peer', peer(8), 130)
+    assert tracker.rate(entry) == 2 / 20
+    assert tracker.state(entry, 130) == 'downloading'
+
+
+def test_seed_is_never_seen_completing():
+    tracker = tm.PieceTracker(PIECES)
+    tracker.update('seed', no_bitfield(), 100)
+    entry = tracker.update('seed', peer(PIECES), 110)
+    assert tracker.state(entry, 110) == 'completed'
+    assert entry.completed_at is None
+    assert tracker.rate(entry) == 0
+    # Also when the bitfield is already there on the first poll
+    entry = tracker.update('other seed', peer(PIECES), 100)
+    assert entry.completed_at is None
+
+
+def test_leecher_completion_and_rate():
+    tracker = tm.PieceTracker(PIECES)
+    entry = tracker.update('leecher', peer(2), 100)
+    assert (entry.first_time, entry.first_count) == (100, 2)
+    entry = tracker.update('leecher', peer(6), 140)
+    assert tracker.rate(entry) == 4 / 40
+    entry = tracker.update('leecher', peer(PIECES), 180)
+    assert entry.completed_at == 180
+    assert tracker.state(entry, 180) == 'completed'
+    entry = tracker.update('leecher', peer(PIECES), 240)
+    assert entry.completed_at == 180
+
+
+def test_stalled_peer_and_reconnect():
+    tracker = tm.PieceTracker(PIECES, stall=60)
+    entry = tracker.update('peer', peer(5), 100)
+    entry = tracker.update('peer', peer(5), 200)
+    assert tracker.state(entry, 200) == 'stopped'
+    # Fewer pieces: a new connection, measured from scratch
+    entry = tracker.update('peer', peer(3), 210)
+    assert (entry.first_time, entry.first_count, entry.count) == (210, 3, 3)
+    tracker.retain(set())
+    assert tracker.peers == {}
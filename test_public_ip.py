@@ -0,0 +1,88 @@
+"""
+Own-address discovery: endpoint fallback with timeouts, and the public_ip.json cache.
+"""
+import json
+import logging
+import types
+
+import pytest
+import requests
+
+import TorrentMonitor as tm
+
+ENDPOINTS = ['https://slow.example', 'https://broken.example', 'https://ok.example']
+
+
+class FakeEndpoints:
+    """
+    requests.get stand-in answering by URL; exceptions are raised, text is returned with a 200.
+    """
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+
+    def __call__(self, url, timeout=None):
+        self.calls.append((url, timeout))
+        answer = self.answers[url]
+        if isinstance(answer, Exception):
+            raise answer
+        if isinstance(answer, int):
+            return types.SimpleNamespace(status_code=answer, text='')
+        return types.SimpleNamespace(status_code=200, text=answer)
+
+
+@pytest.fixture
+def resolver(tmp_path, monkeypatch):
+    def make(answers):
+        monkeypatch.setattr(tm.requests, 'get', FakeEndpoints(answers))
+        resolver = tm.PublicIPResolver(ENDPOINTS, str(tmp_path / 'public_ip.json'), timeout=2,
+                                       logger=logging.getLogger('test_public_ip'))
+        monkeypatch.setattr(resolver, '_local_addresses', lambda: {'192.168.1.10'})
+        return resolver
+    return make
+
+
+def test_failing_endpoints_fall_through(resolver, tmp_path):
+    resolver = resolver({'https://slow.example': requests.Timeout('read timed out'),
+                         'https://broken.example': 503,
+                         'https://ok.example': '203.0.113.7\n'})
+    assert resolver.refresh() == {'203.0.113.7'}
+    assert tm.requests.get.calls == [(url, 2) for url in ENDPOINTS]
+    assert '203.0.113.7' in resolver and '192.168.1.10' in resolver
+    cached = json.loads((tmp_path / 'public_ip.json').read_text())
+    assert cached['addresses'] == ['203.0.113.7']
+
+
+def test_cache_until_an_endpoint_answers(resolver):
+    resolver({'https://slow.example': '203.0.113.7', 'https://broken.example': 503,
+              'https://ok.example': 503}).refresh()
+    # Next start with every endpoint down: the cached address is known right away and kept
+    down = resolver(dict.fromkeys(ENDPOINTS, requests.ConnectionError('unreachable')))
+    down.refresh_interval = 3600
+    down.start()
+    assert '203.0.113.7' in down
+    down.stop()
+    down._thread.join(5)
+    assert '203.0.113.7' in down
+    # A fresh answer replaces the cached address
+    moved = resolver({'https://slow.example': '198.51.100.2', 'https://broken.example': 503,
+                      'https://ok.example': 503})
+    moved._load_cache()
+    moved.refresh()
+    assert '198.51.100.2' in moved and '203.0.113.7' not in moved
+
+
+def test_no_address_at_all_is_a_warning(resolver, caplog):
+    resolver = resolver(dict.fromkeys(ENDPOINTS, requests.Timeout('read timed out')))
+    resolver._local_addresses = set
+    with caplog.at_level(logging.WARNING, logger='test_public_ip'):
+        assert resolver.refresh() == set()
+    assert 'Unable to obtain public IP' in caplog.text
+    assert resolver.addresses == frozenset()
+
+
+def test_addresses_from_alerts_are_normalized(resolver):
+    resolver = resolver({})
+    resolver.handle_alert(types.SimpleNamespace(what=lambda: 'external_ip', external_address='::ffff:203.0.113.9'))
+    resolver.handle_alert(types.SimpleNamespace(what=lambda: 'listen_succeeded', address='0.0.0.0'))
+    assert resolver.addresses == frozenset({'203.0.113.9'})
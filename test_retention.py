@@ -0,0 +1,54 @@
+"""
+Retention job: batches against a migrated report_table, and no online ALTER.
+"""
+import csv
+import glob
+import gzip
+
+import pytest
+
+import TorrentMonitor as tm
+
+
+def row(id, ip, last_seen, pieces, state, completed_at=None):
+    values = dict.fromkeys(tm.PEER_FIELDS)
+    values.update(id=id, ip=ip, port=6881, infohash='aa' * 20, client='qBittorrent', country='Spain', isp='ISP',
+                  num_pieces=10, first_seen=f'{last_seen[:10]} 00:00:00 UTC', last_seen=f'{last_seen} UTC',
+                  downloaded_pieces=pieces, state=state, completed_at=completed_at)
+    return values
+
+
+def test_unmigrated_table_is_left_alone(database):
+    database.rows = [row(1, '1.1.1.1', '2020-01-01 10:00:00', 1, 'downloading')]
+    database.migrated = False
+    job = tm.RetentionJob(database.connect, 30)
+    with pytest.raises(RuntimeError, match='report migrate'):
+        job.run_once()
+    assert 'ALTER' not in database.statements
+    assert job._conn is None
+    assert len(database.rows) == 1
+
+
+def test_batches_archive_downsample_and_delete(database, tmp_path):
+    database.rows = [row(1, '1.1.1.1', '2020-01-01 01:00:00', 2, 'downloading'),
+                     row(2, '1.1.1.1', '2020-01-01 03:00:00', 10, 'completed', '2020-01-01 02:30:00 UTC'),
+                     row(3, '2.2.2.2', '2020-01-02 05:00:00', 1, 'stopped'),
+                     row(4, '1.1.1.1', '2099-01-01 05:00:00', 1, 'downloading')]
+    job = tm.RetentionJob(database.connect, 30, str(tmp_path), batch_rows=2, pause=0)
+    assert job.run_once() == 3
+    assert [row['id'] for row in database.rows] == [4]
+    assert 'ALTER' not in database.statements
+    assert database.statements.count('SHOW') == 2
+
+    sessions = {(session[0], session[2]): dict(zip(tm.DAILY_SESSION_FIELDS, session))
+                for session in database.table('daily_session_table')}
+    session = sessions[('2020-01-01', '1.1.1.1')]
+    assert (session['observations'], session['max_downloaded_pieces'], session['state']) == (2, 10, 'completed')
+    assert session['completed_at'] == '2020-01-01 02:30:00 UTC'
+
+    archived = {}
+    for path in glob.glob(f'{tmp_path}/date=*/*.csv.gz'):
+        with gzip.open(path, 'rt', newline='') as f:
+            archived.setdefault(path.split('/')[-2], []).extend(list(csv.reader(f))[1:])
+    assert sorted(archived) == ['date=2020-01-01', 'date=2020-01-02']
+    assert len(archived['date=2020-01-01']) == 2
@@ -0,0 +1,69 @@
+"""
+Session profile reloads: changed, removed, invalid and unknown settings.
+"""
+import json
+import logging
+import os
+
+import libtorrent as lt
+import pytest
+
+import TorrentMonitor as tm
+
+
+@pytest.fixture
+def profile_file(tmp_path):
+    path = tmp_path / 'profile.json'
+    written = [0]
+
+    def write(content):
+        path.write_text(content if isinstance(content, str) else json.dumps(content))
+        # Distinct mtimes even within the filesystem's timestamp resolution
+        written[0] += 1
+        os.utime(path, ns=(written[0] * 10 ** 9, written[0] * 10 ** 9))
+        return str(path)
+
+    return write
+
+
+def test_changed_settings_only(profile_file):
+    profile = tm.SessionProfile(profile_file({'settings': {'connections_limit': 3000}}))
+    assert profile.settings['connections_limit'] == 3000
+    assert profile.maybe_reload() == {}
+    profile_file({'settings': {'connections_limit': 2000}})
+    assert profile.maybe_reload() == {'connections_limit': 2000}
+
+
+def test_removed_settings_go_back_to_defaults(profile_file):
+    defaults = lt.default_settings()
+    profile = tm.SessionProfile(profile_file({'settings': {'active_downloads': 10}}))
+    profile_file({'preset': 'low-memory'})
+    changed = profile.maybe_reload()
+    assert changed['active_downloads'] == defaults['active_downloads']
+    # Also settings only the previous preset had
+    assert changed['auto_scrape_interval'] == defaults['auto_scrape_interval']
+    assert changed['connections_limit'] == tm.SESSION_PRESETS['low-memory']['connections_limit']
+    assert 'active_downloads' not in profile.settings
+
+
+@pytest.mark.parametrize('content, error', [
+    ('{"settings": {"connections_limit": ', 'Invalid session profile'),
+    ({'settings': {'no_such_setting': 1}}, 'unknown libtorrent settings no_such_setting'),
+    ({'preset': 'no-such-preset'}, 'unknown preset'),
+])
+def test_broken_profile_keeps_previous_settings(profile_file, caplog, content, error):
+    profile = tm.SessionProfile(profile_file({'settings': {'connections_limit': 3000}}))
+    settings = dict(profile.settings)
+    profile_file(content)
+    with caplog.at_level(logging.ERROR, logger='TorrentTracker'):
+        assert profile.maybe_reload() == {}
+    assert error in caplog.text
+    assert profile.settings == settings
+    # Fixing the file applies only what differs from the kept settings
+    profile_file({'settings': {'connections_limit': 3000, 'active_downloads': 10}})
+    assert profile.maybe_reload() == {'active_downloads': 10}
+
+
+def test_unusable_profile_at_startup(profile_file):
+    with pytest.raises(ValueError, match='Unusable session profile'):
+        tm.SessionProfile(profile_file({'settings': {'no_such_setting': 1}}))
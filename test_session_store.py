@@ -0,0 +1,66 @@
+"""
+Resume data saving: only changed torrents, written off the calling thread.
+"""
+import os
+import threading
+import time
+
+import libtorrent as lt
+import pytest
+
+import TorrentMonitor as tm
+
+
+@pytest.fixture
+def torrent(tmp_path):
+    data = tmp_path / 'data'
+    data.mkdir()
+    (data / 'file.bin').write_bytes(os.urandom(64 * 1024))
+    files = lt.file_storage()
+    lt.add_files(files, str(data))
+    creator = lt.create_torrent(files)
+    lt.set_piece_hashes(creator, str(tmp_path))
+    return lt.torrent_info(lt.bencode(creator.generate()))
+
+
+def save(session, store, handle):
+    store.request_resume_data([handle])
+    requested = store.outstanding
+    deadline = time.time() + 5
+    while store.outstanding and time.time() < deadline:
+        session.wait_for_alert(100)
+        for alert in session.pop_alerts():
+            store.handle_alert(alert)
+    store.flush()
+    return requested
+
+
+def test_only_changed_torrents_are_saved(tmp_path, torrent, monkeypatch):
+    writes = []
+    write_file_atomic = tm.write_file_atomic
+
+    def record_write(path, data):
+        writes.append((os.path.basename(path), threading.current_thread().name))
+        write_file_atomic(path, data)
+
+    monkeypatch.setattr(tm, 'write_file_atomic', record_write)
+    session = lt.session({'enable_dht': False, 'enable_lsd': False, 'listen_interfaces': '127.0.0.1:0'})
+    store = tm.SessionStore(str(tmp_path / 'state'))
+    handle = session.add_torrent(store.torrent_params(torrent, str(tmp_path / 'downloads')))
+    try:
+        assert save(session, store, handle) == 1
+        assert os.path.exists(store.resume_path(handle.info_hash()))
+        assert writes == [(f'{handle.info_hash()}.resume', 'StateWriter_0')]
+
+        # Nothing changed since the last save
+        assert save(session, store, handle) == 0
+        handle.pause()
+        time.sleep(0.5)
+        assert save(session, store, handle) == 1
+
+        store.save_session(session)
+        store.flush()
+        assert writes[-1] == ('session.state', 'StateWriter_0')
+        assert store.torrent_params(torrent, 'downloads').ti is not None
+    finally:
+        store.close()
@@ -6,6 +6,8 @@ Simple test to verify only geolocation functionalities.
 import geoip2.database
 import os
 
+from TorrentMonitor import GeoEnricher
+
 def test_geolocation_only():
     """Test only geolocation functionalities."""
     print("🚀 Testing geolocation functionalities...")
@@ -71,71 +73,37 @@ def test_geolocation_only():
     return True
 
 def test_updated_functions():
-    """Test updated TorrentMonitor functions."""
-    print("\n🔍 Testing updated functions...")
-    
-    # Simulate get_geo_info and get_isp_info functions
-    def get_geo_info(ip):
-        try:
-            reader = geoip2.database.Reader('dbs/GeoLite2-City_20250926/GeoLite2-City.mmdb')
-            response = reader.city(ip)
-            reader.close()
-            
-            return {
-                'country': {
-                    'names': {'en': response.country.name},
-                    'iso_code': response.country.iso_code
-                },
-                'city': {
-                    'names': {'en': response.city.name}
-                },
-                'subdivisions': [
-                    {
-                        'names': {'en': subdivision.name}
-                    } for subdivision in response.subdivisions
-                ]
-            }
-        except Exception as e:
-            print(f"Geolocation error for {ip}: {e}")
-            return None
+    """Test the GeoEnricher used by TorrentMonitor."""
+    print("\n🔍 Testing GeoEnricher...")
     
-    def get_isp_info(ip):
-        try:
-            reader = geoip2.database.Reader('dbs/GeoLite2-ASN_20250929/GeoLite2-ASN.mmdb')
-            response = reader.asn(ip)
-            reader.close()
-            
-            return {
-                'autonomous_system_organization': response.autonomous_system_organization,
-                'autonomous_system_number': response.autonomous_system_number
-            }
-        except Exception as e:
-            print(f"ISP information error for {ip}: {e}")
-            return 'N/A'
+    try:
+        # The newest dated release of each database in dbs/
+        enricher = GeoEnricher()
+    except Exception as e:
+        print(f"❌ Error opening the Geo databases: {e}")
+        return False
     
-    # Testar as funções
+    # Testar o enricher
     test_ips = ['8.8.8.8', '1.1.1.1', '208.67.222.222']
     
-    for ip in test_ips:
-        print(f"\n📡 Testando IP: {ip}")
-        
-        # Test geolocation
-        geo_info = get_geo_info(ip)
-        if geo_info:
-            country = geo_info.get('country', {}).get('names', {}).get('en', 'N/A')
-            city = geo_info.get('city', {}).get('names', {}).get('en', 'N/A')
-            print(f"  📍 País: {country}, Cidade: {city}")
-        else:
-            print(f"  ❌ Geolocation error")
-        
-        # Testar informação do ISP
-        isp_info = get_isp_info(ip)
-        if isinstance(isp_info, dict):
-            org = isp_info.get('autonomous_system_organization', 'N/A')
-            asn = isp_info.get('autonomous_system_number', 'N/A')
-            print(f"  🏢 ISP: {org} (AS{asn})")
-        else:
-            print(f"  ❌ ISP information error")
+    try:
+        for ip in test_ips:
+            print(f"\n📡 Testando IP: {ip}")
+            geo = enricher.lookup(ip)
+            
+            # Test geolocation
+            if geo.country != 'N/A':
+                print(f"  📍 País: {geo.country}, Cidade: {geo.city}")
+            else:
+                print(f"  ❌ Geolocation error")
+            
+            # Testar informação do ISP
+            if geo.asn is not None:
+                print(f"  🏢 ISP: {geo.isp} (AS{geo.asn})")
+            else:
+                print(f"  ❌ ISP information error")
+    finally:
+        enricher.close()
 
 if __name__ == "__main__":
     print("=" * 60)
@@ -0,0 +1,74 @@
+"""
+Distinct-peer sketches: HyperLogLog counting and merging, bucketing by observation time.
+"""
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+import TorrentMonitor as tm
+
+
+def sketch(values, p=12):
+    hll = tm.HyperLogLog(p)
+    for value in values:
+        hll.add(value)
+    return hll
+
+
+def test_hll_counts_within_error():
+    assert tm.HyperLogLog().count() == 0
+    assert sketch(['1.1.1.1:1'] * 100).count() == 1
+    # Small counts use linear counting: off by a register collision at most here
+    assert abs(sketch(f'10.0.{i // 256}.{i % 256}:6881' for i in range(50)).count() - 50) <= 1
+    hll = sketch(f'peer-{i}' for i in range(100000))
+    assert abs(hll.count() - 100000) <= 3 * hll.error * 100000
+
+
+def test_hll_merge_is_the_union():
+    a = sketch(f'peer-{i}' for i in range(0, 30000))
+    b = sketch(f'peer-{i}' for i in range(20000, 50000))
+    union = sketch(f'peer-{i}' for i in range(50000))
+    assert a.merge(b).registers == union.registers
+    with pytest.raises(ValueError):
+        a.merge(tm.HyperLogLog(10))
+
+
+def test_hll_registers_round_trip():
+    hll = sketch(f'peer-{i}' for i in range(1000))
+    assert tm.HyperLogLog(12, bytes(hll.registers)).count() == hll.count()
+
+
+def timestamp(text):
+    return tm.parse_time(text).timestamp()
+
+
+def test_add_buckets_by_observation_time(tmp_path):
+    store = tm.SketchStore(str(tmp_path))
+    store.add('aa' * 20, 'Spain', '1.1.1.1:1', timestamp('2026-10-18 09:59:59 UTC'))
+    store.add('aa' * 20, 'Spain', '2.2.2.2:1', timestamp('2026-10-18 10:00:00 UTC'))
+    store.add('aa' * 20, 'Spain', '3.3.3.3:1', timestamp('2026-10-18 10:30:00 UTC'))
+    store.flush()
+    assert sorted(os.listdir(tmp_path)) == ['20261018T0900.hll', '20261018T1000.hll']
+    counts = tm.SketchStore.query([str(tmp_path)], by=('hour',))
+    assert {hour: sketch.count() for (hour,), sketch in counts.items()} == {'20261018T0900': 1,
+                                                                             '20261018T1000': 2}
+
+
+def test_late_observations_reopen_closed_buckets(tmp_path):
+    store = tm.SketchStore(str(tmp_path), open_buckets=1)
+    store.add('aa' * 20, 'Spain', '1.1.1.1:1', timestamp('2026-10-18 09:00:00 UTC'))
+    store.add('aa' * 20, 'Spain', '2.2.2.2:1', timestamp('2026-10-18 11:00:00 UTC'))
+    store.flush()
+    assert list(store.buckets) == ['20261018T1100']
+    # A relayed or replayed peer from an earlier hour is merged into that hour's file
+    store.add('aa' * 20, 'Spain', '3.3.3.3:1', timestamp('2026-10-18 09:10:00 UTC'))
+    store.flush()
+    sketches = tm.SketchStore.load(os.path.join(tmp_path, '20261018T0900.hll'))
+    assert sketches[('aa' * 20, 'Spain')].count() == 2
+
+
+def test_add_defaults_to_current_time(tmp_path):
+    store = tm.SketchStore(str(tmp_path))
+    store.add('aa' * 20, 'Spain', '1.1.1.1:1')
+    assert list(store.buckets) == [store.bucket_name(datetime.now(timezone.utc).timestamp())]
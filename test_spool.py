@@ -0,0 +1,103 @@
+"""
+PeerSpool replay across a database outage and rows the database rejects.
+"""
+import json
+import threading
+
+import pymysql
+import pytest
+
+import TorrentMonitor as tm
+
+
+def row(ip):
+    values = dict.fromkeys(tm.PEER_FIELDS, '')
+    values.update(ip=ip, port=6881)
+    return [values[field] for field in tm.PEER_FIELDS]
+
+
+def test_replay_after_outage_and_bad_row(database, tmp_path):
+    spool = tm.PeerSpool(str(tmp_path), database.connect, batch_size=2)
+    database.up = False
+    for ip in ('1.1.1.1', '2.2.2.2', 'bad', '3.3.3.3'):
+        spool.append('report_table', row(ip))
+    spool.append('info_torrent', ('aa' * 20, '{}'))
+    with pytest.raises(pymysql.err.OperationalError):
+        spool.drain()
+    assert spool.pending() == 1
+    assert database.committed == []
+
+    # The process restarts with the segment still on disk
+    spool.stop()
+    assert len(spool.segments()) == 1
+    spool = tm.PeerSpool(str(tmp_path), database.connect, batch_size=2)
+    database.up = True
+    spool.drain()
+    ips = [params[0] for table, params in database.committed if table == 'report_table']
+    assert ips == ['1.1.1.1', '2.2.2.2', '3.3.3.3']
+    assert ('info_torrent', ('aa' * 20, '{}')) in database.committed
+    assert spool.pending() == 0
+
+    quarantined = [json.loads(line) for line in (tmp_path / 'quarantine.jsonl').read_text().splitlines()]
+    assert len(quarantined) == 1
+    assert quarantined[0]['table'] == 'report_table'
+    assert quarantined[0]['params'][0] == 'bad'
+    assert 'Data too long' in quarantined[0]['error']
+    assert quarantined[0]['segment'].startswith('segment-')
+
+    # Later segments are not held back by the quarantined row
+    spool.append('report_table', row('4.4.4.4'))
+    spool.drain()
+    assert database.committed[-1][1][0] == '4.4.4.4'
+    spool.stop()
+    assert spool.segments() == []
+
+
+def test_outage_during_slow_path_keeps_segment(database, tmp_path, monkeypatch):
+    spool = tm.PeerSpool(str(tmp_path), database.connect)
+    spool.append('report_table', row('bad'))
+    spool.append('report_table', row('1.1.1.1'))
+    execute = database.execute
+
+    def execute_then_fail(connection, sql, params):
+        # The server goes away after rejecting the batch
+        if params[0] == '1.1.1.1' and connection.pending == []:
+            database.up = False
+        return execute(connection, sql, params)
+
+    monkeypatch.setattr(database, 'execute', execute_then_fail)
+    with pytest.raises(pymysql.err.OperationalError):
+        spool.drain()
+    monkeypatch.undo()
+    assert spool.pending() == 1
+    assert not (tmp_path / 'quarantine.jsonl').exists()
+    database.up = True
+    spool.drain()
+    assert [params[0] for _, params in database.committed] == ['1.1.1.1']
+    assert len((tmp_path / 'quarantine.jsonl').read_text().splitlines()) == 1
+    spool.stop()
+
+
+def test_stop_leaves_a_busy_drainer_alone(database, tmp_path, monkeypatch):
+    spool = tm.PeerSpool(str(tmp_path), database.connect)
+    for ip in ('1.1.1.1', '2.2.2.2'):
+        spool.append('report_table', row(ip))
+    entered, release = threading.Event(), threading.Event()
+    execute = database.execute
+
+    def slow_execute(connection, sql, params):
+        # Only the drainer thread hangs on the database
+        if threading.current_thread().name == 'PeerSpool':
+            entered.set()
+            release.wait(5)
+        return execute(connection, sql, params)
+
+    monkeypatch.setattr(database, 'execute', slow_execute)
+    spool.start()
+    assert entered.wait(5)
+    spool.stop(timeout=0.1)
+    assert database.committed == []
+    release.set()
+    spool._thread.join(5)
+    assert [params[0] for _, params in database.committed] == ['1.1.1.1', '2.2.2.2']
+    assert spool.segments() == []